@@ -6,4 +6,4 @@ Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
 # init src package
 __all__ = ["tuners", "models", "iomanager", "iomanagerutils", "xmlmanager",
-           "yamlmanager"]
+           "yamlmanager", "search"]
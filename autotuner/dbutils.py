@@ -1,44 +1,195 @@
 # coding=utf-8
 """
 A set of tools to create/interact with the configuration database.
+
+Parameters and features are stored as JSON (schema version 2); databases
+written by older versions, which stored them pickled, are converted when
+they are opened. Several tuning runs may share the database: the rows of
+CurrentCodeRegions belong to the run of the session (schema version 3) and
+writes are retried while another run holds the database lock. Optimal
+configurations are stored per workload tag with the performance measured
+with them (schema version 4), so that a worse run on the same workload
+does not replace them.
 Copyright (C) 2017-2022, Huawei Technologies Co., Ltd. All rights reserved.
 """
 
+from autotuner import profiling
 from autotuner.models import CodeRegion
 from autotuner.models import CodeRegionConfiguration
 from autotuner.models import DebugLoc
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy import text
+from sqlalchemy import type_coerce
 from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
 from sqlalchemy import Boolean
-from sqlalchemy import PickleType
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.types import TypeDecorator
+from datetime import datetime
+import gzip
+import json
 import os
+import pickle
+import random
+import time
 
 # Table declarations for the database
 BASE_TABLE = declarative_base()
 
+# 1: pickled parameters and features, 2: JSON, 3: CurrentCodeRegions per
+# tuning run, 4: OptimalConfigs per workload, with their performance.
+CONFIG_DB_VERSION = 4
+# Header of the files written by export_configs(); the version of the file
+# format is independent of the schema version.
+EXPORT_FORMAT = {"format": "autotuner-configs", "version": 3}
+# Policies of update_optimal_configs() for configurations already stored.
+UPDATE_POLICIES = ["better", "overwrite"]
+# Number of times a write is retried while the database is locked by
+# another tuning run, after waiting for the busy timeout.
+WRITE_RETRIES = 5
+RETRY_DELAY = 0.1
+
+# Pragmas set on the SQLite connections of the autotuner, to configs.db as
+# well as to the OpenTuner results database (autotuner.db); see
+# configure_sqlite_engine(). A writer waits up to busy_timeout milliseconds
+# for the lock of another. In WAL mode a commit appends to the log instead
+# of rewriting the journal and readers do not block the writer;
+# synchronous=NORMAL then only syncs at checkpoints, which cannot corrupt
+# the database (the last commits may be lost on a power failure).
+SQLITE_PRAGMAS = {"busy_timeout": "30000", "journal_mode": "WAL",
+                  "synchronous": "NORMAL"}
+# WAL needs shared memory between the processes using the database, so it
+# does not work on network file systems: databases that cannot be switched
+# to WAL, and all databases with AUTOTUNE_SQLITE_WAL=0, use the rollback
+# journal of SQLite instead.
+SQLITE_WAL_ENV = "AUTOTUNE_SQLITE_WAL"
+SQLITE_FALLBACK_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+def configure_sqlite_engine(engine):
+    """
+    Set SQLITE_PRAGMAS (or SQLITE_FALLBACK_PRAGMAS) on the connections of
+    `engine`, if it is an SQLite engine. The connections already opened are
+    discarded, so that every connection of the engine has the pragmas.
+    """
+    if engine.dialect.name != "sqlite" or \
+            event.contains(engine, "connect", _set_sqlite_pragmas):
+        return
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    engine.dispose()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    pragmas = dict(SQLITE_PRAGMAS)
+    if os.environ.get(SQLITE_WAL_ENV) == "0":
+        pragmas.update(SQLITE_FALLBACK_PRAGMAS)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA busy_timeout={}".format(pragmas["busy_timeout"]))
+    cursor.execute("PRAGMA journal_mode={}".format(pragmas["journal_mode"]))
+    journal_mode = cursor.fetchone()[0]
+    if journal_mode.lower() != pragmas["journal_mode"].lower() and \
+            pragmas["journal_mode"] != SQLITE_FALLBACK_PRAGMAS["journal_mode"]:
+        # E.g. WAL on a network file system.
+        pragmas.update(SQLITE_FALLBACK_PRAGMAS)
+        cursor.execute("PRAGMA journal_mode={}".format(
+            pragmas["journal_mode"]))
+    cursor.execute("PRAGMA synchronous={}".format(pragmas["synchronous"]))
+    cursor.close()
+
+
+def create_missing_indexes(engine, indexes):
+    """
+    Create the `indexes` that do not exist yet. create_all() only creates
+    the indexes of new tables, so databases written by older versions get
+    them here.
+    """
+    for index in indexes:
+        index.create(engine, checkfirst=True)
+
+
+class JSONType(TypeDecorator):
+    """
+    A JSON-compatible value stored as compact JSON. The column type is the
+    one of PickleType, so that existing tables can be converted in place.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return json.dumps(value, separators=(",", ":")).encode()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return json.loads(value)
+
+
+class ConfigDBVersion(BASE_TABLE):
+    """
+    The schema version of the database (a single row).
+    """
+    __tablename__ = "configDbVersion"
+    version = Column(Integer, primary_key=True)
+
 
 class OptimalConfig(BASE_TABLE):
     """
     Stores the parameters for a (hash, type, pass) triple
-    during the tuning run.
+    during the tuning run, for a workload (tag, "" by default), with the
+    performance of the program measured with them (the objective, minimize
+    or maximize, and its value), the tuning run and the time they were
+    stored. The performance is unknown (None) for rows of older versions.
     """
     __tablename__ = "optimalConfigs"
     hashcode = Column(String, primary_key=True)
     code_region_type = Column(String, primary_key=True)
     pass_name = Column(String, primary_key=True)
-    params = Column(PickleType)
+    workload = Column(String, primary_key=True, default="", server_default="")
+    params = Column(JSONType)
+    objective = Column(String)
+    objective_value = Column(Float)
+    run_id = Column(String)
+    timestamp = Column(DateTime)
+
+
+class CodeRegionFeature(BASE_TABLE):
+    """
+    Stores the features of a (hash, type, pass) triple as found in the
+    opportunity files. Used to find optimal configurations of similar code
+    regions when the hash does not match exactly.
+    """
+    __tablename__ = "codeRegionFeatures"
+    hashcode = Column(String, primary_key=True)
+    code_region_type = Column(String, primary_key=True)
+    pass_name = Column(String, primary_key=True)
+    name = Column(String)
+    func_name = Column(String)
+    dynamic_configs = Column(JSONType)
+    baseline_config = Column(JSONType)
 
 
 class CurrentCodeRegion(BASE_TABLE):
     """
     A temporary table of all code regions opportunities.
     Will be used to generate LLVM input.
-    The primary key constraints must match CodeRegion::Operator== in LLVM.
+    The primary key constraints must match CodeRegion::Operator== in LLVM,
+    within the tuning run `run_id`.
     """
     __tablename__ = "currentCodeRegions"
+    run_id = Column(String, primary_key=True, default="", server_default="")
     name = Column(String, primary_key=True)
     pass_name = Column(String, primary_key=True)
     func_name = Column(String, primary_key=True)
@@ -51,44 +202,190 @@ class CurrentCodeRegion(BASE_TABLE):
     seen = Column(Boolean)
 
 
-def create_config_db_session(data_dir):
+# Lookup of duplicate hashes, see is_duplicate_hash().
+CONFIG_INDEXES = [
+    Index("ix_current_code_region_run_hash", CurrentCodeRegion.run_id,
+          CurrentCodeRegion.hashcode, CurrentCodeRegion.code_region_type,
+          CurrentCodeRegion.pass_name),
+]
+
+
+@profiling.timed("config_db.open")
+def create_config_db_session(data_dir, run_id="", workload=""):
     """
     Creates `configs.db` in `data_dir` if it does not exist
     and creates a connection to the database.
     Returns a session for the connection.
 
     Args:
-        data_dir (string) - Path to configuration database.
+        data_dir (string) - Path to configuration database, or the URL of
+            a database (e.g. postgresql://host/configs) to use instead of
+            `configs.db`.
+        run_id (string) - Identifier of the tuning run, which owns the rows
+            of CurrentCodeRegions written with the session.
+        workload (string) - Workload tag of the optimal configurations read
+            and written with the session.
 
     Returns:
         session: Session to the database.
     """
-    path = os.path.join(data_dir, "configs.db")
-    engine = create_engine('sqlite:///' + path)
-    if not os.path.exists(path):
+    if "://" in data_dir:
+        url = data_dir
+    else:
+        url = 'sqlite:///' + os.path.join(data_dir, "configs.db")
+    engine = create_engine(url)
+    configure_sqlite_engine(engine)
+
+    def create_schema():
+        # Only missing tables are created, so databases written by older
+        # versions get the tables introduced since.
         BASE_TABLE.metadata.create_all(engine)
+        _upgrade_config_db(engine)
+        create_missing_indexes(engine, CONFIG_INDEXES)
+
+    # Concurrent runs may create the schema at the same time.
+    retry_on_busy(create_schema)
     session_maker = sessionmaker(bind=engine)
     session = session_maker()
+    session.info["run_id"] = run_id
+    session.info["workload"] = workload
     return session
 
 
+def _is_busy(error):
+    message = str(error.orig).lower()
+    return "locked" in message or "busy" in message or \
+        "already exists" in message
+
+
+def retry_on_busy(operation, retries=WRITE_RETRIES):
+    """
+    Call `operation` and return its result, calling it again (at most
+    `retries` times) if it fails because another tuning run holds the
+    database lock. `operation` must roll back what it wrote on failure.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except OperationalError as error:
+            if attempt == retries or not _is_busy(error):
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+    return None
+
+
+# Columns stored pickled before version 2, by table.
+_PICKLED_COLUMNS = {
+    OptimalConfig: ["params"],
+    CodeRegionFeature: ["dynamic_configs", "baseline_config"],
+}
+
+
+def _upgrade_config_db(engine):
+    """
+    Convert a database written by an older version to CONFIG_DB_VERSION.
+    """
+    with engine.begin() as connection:
+        version = connection.execute(
+            text("SELECT max(version) FROM configDbVersion")).scalar()
+        if version == CONFIG_DB_VERSION:
+            return
+        if version is not None and version > CONFIG_DB_VERSION:
+            raise Exception(
+                "The config database was written by a newer version of the "
+                "autotuner (schema version {})".format(version))
+        _add_missing_columns(connection)
+        if version is None or version < 2:
+            _unpickle_columns(connection)
+        connection.execute(ConfigDBVersion.__table__.delete())
+        connection.execute(ConfigDBVersion.__table__.insert(),
+                           {"version": CONFIG_DB_VERSION})
+
+
+def _add_missing_columns(connection):
+    """
+    Rebuild the tables that lack columns of their model, since primary key
+    columns cannot be added to a table. The rows are copied; new columns
+    get their server default (e.g. the rows of CurrentCodeRegions written
+    by an older version belong to the run id "").
+    """
+    inspector = inspect(connection)
+    for table in BASE_TABLE.metadata.sorted_tables:
+        existing = {column["name"]
+                    for column in inspector.get_columns(table.name)}
+        if existing >= set(table.columns.keys()):
+            continue
+        indexes = [index["name"] for index in inspector.get_indexes(
+            table.name)]
+        old_name = table.name + "Old"
+        connection.execute(text("ALTER TABLE {} RENAME TO {}".format(
+            table.name, old_name)))
+        for index in indexes:
+            connection.execute(text("DROP INDEX " + index))
+        table.create(connection)
+        columns = ", ".join(name for name in table.columns.keys()
+                            if name in existing)
+        connection.execute(text("INSERT INTO {} ({}) SELECT {} FROM {}".format(
+            table.name, columns, columns, old_name)))
+        connection.execute(text("DROP TABLE " + old_name))
+
+
+def _unpickle_columns(connection):
+    for model, columns in _PICKLED_COLUMNS.items():
+        table = model.__table__
+        keys = [column.name for column in table.primary_key]
+        rows = connection.execute(
+            table.select().with_only_columns(
+                *[table.c[name] for name in keys],
+                *[_raw(table.c[name]) for name in columns])).all()
+        for row in rows:
+            values = {name: _unpickle(row[len(keys) + position])
+                      for position, name in enumerate(columns)}
+            connection.execute(
+                table.update().where(*[table.c[key] == row[position]
+                                       for position, key
+                                       in enumerate(keys)]),
+                values)
+
+
+def _raw(column):
+    # Read the stored bytes without decoding them as JSON.
+    return type_coerce(column, LargeBinary)
+
+
+def _unpickle(value):
+    if value is None:
+        return None
+    # Only databases written by this tool are converted.
+    return pickle.loads(value)
+
+
+def _run_id(db_session):
+    return db_session.info.get("run_id", "")
+
+
+@profiling.timed("config_db.write")
 def clear_config_db(db_session):
     """
-    Clears all rows in the CurrentCodeRegion table.
+    Clears the rows of the tuning run of `db_session` in the
+    CurrentCodeRegion table.
     """
     try:
-        db_session.query(CurrentCodeRegion).delete()
+        db_session.query(CurrentCodeRegion).filter(
+            CurrentCodeRegion.run_id == _run_id(db_session)).delete()
     except Exception:
         db_session.rollback()
         raise
 
 
+@profiling.timed("config_db.lookup")
 def is_current_code_region(db_session, entry):
     """
     Checks if `entry` is already in the CurrentCodeRegions table.
     """
     try:
         found = db_session.query(CurrentCodeRegion).filter(
+            CurrentCodeRegion.run_id == entry.run_id,
             CurrentCodeRegion.name == entry.name,
             CurrentCodeRegion.pass_name == entry.pass_name,
             CurrentCodeRegion.func_name == entry.func_name,
@@ -105,12 +402,14 @@ def is_current_code_region(db_session, entry):
         raise
 
 
+@profiling.timed("config_db.write")
 def add_current_code_region(db_session, code_region, seen):
     """
     Inserts (code_region, seen) as a row in the CurrentCodeRegions table.
     """
     try:
         entry = CurrentCodeRegion()
+        entry.run_id = _run_id(db_session)
         entry.name = code_region["Name"]
         entry.pass_name = code_region["Pass"]
         entry.func_name = code_region["Function"]
@@ -135,6 +434,7 @@ def add_current_code_region(db_session, code_region, seen):
         raise
 
 
+@profiling.timed("config_db.lookup")
 def is_duplicate_hash(db_session, hashcode, code_region_type, pass_name):
     """
     Determines if the (hash, type, pass) triple is already present
@@ -142,6 +442,7 @@ def is_duplicate_hash(db_session, hashcode, code_region_type, pass_name):
     """
     try:
         found = db_session.query(CurrentCodeRegion).filter(
+            CurrentCodeRegion.run_id == _run_id(db_session),
             CurrentCodeRegion.hashcode == hashcode,
             CurrentCodeRegion.code_region_type == code_region_type,
             CurrentCodeRegion.pass_name == pass_name
@@ -152,23 +453,50 @@ def is_duplicate_hash(db_session, hashcode, code_region_type, pass_name):
         raise
 
 
+def _workload(db_session):
+    return db_session.info.get("workload", "")
+
+
+def _optimal_configs(db_session):
+    """
+    Returns a dict of (hash, type, pass) -> params of the rows of the
+    OptimalConfigs table for the workload of the session, loaded once per
+    session; lookups are done in memory and update_optimal_configs() keeps
+    it up to date.
+    """
+    configs = db_session.info.get("optimal_configs")
+    if configs is None:
+        configs = {
+            (hashcode, code_region_type, pass_name): params
+            for hashcode, code_region_type, pass_name, params
+            in db_session.query(OptimalConfig.hashcode,
+                                OptimalConfig.code_region_type,
+                                OptimalConfig.pass_name,
+                                OptimalConfig.params).filter(
+                OptimalConfig.workload == _workload(db_session))}
+        db_session.info["optimal_configs"] = configs
+    return configs
+
+
+def _reset_optimal_configs(db_session):
+    db_session.info.pop("optimal_configs", None)
+
+
+@profiling.timed("config_db.lookup")
 def optimal_config_exists(db_session, hashcode, code_region_type, pass_name):
     """
     Determines if the (hash, type, pass) triple is already present
     in the OptimalConfig table.
     """
     try:
-        result = db_session.query(OptimalConfig).filter(
-            OptimalConfig.hashcode == hashcode,
-            OptimalConfig.code_region_type == code_region_type,
-            OptimalConfig.pass_name == pass_name
-        ).one_or_none()
-        return result is not None
+        return (str(hashcode), code_region_type, pass_name) in \
+            _optimal_configs(db_session)
     except Exception:
         db_session.rollback()
         raise
 
 
+@profiling.timed("config_db.lookup")
 def get_optimal_config(db_session, hashcode, code_region_type, pass_name):
     """
     Retrieves the optimal configuration stored in the OptimalConfigs
@@ -176,17 +504,14 @@ def get_optimal_config(db_session, hashcode, code_region_type, pass_name):
     not exist.
     """
     try:
-        result = db_session.query(OptimalConfig).filter(
-            OptimalConfig.hashcode == hashcode,
-            OptimalConfig.code_region_type == code_region_type,
-            OptimalConfig.pass_name == pass_name
-        ).one_or_none()
-        return result.params if result is not None else None
+        return _optimal_configs(db_session).get(
+            (str(hashcode), code_region_type, pass_name))
     except Exception:
         db_session.rollback()
         raise
 
 
+@profiling.timed("config_db.query")
 def get_current_code_regions(db_session, ignore_seen=False):
     """
     Returns a list of CodeRegionsConfiguration containing all rows
@@ -203,17 +528,13 @@ def get_current_code_regions(db_session, ignore_seen=False):
     """
     try:
         results = []
-        seen = db_session.query(CurrentCodeRegion).all()
+        optimal_configs = _optimal_configs(db_session)
+        seen = db_session.query(CurrentCodeRegion).filter(
+            CurrentCodeRegion.run_id == _run_id(db_session)).all()
         for row in seen:
-            cfg_row = db_session.query(OptimalConfig).filter(
-                OptimalConfig.hashcode == row.hashcode,
-                OptimalConfig.code_region_type == row.code_region_type,
-                OptimalConfig.pass_name == row.pass_name
-            ).one_or_none()
-            parameters = cfg_row.params if row.seen else None
-
-            if ignore_seen and cfg_row:
-                parameters = cfg_row.params
+            params = optimal_configs.get(
+                (row.hashcode, row.code_region_type, row.pass_name))
+            parameters = params if row.seen or ignore_seen else None
 
             code_region = CodeRegion(
                 name=row.name,
@@ -238,31 +559,261 @@ def get_current_code_regions(db_session, ignore_seen=False):
         raise
 
 
-def update_optimal_configs(db_session, remarks):
+@profiling.timed("config_db.update")
+def update_optimal_configs(db_session, remarks, objective=None,
+                           objective_value=None, policy="better"):
     """
     Insert/update the OptimalConfigs table based on data received in 'remarks'.
+    The rows are upserted and committed at once, so that concurrent tuning
+    runs hold the database lock briefly; the commit is retried while
+    another run holds it.
 
     Args:
         db_session - A session to `configs.db`.
         remarks - A list of remarks to consider when updating.
+        objective - 'minimize' or 'maximize', the objective of the run.
+        objective_value - Performance of the program measured with the
+            configurations of `remarks`, None if unknown.
+        policy - A policy of UPDATE_POLICIES: 'better' keeps a stored
+            configuration whose performance is better than
+            `objective_value` for the same objective, 'overwrite' replaces
+            it. Performance is only comparable for the same inputs, so
+            'better' only applies to a workload tag: the configurations of
+            the untagged workload are always replaced.
+    """
+    if policy not in UPDATE_POLICIES:
+        raise ValueError("unknown update policy: {}".format(policy))
+    rows = {}
+    timestamp = datetime.now()
+    for remark in remarks:
+        key = (str(remark.CodeRegionHash), remark.CodeRegionType,
+               remark.Pass)
+        rows[key] = {"hashcode": key[0], "code_region_type": key[1],
+                     "pass_name": key[2], "workload": _workload(db_session),
+                     "params": remark.Args, "objective": objective,
+                     "objective_value": objective_value,
+                     "run_id": _run_id(db_session), "timestamp": timestamp}
+
+    def upsert():
+        try:
+            _upsert_optimal_configs(db_session, list(rows.values()),
+                                    policy == "better" and
+                                    bool(_workload(db_session)))
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+
+    try:
+        # Pending changes of the session are committed first, so that a
+        # retry does not lose them.
+        db_session.commit()
+        if rows:
+            retry_on_busy(upsert)
+    finally:
+        # Stored configurations may have been kept, or updated by another
+        # run; they are read again on the next lookup.
+        _reset_optimal_configs(db_session)
+
+
+def _is_better(objective, value, stored_value):
+    if objective == "maximize":
+        return value > stored_value
+    return value < stored_value
+
+
+def _upsert_optimal_configs(db_session, rows, keep_better):
+    """
+    Replace the rows of OptimalConfigs with the same (hash, type, pass,
+    workload). If `keep_better`, a stored row is kept when both rows have
+    the same objective and the stored value is better or equal.
+    """
+    dialect = db_session.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        for row in rows:
+            stored = db_session.get(OptimalConfig, (
+                row["hashcode"], row["code_region_type"], row["pass_name"],
+                row["workload"]))
+            if keep_better and stored is not None and \
+                    None not in (stored.objective_value,
+                                 row["objective_value"]) and \
+                    stored.objective == row["objective"] and \
+                    not _is_better(row["objective"], row["objective_value"],
+                                   stored.objective_value):
+                continue
+            db_session.merge(OptimalConfig(**row))
+        return
+    insert = (sqlite if dialect == "sqlite" else postgresql).insert(
+        OptimalConfig.__table__)
+    where = None
+    if keep_better:
+        stored, new = OptimalConfig.__table__.c, insert.excluded
+        where = (stored.objective_value.is_(None) |
+                 new.objective_value.is_(None) |
+                 stored.objective.is_distinct_from(new.objective) |
+                 ((new.objective == "maximize") &
+                  (new.objective_value > stored.objective_value)) |
+                 (new.objective.is_distinct_from("maximize") &
+                  (new.objective_value < stored.objective_value)))
+    db_session.execute(insert.on_conflict_do_update(
+        index_elements=["hashcode", "code_region_type", "pass_name",
+                        "workload"],
+        set_={name: insert.excluded[name] for name in
+              ("params", "objective", "objective_value", "run_id",
+               "timestamp")},
+        where=where), rows)
+
+
+@profiling.timed("config_db.write")
+def add_code_region_features(db_session, code_region):
+    """
+    Inserts/updates the features of `code_region` in the CodeRegionFeatures
+    table.
+    """
+    try:
+        entry = CodeRegionFeature()
+        entry.hashcode = code_region["Hashcode"]
+        entry.code_region_type = code_region["CodeRegionType"]
+        entry.pass_name = code_region["Pass"]
+        entry.name = code_region["Name"]
+        entry.func_name = code_region["Function"]
+        entry.dynamic_configs = code_region.get("DynamicConfigs") or {}
+        entry.baseline_config = code_region.get("BaselineConfig") or {}
+        db_session.merge(entry)
+    except Exception:
+        db_session.rollback()
+        raise
+
+
+@profiling.timed("config_db.query")
+def get_code_region_features(db_session):
+    """
+    Returns a dict of (hash, type, pass) -> CodeRegionFeature for all rows in
+    the CodeRegionFeatures table.
+    """
+    try:
+        return {(row.hashcode, row.code_region_type, row.pass_name): row
+                for row in db_session.query(CodeRegionFeature).all()}
+    except Exception:
+        db_session.rollback()
+        raise
+
+
+@profiling.timed("config_db.query")
+def get_optimal_configs_with_features(db_session):
+    """
+    Returns a list of (OptimalConfig, CodeRegionFeature) pairs for all
+    optimal configurations of the workload of the session whose code
+    region features are known.
+    """
+    try:
+        return db_session.query(OptimalConfig, CodeRegionFeature).join(
+            CodeRegionFeature,
+            (OptimalConfig.hashcode == CodeRegionFeature.hashcode) &
+            (OptimalConfig.code_region_type ==
+             CodeRegionFeature.code_region_type) &
+            (OptimalConfig.pass_name == CodeRegionFeature.pass_name)
+        ).filter(OptimalConfig.workload == _workload(db_session)).all()
+    except Exception:
+        db_session.rollback()
+        raise
+
+
+# Tables written by export_configs(), with the record kind of their rows.
+_EXPORTED_TABLES = [("config", OptimalConfig),
+                    ("feature", CodeRegionFeature)]
+
+
+def _open_export_file(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _from_json(model, record):
+    for column in model.__table__.columns:
+        if isinstance(column.type, DateTime) and \
+                record.get(column.name) is not None:
+            record[column.name] = datetime.fromisoformat(record[column.name])
+    return record
+
+
+def export_configs(db_session, path, chunk_size=1000):
+    """
+    Write the optimal configurations and code region features to `path`
+    (gzip-compressed if it ends with '.gz'): a header line, then one JSON
+    object per row. Rows are read `chunk_size` at a time.
+
+    Returns:
+        A dict of record kind -> number of rows written.
+    """
+    counts = {}
+    try:
+        with _open_export_file(path, "w") as file:
+            file.write(json.dumps(EXPORT_FORMAT) + "\n")
+            for kind, model in _EXPORTED_TABLES:
+                columns = [column.name for column in model.__table__.columns]
+                counts[kind] = 0
+                for row in db_session.query(model).yield_per(chunk_size):
+                    record = {"kind": kind}
+                    record.update((name, _to_json(getattr(row, name)))
+                                  for name in columns)
+                    file.write(json.dumps(record, separators=(",", ":")) +
+                               "\n")
+                    counts[kind] += 1
+    except Exception:
+        db_session.rollback()
+        raise
+    return counts
+
+
+def import_configs(db_session, path, chunk_size=1000):
+    """
+    Insert/update the rows of a file written by export_configs(); rows of
+    the same (hash, type, pass) and workload are overwritten. Rows are committed
+    `chunk_size` at a time.
+
+    Returns:
+        A dict of record kind -> number of rows read.
     """
+    models = dict(_EXPORTED_TABLES)
+    counts = {kind: 0 for kind in models}
     try:
-        for remark in remarks:
-            row = db_session.query(OptimalConfig).filter(
-                OptimalConfig.hashcode == str(remark.CodeRegionHash),
-                OptimalConfig.code_region_type == remark.CodeRegionType,
-                OptimalConfig.pass_name == remark.Pass
-            ).one_or_none()
-            if row:
-                # This code region was previously stored in the table.
-                db_session.delete(row)
-            # Add another row to the OptimalConfig table.
-            new_optimal_config = OptimalConfig()
-            new_optimal_config.hashcode = str(remark.CodeRegionHash)
-            new_optimal_config.code_region_type = remark.CodeRegionType
-            new_optimal_config.pass_name = remark.Pass
-            new_optimal_config.params = remark.Args
-            db_session.add(new_optimal_config)
+        with _open_export_file(path, "r") as file:
+            header = json.loads(file.readline() or "null")
+            if not isinstance(header, dict) or \
+                    header.get("format") != EXPORT_FORMAT["format"]:
+                raise ValueError("{} is not an autotuner configs "
+                                 "file".format(path))
+            if header.get("version", 0) > EXPORT_FORMAT["version"]:
+                raise ValueError("{} was written by a newer version of the "
+                                 "autotuner".format(path))
+            pending = 0
+            for line_number, line in enumerate(file, 2):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.pop("kind", None)
+                if kind not in models:
+                    raise ValueError("{}:{}: unknown record kind '{}'".format(
+                        path, line_number, kind))
+                db_session.merge(models[kind](**_from_json(models[kind],
+                                                           record)))
+                counts[kind] += 1
+                pending += 1
+                if pending == chunk_size:
+                    db_session.commit()
+                    pending = 0
+        db_session.commit()
     except Exception:
         db_session.rollback()
         raise
+    finally:
+        _reset_optimal_configs(db_session)
+    return counts
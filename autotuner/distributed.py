@@ -0,0 +1,444 @@
+# coding=utf-8
+"""
+Distributed evaluation of tuning trials.
+
+A Coordinator listens on a TCP socket for worker processes, each owning its
+own build tree (possibly on another node). A trial (see
+TunerBase.compile_and_run) is run on one idle worker: the coordinator sends
+the serialized LLVM input, which the worker writes to its LLVMInputFile,
+then each command the tuner runs. Commands and directories of the
+coordinator's config file are sent as templates (the name of their key in
+[Compiling Setting]), so that every worker runs the command of its own
+config file. Result files written by the runs are read on the worker too.
+Results are sent back as soon as each command finishes; a trial whose
+worker fails is retried on another worker.
+
+Workers authenticate with a token shared with the coordinator: they answer
+a random challenge with its HMAC under the token, so the token itself is
+never sent. A worker only runs the commands of its own config file.
+
+Messages are JSON objects prefixed with their length (4 bytes, big endian).
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import hashlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from autotuner.tuners.metrics import MetricExtractor
+from autotuner.tuners.metrics import scan_file
+from autotuner.tuners.metrics import stream_program
+from autotuner.tuners.metrics import TAIL_LINES
+
+# Keys of [Compiling Setting] a worker substitutes with its own values.
+COMMAND_KEYS = ["CompileCommand", "RunCommand"]
+DIRECTORY_KEYS = ["CompileDir", "RunDir"]
+# The environment variable holding the token of the workers.
+TOKEN_ENV = "AUTOTUNE_WORKER_TOKEN"
+# The file the tuning run writes a generated token to, in its output
+# directory.
+TOKEN_FILE = "worker.token"
+# Seconds a connecting worker has to authenticate.
+HANDSHAKE_TIMEOUT = 10
+# Seconds to wait before accepting connections again after an error, e.g.
+# when the process is out of file descriptors.
+ACCEPT_RETRY_DELAY = 1
+_HEADER = struct.Struct("!I")
+
+
+class WorkerError(Exception):
+    """
+    Raised when a worker fails or no worker is available.
+    """
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _receive_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def receive_message(sock):
+    """
+    Returns the next message from `sock`, or None if it was closed.
+    """
+    header = _receive_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _receive_exactly(sock, _HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode())
+
+
+def _digest(token, nonce):
+    return hmac.new(token.encode(), nonce.encode(),
+                    hashlib.sha256).hexdigest()
+
+
+def parse_address(address):
+    """
+    Parse 'HOST:PORT' into a (host, port) tuple.
+    """
+    host, _, port = address.rpartition(":")
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise ValueError("Invalid address (HOST:PORT expected): " + address)
+
+
+class WorkerConnection(object):
+    """
+    The coordinator side of the connection to a worker.
+    """
+
+    def __init__(self, sock, name):
+        self.sock = sock
+        self.name = name
+
+    def request(self, message):
+        try:
+            send_message(self.sock, message)
+            reply = receive_message(self.sock)
+        except (OSError, ValueError) as error:
+            raise WorkerError("worker {} failed: {}".format(self.name, error))
+        if reply is None:
+            raise WorkerError("worker {} disconnected".format(self.name))
+        if "error" in reply:
+            raise WorkerError("worker {} failed: {}".format(self.name,
+                                                             reply["error"]))
+        return reply
+
+    def put_input(self, data):
+        """
+        Write `data` to the LLVMInputFile of the worker.
+        """
+        self.request({"op": "input", "data": data})
+
+    def call_program(self, cmd, cwd=None, limit=None, cpus=None):
+        """
+        Like MeasurementInterface.call_program, on the worker. `cmd` and
+        `cwd` are (value, key) templates, see TunerBase._template; the
+        worker refuses a command whose key is not in its config file. The
+        command is pinned to the `cpus` the worker has.
+        """
+        return self.request({"op": "call", "cmd": cmd, "cwd": cwd,
+                             "limit": limit, "cpus": cpus})
+
+    def stream_program(self, cmd, extractors, cwd=None, limit=None,
+                       stop_when_captured=False, max_lines=TAIL_LINES,
+                       cpus=None):
+        """
+        Like autotuner.tuners.metrics.stream_program, on the worker. The
+        metrics are converted here since the worker only gets the patterns.
+        """
+        result = self.request({
+            "op": "stream", "cmd": cmd, "cwd": cwd, "limit": limit,
+            "cpus": cpus, "stop_when_captured": stop_when_captured,
+            "max_lines": max_lines,
+            "extractors": [[extractor.name, extractor.regex.pattern,
+                            extractor.last] for extractor in extractors]})
+        for extractor in extractors:
+            if extractor.name in result["metrics"]:
+                result["metrics"][extractor.name] = extractor.convert(
+                    result["metrics"][extractor.name])
+        return result
+
+    def scan_file(self, path, extractors, cwd=None):
+        """
+        Like autotuner.tuners.metrics.scan_file, on the worker: `path` is
+        relative to the `cwd` template. Returns None if the worker has no
+        such file.
+        """
+        metrics = self.request({
+            "op": "scan", "path": path, "cwd": cwd,
+            "extractors": [[extractor.name, extractor.regex.pattern,
+                            extractor.last] for extractor in extractors]
+        })["metrics"]
+        if metrics is None:
+            return None
+        for extractor in extractors:
+            if extractor.name in metrics:
+                metrics[extractor.name] = extractor.convert(
+                    metrics[extractor.name])
+        return metrics
+
+    def close(self, shutdown=False):
+        try:
+            if shutdown:
+                send_message(self.sock, {"op": "shutdown"})
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class Coordinator(object):
+    """
+    Dispatch trials to the workers connected to `address`.
+
+    Args:
+        address: (host, port) to listen on; port 0 picks a free port.
+        retries: number of times a trial is retried on another worker.
+        acquire_timeout: seconds to wait for an idle worker.
+        token: the token workers authenticate with; a random one by default.
+    """
+
+    def __init__(self, address=("127.0.0.1", 0), retries=2,
+                 acquire_timeout=600, token=None):
+        self.retries = retries
+        self.acquire_timeout = acquire_timeout
+        self.token = token or secrets.token_hex(32)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen()
+        self.address = self.server.getsockname()[:2]
+        self.idle = queue.Queue()
+        self.workers = []
+        self.processes = []
+        self.lock = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                sock, peer = self.server.accept()
+            except OSError as error:
+                if self.closed:
+                    return
+                print("Failed to accept a worker: {}".format(error))
+                time.sleep(ACCEPT_RETRY_DELAY)
+                continue
+            # A client that does not answer only delays its own connection.
+            threading.Thread(target=self._handshake, args=(sock, peer),
+                             daemon=True).start()
+
+    def _handshake(self, sock, peer):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.settimeout(HANDSHAKE_TIMEOUT)
+            nonce = secrets.token_hex(16)
+            send_message(sock, {"op": "challenge", "nonce": nonce})
+            hello = receive_message(sock)
+            sock.settimeout(None)
+        except (OSError, ValueError):
+            sock.close()
+            return
+        if not isinstance(hello, dict) or hello.get("op") != "hello" or \
+                not hmac.compare_digest(str(hello.get("digest", "")),
+                                        _digest(self.token, nonce)):
+            print("Rejected a worker from {}:{}: authentication "
+                  "failed".format(*peer[:2]))
+            sock.close()
+            return
+        worker = WorkerConnection(sock, hello.get("name", "unknown"))
+        with self.lock:
+            if self.closed:
+                worker.close(shutdown=True)
+                return
+            self.workers.append(worker)
+            self.lock.notify_all()
+        self.idle.put(worker)
+
+    def wait_for_workers(self, count, timeout=None):
+        """
+        Wait until `count` workers are connected; returns False on timeout.
+        Raises WorkerError if a local worker exits meanwhile.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.lock:
+            while len(self.workers) < count:
+                for process in self.processes:
+                    if process.poll() is not None:
+                        raise WorkerError(
+                            "local worker {} exited with status {}".format(
+                                process.args[-1], process.returncode))
+                wait = 1.0 if deadline is None else \
+                    min(1.0, deadline - time.time())
+                if wait <= 0:
+                    return False
+                self.lock.wait(wait)
+            return True
+
+    def spawn_local_workers(self, config_file, count, build_root):
+        """
+        Start `count` workers as local processes, each building in its own
+        copy of the CompileDir of `config_file` under `build_root`.
+        """
+        host, port = self.address
+        # Not on the command line, which other users can read.
+        env = dict(os.environ, **{TOKEN_ENV: self.token})
+        for index in range(len(self.processes),
+                           len(self.processes) + count):
+            self.processes.append(subprocess.Popen(
+                [sys.executable, "-m", "autotuner.main", "worker",
+                 config_file, "--coordinator", "{}:{}".format(host, port),
+                 "--build-dir",
+                 os.path.join(build_root, "worker{}".format(index))],
+                env=env))
+
+    def _acquire(self):
+        deadline = time.time() + self.acquire_timeout
+        while True:
+            with self.lock:
+                if not self.workers and self.processes and \
+                        all(process.poll() is not None
+                            for process in self.processes):
+                    raise WorkerError("all local workers exited")
+            try:
+                return self.idle.get(timeout=min(
+                    1.0, max(deadline - time.time(), 0)))
+            except queue.Empty:
+                if time.time() >= deadline:
+                    raise WorkerError("no worker available after {}s".format(
+                        self.acquire_timeout))
+
+    def _discard(self, worker):
+        worker.close()
+        with self.lock:
+            if worker in self.workers:
+                self.workers.remove(worker)
+
+    def run_trial(self, trial):
+        """
+        Call `trial(worker)` with an idle worker and return its result. If
+        the worker fails, it is discarded and the trial is retried with
+        another worker, at most `retries` times.
+        """
+        for attempt in range(self.retries + 1):
+            worker = self._acquire()
+            try:
+                result = trial(worker)
+            except WorkerError as error:
+                self._discard(worker)
+                if attempt == self.retries:
+                    raise
+                print("{}, retrying on another worker".format(error))
+                continue
+            self.idle.put(worker)
+            return result
+
+    def close(self):
+        self.closed = True
+        try:
+            self.server.close()
+        except OSError:
+            pass
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.close(shutdown=True)
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _resolve(template, settings):
+    """
+    The worker's value of a (value, key) template sent by the coordinator.
+    """
+    if template is None:
+        return None
+    value, key = template
+    return settings.get(key, value) if key else value
+
+
+def _resolve_command(template, settings):
+    """
+    Like _resolve, but only for the commands of the worker's config file:
+    the coordinator cannot make a worker run a command of its choosing.
+    """
+    value, key = template
+    if key not in settings:
+        raise ValueError("refused to run a command that is not in the "
+                         "config file of the worker: {}".format(value))
+    return settings[key]
+
+
+def _handle(message, settings):
+    operation = message.get("op")
+    if operation == "input":
+        input_file = settings["LLVMInputFile"]
+        input_dir = os.path.dirname(input_file)
+        if input_dir and not os.path.isdir(input_dir):
+            os.makedirs(input_dir)
+        with open(input_file, "w") as file:
+            file.write(message["data"])
+        return {}
+    if operation == "scan":
+        path = os.path.join(_resolve(message.get("cwd"), settings) or "",
+                            message["path"])
+        if not os.path.isfile(path):
+            return {"metrics": None}
+        extractors = [MetricExtractor(name, pattern, str, last=last)
+                      for name, pattern, last in message["extractors"]]
+        return {"metrics": scan_file(path, extractors)}
+    cmd = _resolve_command(message["cmd"], settings)
+    cwd = _resolve(message.get("cwd"), settings)
+    cpus = message.get("cpus")
+    if cpus:
+        # CPU sets are chosen on the coordinator; keep those of this host.
+        cpus = sorted(set(cpus) & set(range(os.cpu_count() or 1))) or None
+    if operation == "call":
+        result = stream_program(cmd, [], cwd=cwd, limit=message.get("limit"),
+                                max_lines=None, cpus=cpus)
+        del result["metrics"], result["stopped_early"]
+        return result
+    if operation == "stream":
+        extractors = [MetricExtractor(name, pattern, str, last=last)
+                      for name, pattern, last in message["extractors"]]
+        return stream_program(
+            cmd, extractors, cwd=cwd, limit=message.get("limit"),
+            stop_when_captured=message.get("stop_when_captured", False),
+            max_lines=message.get("max_lines", TAIL_LINES), cpus=cpus)
+    raise ValueError("unknown operation: {}".format(operation))
+
+
+def serve(address, settings, token, name=None):
+    """
+    Run a worker: connect to the coordinator at `address` and run its
+    requests until it shuts the worker down or disconnects. `settings` maps
+    the keys of COMMAND_KEYS, DIRECTORY_KEYS, FidelityRunCommands[N] and
+    LLVMInputFile to the values of this worker; `token` is the one of the
+    coordinator.
+    """
+    sock = socket.create_connection(address)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    name = name or "{}:{}".format(socket.gethostname(), os.getpid())
+    with sock:
+        challenge = receive_message(sock)
+        if not challenge or challenge.get("op") != "challenge":
+            raise WorkerError("no challenge from the coordinator")
+        send_message(sock, {"op": "hello", "name": name,
+                            "digest": _digest(token, challenge["nonce"])})
+        while True:
+            message = receive_message(sock)
+            if message is None or message.get("op") == "shutdown":
+                return
+            try:
+                reply = _handle(message, settings)
+            except Exception as error:
+                reply = {"error": "{}: {}".format(type(error).__name__,
+                                                  error)}
+            send_message(sock, reply)
@@ -5,6 +5,9 @@ Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
 import argparse
 import abc
+import hashlib
+import os
+from collections import OrderedDict
 
 argument_parser = argparse.ArgumentParser(add_help=False)
 argument_parser.add_argument('--parse-format', nargs='?', choices=[
@@ -13,16 +16,153 @@ argument_parser.add_argument('--parse-format', nargs='?', choices=[
                             '(default: yaml)')
 
 
+# Default number of output files kept open by a streamed divide.
+DEFAULT_MAX_OPEN_FILES = 64
+
+# Policies of a merge for the documents of the same code region: keep the
+# first one, the last one, or prefer the one of a given input file.
+MERGE_POLICIES = ["first", "last", "prefer"]
+
+
 class EmptySearchSpaceError(Exception):
     pass
 
 
+class InvalidLLVMInputError(Exception):
+    pass
+
+
+def document_digest(data):
+    """
+    Returns a compact (8 bytes) digest of the serialized document data
+    (bytes), kept instead of the document to detect duplicates.
+    """
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+
+class DuplicateResolver(object):
+    """
+    Resolves the documents of a merge configuring the same code region in a
+    single pass, indexed by the digest of their code region. A dropped
+    document is counted as a duplicate if its content digest is that of the
+    kept document, and as a conflict otherwise (e.g. different Args).
+
+    With the "first" policy, documents are yielded as they are read and
+    only digests are kept. The "last" and "prefer" policies keep the
+    documents resolved so far and yield them at the end, in the order their
+    code regions were first read. Without policy, every document is kept.
+    """
+
+    def __init__(self, policy=None, prefer_file=None):
+        self.policy = policy
+        self.prefer_file = os.path.realpath(prefer_file) \
+            if prefer_file else None
+        self.stats = {"read": 0, "written": 0, "duplicates": 0,
+                      "conflicts": 0}
+
+    def resolve(self, documents):
+        """
+        documents yields (input file, region digest, content digest,
+        document); the digests are unused without policy. Yields the
+        documents kept.
+        """
+        stats = self.stats
+        buffered = self.policy in ("last", "prefer")
+        # Region digest -> (content digest, document if buffered,
+        # whether it comes from prefer_file).
+        kept = OrderedDict()
+        for input_file, region, content, document in documents:
+            stats["read"] += 1
+            if self.policy is None:
+                stats["written"] += 1
+                yield document
+                continue
+            preferred = self.policy == "prefer" and \
+                os.path.realpath(input_file) == self.prefer_file
+            entry = kept.get(region)
+            if entry is None:
+                kept[region] = (content, document if buffered else None,
+                                preferred)
+                if not buffered:
+                    stats["written"] += 1
+                    yield document
+                continue
+            if content == entry[0]:
+                stats["duplicates"] += 1
+            else:
+                stats["conflicts"] += 1
+            if self.policy == "last" or (preferred and not entry[2]):
+                kept[region] = (content, document, preferred)
+        if buffered:
+            for _, document, _ in kept.values():
+                stats["written"] += 1
+                yield document
+
+
+class LRUWriters(object):
+    """
+    Writers of the output files of a streamed divide. At most max_open
+    writers are open at once: the least recently used one is closed when
+    another file is written to, and its file is reopened in append mode
+    when it is written to again.
+
+    open_writer(path, append) returns a writer of path with the methods
+    write(document) and close().
+    """
+
+    def __init__(self, open_writer, max_open=DEFAULT_MAX_OPEN_FILES):
+        self.open_writer = open_writer
+        self.max_open = max(1, max_open)
+        self.writers = OrderedDict()
+        # Output file -> number of documents written, in creation order.
+        self.counts = OrderedDict()
+
+    def write(self, path, document):
+        writer = self.writers.get(path)
+        if writer is None:
+            if len(self.writers) >= self.max_open:
+                self.writers.popitem(last=False)[1].close()
+            writer = self.open_writer(path, path in self.counts)
+            self.writers[path] = writer
+        else:
+            self.writers.move_to_end(path)
+        writer.write(document)
+        self.counts[path] = self.counts.get(path, 0) + 1
+
+    def close(self):
+        while self.writers:
+            self.writers.popitem()[1].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_for_append(file_path):
+    """
+    Returns a file descriptor appending to file_path, created by
+    utils.create_secure_fd() beforehand.
+    """
+    return os.open(file_path, os.O_WRONLY | os.O_APPEND)
+
+
+def llvm_input_shard_dir(output_file):
+    """
+    Returns the directory of the per-source-file shards of the LLVM input
+    `output_file` (e.g. config.shards/ for config.yaml).
+    """
+    return os.path.splitext(output_file)[0] + ".shards"
+
+
 class IOManager(object):
 
     @abc.abstractmethod
     def build_llvm_input(self, configuration_data, task_map, output_file,
                          fixed_llvm_input=None, config_db=None,
-                         use_hash_matching=False):
+                         use_hash_matching=False, omit_baseline=False,
+                         shard_dir=None):
         pass
 
     @abc.abstractmethod
@@ -35,20 +175,48 @@ class IOManager(object):
         pass
 
     @abc.abstractmethod
-    def parse_llvm_inputs(self, input_files):
+    def parse_llvm_inputs(self, input_files, policy=None, prefer_file=None):
         pass
 
     @abc.abstractmethod
     def divide_llvm_input(self, input_file):
         pass
 
+    @abc.abstractmethod
+    def merge_llvm_input_files(self, input_files, output_file, policy=None,
+                               prefer_file=None):
+        """
+        Merge input_files into output_file one document at a time, keeping
+        one document per code region according to policy (MERGE_POLICIES)
+        if set; prefer_file is the preferred input file of "prefer".
+
+        Returns:
+            The DuplicateResolver statistics: a dict of the numbers of
+            documents "read", "written", and of "duplicates" and
+            "conflicts" dropped.
+        """
+        pass
+
+    @abc.abstractmethod
+    def divide_llvm_input_file(self, input_file, output_dir,
+                               max_open_files=DEFAULT_MAX_OPEN_FILES):
+        """
+        Divide input_file into one file per source file under output_dir,
+        one document at a time.
+
+        Returns:
+            A dict of output file -> number of documents written to it.
+        """
+        pass
+
     @abc.abstractmethod
     def generate_search_space_file(self, files, output_file, config_file,
                                    name_filter=None, func_name_filter=None,
                                    file_name_filter=None, type_filter=None,
                                    pass_filter=None, config_db=None,
                                    use_hash_matching=False,
-                                   use_prev_configs=False, inject_seed=False):
+                                   use_prev_configs=False, inject_seed=False,
+                                   pruning_thresholds=None):
         pass
 
     @abc.abstractmethod
@@ -56,7 +224,7 @@ class IOManager(object):
                               func_name_filter, name_filter, type_filter,
                               pass_filter, config_db=None,
                               use_hash_matching=False, use_prev_configs=False,
-                              inject_seed=False):
+                              inject_seed=False, pruning_thresholds=None):
         pass
 
     @abc.abstractmethod
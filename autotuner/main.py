@@ -5,21 +5,25 @@ Main functions for Autotuner's command-line interface
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
 import argparse
+import contextlib
 import glob
 import os
-import imp
+import shutil
 import sys
 from collections import OrderedDict
-from importlib import import_module
 
 from configparser import Error as ConfigParserError
 from configparser import ConfigParser
 
-import opentuner
-import autotuner.tuners.tunerbase as tunerbase
+# opentuner and the tuners are imported by the commands running a tuner
+# only, so that the other commands start fast.
+import autotuner.distributed as distributed
 import autotuner.utils as utils
-from autotuner.tuners.simple_tuner import SimpleTuner
+from autotuner import profiling
+from autotuner.tuners import plugins
+from autotuner.iomanager import DEFAULT_MAX_OPEN_FILES
 from autotuner.iomanager import EmptySearchSpaceError
+from autotuner.iomanager import MERGE_POLICIES
 from autotuner.iomanager import argument_parser
 from autotuner.iomanagerutils import create_io_manager
 
@@ -39,6 +43,27 @@ def _add_common_tuner_arguments(parser):
                         help="add existing llvm configuration input files as "
                              "constants in addition to the llvm configurations"
                              " generated in each iteration of the tuning run")
+    parser.add_argument('--profile-phases', nargs='?', const='',
+                        metavar='FILE',
+                        help='time the phases of each trial (input '
+                             'emission, compile, run...) into the JSON '
+                             'lines file FILE (default: ' +
+                             profiling.PHASE_TRACE_FILE + ' in the --output '
+                             'directory) and print a summary at the end of '
+                             'the run')
+
+
+def _add_profile_arguments(parser):
+    parser.add_argument('--profile-out', metavar='DIR',
+                        help='profile the command with cProfile into '
+                             'DIR/<command>-<N>.pstats (default: the '
+                             'directory of ' + profiling.PROFILE_OUT_ENV +
+                             ', if set)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='with --profile-out, also trace the memory '
+                             'allocations of the command with tracemalloc '
+                             'into DIR/<command>-<N>.memory.txt (or set ' +
+                             profiling.PROFILE_MEMORY_ENV + '=1)')
 
 
 def _add_common_parse_arguments(parser):
@@ -69,15 +94,22 @@ def get_args():
     subparsers = parser.add_subparsers(help='commands help', dest='command')
     subparsers.required = True
 
-    # create the the parser for the "run" command
-    argparsers = opentuner.argparsers()
-    argparsers.append(tunerbase.argument_parser)
+    # create the the parser for the "run" command; the options of opentuner
+    # and of the tuners are only added for the commands running a tuner.
+    if utils.requested_command(sys.argv[1:]) in ("run", "auto_run"):
+        import opentuner
+        import autotuner.tuners.tunerbase as tunerbase
+        argparsers = opentuner.argparsers()
+        argparsers.append(tunerbase.argument_parser)
+    else:
+        argparsers = []
     argparsers.append(argument_parser)
 
     run_parser = subparsers.add_parser('run',
                                        parents=argparsers,
                                        help='Run the tuner')
     _add_common_tuner_arguments(run_parser)
+    _add_profile_arguments(run_parser)
     run_parser.add_argument('-ss', '--search_space',
                             help='The search space file.')
     run_parser.add_argument('--enable-final-compile', action='store_true',
@@ -94,6 +126,16 @@ def get_args():
         help='LLVM configuration input files generated by LLVM')
     merge_parser.add_argument(
         '-o', '--output', metavar='FILE', help='output file')
+    merge_parser.add_argument(
+        '--deduplicate', nargs='?', const='first', choices=MERGE_POLICIES,
+        metavar='POLICY',
+        help='keep one remark per code region: the first one (default), '
+             'the last one, or prefer the remark of --prefer-file; '
+             'choices: ' + ', '.join(MERGE_POLICIES))
+    merge_parser.add_argument(
+        '--prefer-file', metavar='FILE',
+        help='input file whose remarks are kept by --deduplicate prefer')
+    _add_profile_arguments(merge_parser)
 
     # create the parser for the "divide" command
     divide_parser = subparsers.add_parser('divide', parents=[argument_parser],
@@ -104,6 +146,12 @@ def get_args():
         'input_file', help='LLVM configuration input file generated by LLVM')
     divide_parser.add_argument(
         '-o', '--output_dir', metavar='DIR', help='output dir', default='./')
+    divide_parser.add_argument(
+        '--max-open-files', metavar='N', type=int,
+        default=DEFAULT_MAX_OPEN_FILES,
+        help='maximum number of output files kept open while dividing '
+             '(default: %(default)s)')
+    _add_profile_arguments(divide_parser)
 
     # create the parser for the "parse" command
     gsc_parser = subparsers.add_parser('parse', parents=[
@@ -121,6 +169,7 @@ def get_args():
                                  ' generating search space',
                             choices=['machine_basic_block', 'loop', 'function',
                                      'module'])
+    _add_profile_arguments(gsc_parser)
 
     # create the the parser for the "auto_run" command
     auto_run_parser = subparsers.add_parser('auto_run',
@@ -141,6 +190,26 @@ def get_args():
 
     _add_common_parse_arguments(auto_run_parser)
     _add_common_tuner_arguments(auto_run_parser)
+    _add_profile_arguments(auto_run_parser)
+
+    # create the parser for the "worker" command
+    worker_parser = subparsers.add_parser(
+        'worker', help='Run an evaluation worker for a tuning run started '
+                       'with --workers')
+    worker_parser.add_argument(
+        'config_file', help='The config file of the build tree of this '
+                            'worker.')
+    worker_parser.add_argument('--coordinator', required=True,
+                               metavar='HOST:PORT',
+                               help='the --listen address of the tuning run')
+    worker_parser.add_argument('--token-file', metavar='FILE',
+                               help='read the token of the tuning run from '
+                                    'FILE (default: the {} environment '
+                                    'variable)'.format(distributed.TOKEN_ENV))
+    worker_parser.add_argument('--build-dir', metavar='DIR',
+                               help='use DIR as CompileDir; CompileDir is '
+                                    'copied into DIR if it does not exist')
+    _add_profile_arguments(worker_parser)
 
     args = parser.parse_args()
 
@@ -150,9 +219,11 @@ def get_args():
 def _parse_common_options(args):
     if args.list_tuners:
         print("Available tuners: " +
-              str(tunerbase.get_available_tuners(args.plugin_dir)))
+              str(plugins.get_available_tuners(args.plugin_dir)))
         sys.exit(0)
 
+    import opentuner
+    from autotuner.tuners.simple_tuner import SimpleTuner
     if args.list_techniques:
         techniques, _ = opentuner.search.technique.all_techniques()
         for technique in techniques:
@@ -171,21 +242,12 @@ def _parse_common_options(args):
 
     if args.tuner:
         try:
-            if args.plugin_dir:
-                if not os.path.isdir(args.plugin_dir):
-                    raise IOError("Error: " + args.plugin_dir + " not found")
-                module_file = os.path.join(args.plugin_dir, args.tuner + ".py")
-                if not os.path.isfile(module_file):
-                    raise IOError("Error: " + module_file + " not found")
-                module = imp.load_source(args.tuner, module_file)
-            else:
-                module = import_module("autotuner.tuners." + args.tuner)
-            tuner = getattr(module, 'Tuner')
+            tuner = plugins.load_tuner(args.tuner, args.plugin_dir)
         except ImportError as error:
             print(error)
             print("Please select a valid tuner name.")
             print("Available tuners: " +
-                  str(tunerbase.get_available_tuners(args.plugin_dir)))
+                  str(plugins.get_available_tuners(args.plugin_dir)))
             sys.exit(-1)
     else:
         tuner = SimpleTuner
@@ -197,22 +259,26 @@ def _parse_common_options(args):
             except OSError as error:
                 raise error
 
+    return tuner, _read_config(args.config_file)
+
+
+def _read_config(config_file):
     # parse ini config file
-    if not os.path.isfile(args.config_file):
+    if not os.path.isfile(config_file):
         raise IOError("Error: config file not found")
 
     # check file permissions
-    utils.check_file_permissions(args.config_file)
+    utils.check_file_permissions(config_file)
 
     config = ConfigParser()
     config.optionxform = str
     config["DEFAULT"]["ConfigFilePath"] = os.path.abspath(
-        os.path.dirname(args.config_file))
-    config.read(args.config_file)
+        os.path.dirname(config_file))
+    config.read(config_file)
     # set up system environment
     if config.has_section("Environment Setting"):
         _setup_env(config["Environment Setting"])
-    return tuner, config
+    return config
 
 
 def _setup_env(environment_section):
@@ -229,6 +295,167 @@ def _setup_env(environment_section):
             os.environ[key] = os.pathsep.join(path_list)
 
 
+def _parse_fidelity_run_cmds(compile_section):
+    """
+    Returns the run commands listed one per line in FidelityRunCommands,
+    from the cheapest to the most expensive one (RunCommand excluded).
+    """
+    value = compile_section.get("FidelityRunCommands", "")
+    return [cmd.strip() for cmd in value.splitlines() if cmd.strip()]
+
+
+def _parse_metric_setting(config):
+    """
+    Returns the options of the [Metric Setting] section used by the
+    declarative tuner, or None if there is no such section.
+    """
+    if not config.has_section("Metric Setting"):
+        return None
+    return dict(config["Metric Setting"])
+
+
+def _isolate_cpus(args):
+    """
+    Keep the CPU sets of runs and compilations apart, and run the tuner
+    itself on the compilation CPUs.
+    """
+    args.run_cpus, args.compile_cpus = utils.isolate_cpus(args.run_cpus,
+                                                          args.compile_cpus)
+    if args.compile_cpus:
+        os.sched_setaffinity(0, args.compile_cpus)
+    if args.run_cpus:
+        print("Pinning runs to CPUs {} and compilations to CPUs {}".format(
+            utils.format_cpu_list(args.run_cpus),
+            utils.format_cpu_list(args.compile_cpus)
+            if args.compile_cpus else "(not pinned)"))
+
+
+def _start_coordinator(args):
+    """
+    Returns a Coordinator with --workers connected, or None without
+    --workers.
+    """
+    if not args.workers:
+        return None
+    coordinator = distributed.Coordinator(
+        distributed.parse_address(args.listen), retries=args.worker_retries,
+        token=os.environ.get(distributed.TOKEN_ENV))
+    host, port = coordinator.address
+    if not args.local_workers and \
+            distributed.TOKEN_ENV not in os.environ:
+        # Remote workers read the generated token with --token-file.
+        output_dir = args.output or "."
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        token_file = os.path.join(output_dir, distributed.TOKEN_FILE)
+        with os.fdopen(utils.create_secure_fd(token_file), "w") as file:
+            file.write(coordinator.token)
+        print("The token of the workers is in {}".format(token_file))
+    if args.local_workers:
+        build_root = os.path.join(args.output or ".", "workers")
+        coordinator.spawn_local_workers(os.path.abspath(args.config_file),
+                                        args.workers,
+                                        os.path.abspath(build_root))
+    print("Waiting for {} worker(s) on {}:{}".format(args.workers, host,
+                                                     port))
+    try:
+        if not coordinator.wait_for_workers(args.workers,
+                                            args.worker_timeout):
+            raise distributed.WorkerError(
+                "only {} of {} worker(s) connected after {}s".format(
+                    len(coordinator.workers), args.workers,
+                    args.worker_timeout))
+    except distributed.WorkerError:
+        coordinator.close()
+        raise
+    # Run as many trials per generation as there are workers.
+    args.parallelism = args.workers
+    return coordinator
+
+
+@contextlib.contextmanager
+def _profile_phases(args):
+    """
+    Time the phases of the tuning run with --profile-phases, and print their
+    summary at the end of the run.
+    """
+    if args.profile_phases is None:
+        yield
+        return
+    trace_file = args.profile_phases or os.path.join(
+        args.output or ".", profiling.PHASE_TRACE_FILE)
+    profiling.enable(trace_file)
+    try:
+        yield
+    finally:
+        profiler = profiling.disable()
+        if profiler.phases:
+            print(profiler.summary())
+        if profiler.iterations:
+            print("Phase trace of the trials written to " + trace_file)
+
+
+@contextlib.contextmanager
+def _profile_command(args):
+    """
+    Profile the command with --profile-out (or AUTOTUNE_PROFILE_OUT).
+    """
+    path = None
+    try:
+        with profiling.command_profile(args.command, args.profile_out,
+                                       args.profile_memory) as path:
+            yield
+    finally:
+        if path:
+            print("Profile of the command written to " + path + ".pstats")
+            if os.path.isfile(path + ".memory.txt"):
+                print("Memory allocations of the command written to " +
+                      path + ".memory.txt")
+
+
+def _read_worker_token(args):
+    """
+    The token of the tuning run, from --token-file or the environment.
+    """
+    if args.token_file:
+        utils.check_file_permissions(args.token_file)
+        with open(args.token_file) as file:
+            token = file.read().strip()
+    else:
+        token = os.environ.get(distributed.TOKEN_ENV, "")
+    if not token:
+        raise distributed.WorkerError(
+            "no token: use --token-file or set {}".format(
+                distributed.TOKEN_ENV))
+    return token
+
+
+def worker_main(args):
+    """
+    main program for worker command
+    """
+    config = _read_config(args.config_file)
+    compile_section = config["Compiling Setting"]
+    if args.build_dir:
+        build_dir = os.path.abspath(args.build_dir)
+        if not os.path.exists(build_dir):
+            shutil.copytree(
+                os.path.expanduser(compile_section["CompileDir"]), build_dir,
+                symlinks=True)
+        # Settings derived from CompileDir follow it.
+        compile_section["CompileDir"] = build_dir
+    settings = {key: compile_section[key] for key in
+                distributed.COMMAND_KEYS + distributed.DIRECTORY_KEYS}
+    settings["CompileDir"] = os.path.expanduser(settings["CompileDir"])
+    settings["LLVMInputFile"] = os.path.expanduser(
+        compile_section["LLVMInputFile"])
+    for index, cmd in enumerate(_parse_fidelity_run_cmds(compile_section)):
+        settings["FidelityRunCommands[{}]".format(index)] = cmd
+    distributed.serve(distributed.parse_address(args.coordinator), settings,
+                      _read_worker_token(args))
+    sys.exit(0)
+
+
 def _clean_opp(opp_dir):
     files = glob.glob(opp_dir + "/*")
     for ele in files:
@@ -246,12 +473,14 @@ def divide_main(args):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    max_open_files = args.max_open_files
+    if max_open_files < 1:
+        print("Auto-tuner divide: warning: --max-open-files must be at "
+              "least 1, using {}".format(DEFAULT_MAX_OPEN_FILES))
+        max_open_files = DEFAULT_MAX_OPEN_FILES
+
     print("Dividing LLVM configuration input file: " + str(input_file))
-    file_map = iomanager.divide_llvm_input(input_file)
-    for file_name in file_map:
-        basename = os.path.basename(file_name) + iomanager.get_file_extension()
-        output_path = os.path.join(output_dir, basename)
-        iomanager.output_to_file(output_path, file_map[file_name])
+    iomanager.divide_llvm_input_file(input_file, output_dir, max_open_files)
     print("The divided files have been generated under: " + output_dir)
     sys.exit(0)
 
@@ -267,9 +496,26 @@ def merge_main(args):
             output_file = args.output
         else:
             output_file = "merged_input" + iomanager.get_file_extension()
+        policy = args.deduplicate
+        prefer_file = args.prefer_file
+        if policy == "prefer" and not prefer_file:
+            print("Auto-tuner merge: warning: --deduplicate prefer requires "
+                  "--prefer-file, keeping the first remarks")
+            policy = "first"
+        elif prefer_file and policy != "prefer":
+            print("Auto-tuner merge: warning: --prefer-file is only used by "
+                  "--deduplicate prefer, ignoring it")
+            prefer_file = None
+        elif prefer_file and os.path.realpath(prefer_file) not in [
+                os.path.realpath(input_file) for input_file in input_files]:
+            print("Auto-tuner merge: warning: --prefer-file " + prefer_file +
+                  " is not an input file")
         print("Merging LLVM configuration input files: " + str(input_files))
-        content = iomanager.parse_llvm_inputs(input_files)
-        iomanager.output_to_file(output_file, content)
+        stats = iomanager.merge_llvm_input_files(
+            input_files, output_file, policy=policy, prefer_file=prefer_file)
+        print("Merged {read} input(s): {written} written, {duplicates} "
+              "duplicate(s) and {conflicts} conflict(s) dropped".format(
+                  **stats))
         print("The merged file has been generated: " + output_file)
         sys.exit(0)
 
@@ -326,15 +572,28 @@ def run_main(args):
     compile_dir = os.path.expanduser(compile_section["CompileDir"])
     compile_cmd = compile_section["CompileCommand"]
 
+    import opentuner
     opentuner.init_logging()
 
-    tuner.main(args, compile_dir=compile_dir, program_name=args.config_file,
-               llvm_config_file=llvm_config_file,
-               fixed_llvm_config_files=args.add_llvm_inputs,
-               enable_final_compile=args.enable_final_compile,
-               search_space=args.search_space,
-               run_dir=compile_section["RunDir"],
-               run_cmd=compile_section["RunCommand"], compile_cmd=compile_cmd)
+    _isolate_cpus(args)
+    coordinator = _start_coordinator(args)
+    try:
+        tuner.main(args, compile_dir=compile_dir,
+                   program_name=args.config_file,
+                   llvm_config_file=llvm_config_file,
+                   fixed_llvm_config_files=args.add_llvm_inputs,
+                   enable_final_compile=args.enable_final_compile,
+                   search_space=args.search_space,
+                   run_dir=compile_section["RunDir"],
+                   run_cmd=compile_section["RunCommand"],
+                   compile_cmd=compile_cmd,
+                   fidelity_run_cmds=_parse_fidelity_run_cmds(
+                       compile_section),
+                   metric_setting=_parse_metric_setting(config),
+                   coordinator=coordinator)
+    finally:
+        if coordinator:
+            coordinator.close()
 
 
 def auto_run_main(args):
@@ -366,50 +625,61 @@ def auto_run_main(args):
     opp_compile_cmd = compile_section["OppCompileCommand"]
     opp_dir = os.path.expanduser(compile_section["OppDir"])
 
+    import opentuner
     opentuner.init_logging()
 
-    # clean llvm input file if there is existing one already
+    _isolate_cpus(args)
+    coordinator = _start_coordinator(args)
     try:
-        os.remove(llvm_config_file)
-    except OSError:
-        pass
+        # clean llvm input file if there is existing one already
+        try:
+            os.remove(llvm_config_file)
+        except OSError:
+            pass
 
-    # remove duplicates elements
-    stages = list(OrderedDict.fromkeys(args.stage_order))
+        # remove duplicates elements
+        stages = list(OrderedDict.fromkeys(args.stage_order))
 
-    # phases
-    stages_info_str = ", ".join(stages)
+        # phases
+        stages_info_str = ", ".join(stages)
 
-    print("Running tuning with the stage order: {:s}".format(stages_info_str))
+        print("Running tuning with the stage order: {:s}"
+              .format(stages_info_str))
 
-    for index, phase in enumerate(stages):
-        if is_first_stage:
-            fixed_llvm_config_files = args.add_llvm_inputs
-            # create a dummy llvm config file for the first stage
-            # to avoid the compiler's file-not-found error.
-            iomanager.create_dummy_llvm_input(llvm_config_file)
-        else:
-            fixed_llvm_config_files = [llvm_config_file]
-
-        print("=== Starting stage {:d}: {:s} level tuning ==="
-              .format(index + 1, phase))
-        search_space_tree = _generate_search_space(args, compile_dir,
-                                                   iomanager, opp_compile_cmd,
-                                                   opp_dir, phase)
-        if search_space_tree is None:
-            break
-        try:
-            tuner.main(args, compile_dir=compile_dir,
-                       llvm_config_file=llvm_config_file,
-                       enable_final_compile=True,
-                       fixed_llvm_config_files=fixed_llvm_config_files,
-                       search_space=search_space_tree,
-                       run_dir=run_dir,
-                       run_cmd=run_cmd, compile_cmd=compile_cmd,
-                       stage=phase)
-            is_first_stage = False
-        except EmptySearchSpaceError:
-            print('Empty search space, stop the current stage')
+        for index, phase in enumerate(stages):
+            if is_first_stage:
+                fixed_llvm_config_files = args.add_llvm_inputs
+                # create a dummy llvm config file for the first stage
+                # to avoid the compiler's file-not-found error.
+                iomanager.create_dummy_llvm_input(llvm_config_file)
+            else:
+                fixed_llvm_config_files = [llvm_config_file]
+
+            print("=== Starting stage {:d}: {:s} level tuning ==="
+                  .format(index + 1, phase))
+            search_space_tree = _generate_search_space(
+                args, compile_dir, iomanager, opp_compile_cmd, opp_dir, phase)
+            if search_space_tree is None:
+                break
+            try:
+                tuner.main(args, compile_dir=compile_dir,
+                           llvm_config_file=llvm_config_file,
+                           enable_final_compile=True,
+                           fixed_llvm_config_files=fixed_llvm_config_files,
+                           search_space=search_space_tree,
+                           run_dir=run_dir,
+                           run_cmd=run_cmd, compile_cmd=compile_cmd,
+                           fidelity_run_cmds=_parse_fidelity_run_cmds(
+                               compile_section),
+                           metric_setting=_parse_metric_setting(config),
+                           coordinator=coordinator,
+                           stage=phase)
+                is_first_stage = False
+            except EmptySearchSpaceError:
+                print('Empty search space, stop the current stage')
+    finally:
+        if coordinator:
+            coordinator.close()
 
 
 def _generate_search_space(args, compile_dir, iomanager, opp_compile_cmd,
@@ -417,8 +687,10 @@ def _generate_search_space(args, compile_dir, iomanager, opp_compile_cmd,
     # before generating search space
     # clean the opp dir in case it is not empty
     _clean_opp(opp_dir)
-    result = opentuner.MeasurementInterface(args).call_program(
-        cmd=opp_compile_cmd, cwd=compile_dir)
+    import opentuner
+    with profiling.phase("opp_compile"):
+        result = opentuner.MeasurementInterface(args).call_program(
+            cmd=opp_compile_cmd, cwd=compile_dir)
     if result['returncode'] != 0:
         print("Failed to generate tuning opportunities, the error was:")
         print(result['stderr'])
@@ -444,31 +716,36 @@ def _generate_search_space(args, compile_dir, iomanager, opp_compile_cmd,
 def main():
     args = get_args()
     try:
-        # if the sub-command merge is called
-        if args.command == "merge":
-            merge_main(args)
-        if args.command == "divide":
-            divide_main(args)
-        # if the sub-command parse is called
-        if args.command == "parse":
-            parse_main(args)
-        # if the sub-command run is called
-        elif args.command == "run":
-            try:
-                run_main(args)
-            except EmptySearchSpaceError:
-                print('Empty search space, stop tuning')
-
-        # if the sub-command auto_run is called
-        else:
-            auto_run_main(args)
+        with _profile_command(args):
+            # if the sub-command merge is called
+            if args.command == "merge":
+                merge_main(args)
+            if args.command == "divide":
+                divide_main(args)
+            # if the sub-command parse is called
+            if args.command == "parse":
+                parse_main(args)
+            # if the sub-command run is called
+            elif args.command == "run":
+                try:
+                    with _profile_phases(args):
+                        run_main(args)
+                except EmptySearchSpaceError:
+                    print('Empty search space, stop tuning')
+            elif args.command == "worker":
+                worker_main(args)
+
+            # if the sub-command auto_run is called
+            else:
+                with _profile_phases(args):
+                    auto_run_main(args)
 
     except ConfigParserError as error:
         print('Failed to parse your configuration file: ' + args.config_file)
         print(error)
         exit(1)
 
-    except (OSError, IOError) as error:
+    except (OSError, IOError, distributed.WorkerError) as error:
         print('Failed to execute command "' + args.command + '". ')
         print(error)
         exit(1)
@@ -476,3 +753,7 @@ def main():
     except Exception as error:
         print('Failed to execute command "' + args.command + '". ')
         raise
+
+
+if __name__ == '__main__':
+    main()
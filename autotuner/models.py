@@ -3,6 +3,15 @@
 Autotuner Models
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
+from collections import namedtuple
+
+# How a parameter of a Task is written to the LLVM input, built once when
+# the search space is parsed: `raw_name` is the name of the parameter
+# without its tuning id, `emit(output, raw_name, value)` writes the value of
+# the parameter in a configuration and `seed(param, raw_name, args)`
+# returns its value in the stored arguments `args`.
+ParamEncoder = namedtuple("ParamEncoder", ["param", "raw_name", "emit",
+                                           "seed"])
 
 
 class LegacyCodeRegion(object):
@@ -100,10 +109,16 @@ class Task(object):
     A representation of a tuning task
     """
 
-    def __init__(self, tuning_id, param_list, code_region):
+    def __init__(self, tuning_id, param_list, code_region, encoders=None,
+                 baseline=None):
         self.tuning_id = tuning_id
         self.param_list = param_list
         self.code_region = code_region
+        # The ParamEncoder of each parameter of param_list.
+        self.encoders = encoders
+        # Parameter name -> decision of the compiler without tuning, for
+        # the parameters in the BaselineConfig of the code region.
+        self.baseline = baseline
 
     def __repr__(self):
         return str(self.tuning_id) + str(self.param_list) + str(
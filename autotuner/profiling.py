@@ -0,0 +1,411 @@
+# coding=utf-8
+"""
+Timers and counters of the phases of tuning iterations (--profile-phases).
+
+The phases of the hot paths (opportunity parsing, config database work,
+search space parsing, manipulator creation, technique proposal, input
+emission, compile, run, state serialization...) are timed with phase() or
+timed(), and counted with count(). Nested phases are timed inclusively.
+When profiling is not enabled, phase() returns a shared no-op context
+manager and timed() functions are called directly.
+
+Each iteration() (a trial of 'auto-tuner run', an 'llvm-autotune'
+command) is written as a JSON line to the trace file:
+
+    {"iteration": 3, "wall": 1.92, "phases": {"compile": [1, 1.5], ...},
+     "counters": {"input_regions": 80, ...}, "trial": 12, "state": "OK"}
+
+with [calls, seconds] per phase; summary() formats the totals as a table.
+
+command_profile() runs a command under cProfile (--profile-out DIR or
+AUTOTUNE_PROFILE_OUT), and optionally tracemalloc (--profile-memory or
+AUTOTUNE_PROFILE_MEMORY), taking a snapshot at the end of the first call of
+each outermost phase. It writes <command>-<iteration>.pstats, for pstats
+or snakeviz, and <command>-<iteration>.memory.txt into DIR.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import contextlib
+import cProfile
+import functools
+import json
+import logging
+import marshal
+import os
+import re
+import stat
+import threading
+import time
+import tracemalloc
+
+from autotuner.utils import create_secure_fd
+
+log = logging.getLogger(__name__)
+
+PHASE_TRACE_FILE = "phases.jsonl"
+PROFILE_OUT_ENV = "AUTOTUNE_PROFILE_OUT"
+PROFILE_MEMORY_ENV = "AUTOTUNE_PROFILE_MEMORY"
+# Allocation sites listed in the memory reports.
+TOP_ALLOCATIONS = 25
+
+_PROFILE_NAME = re.compile(r'^.+-(\d+)\.pstats$')
+
+_NO_PHASE = contextlib.nullcontext()
+# The enabled PhaseProfiler, if any.
+_profiler = None
+
+
+class PhaseProfiler(object):
+    """
+    Totals of the phases and counters of a run, and the records of the
+    iterations in progress, one per thread.
+    """
+
+    def __init__(self, trace_file=None, append=False):
+        self.trace_file = trace_file
+        self.append = append
+        self.start = time.perf_counter()
+        # phase -> [calls, seconds]
+        self.phases = {}
+        self.counters = {}
+        self.iterations = 0
+        # Iterations already in the trace file appended to.
+        self._traced = 0
+        self._trace = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Called with the name of every outermost phase that ends.
+        self.on_phase_end = None
+
+    def add(self, name, seconds):
+        record = getattr(self._local, "record", None)
+        with self._lock:
+            total = self.phases.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+        if record is not None:
+            total = record["phases"].setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+
+    def count(self, name, value=1):
+        record = getattr(self._local, "record", None)
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if record is not None:
+            record["counters"][name] = \
+                record["counters"].get(name, 0) + value
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            self._local.depth = depth
+            if depth == 0 and self.on_phase_end is not None:
+                self.on_phase_end(name)
+
+    @contextlib.contextmanager
+    def iteration(self, fields):
+        outer = getattr(self._local, "record", None)
+        record = {"phases": {}, "counters": {}}
+        record.update(fields)
+        self._local.record = record
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self._local.record = outer
+            record["wall"] = time.perf_counter() - start
+            self._write(record)
+
+    def _write(self, record):
+        with self._lock:
+            self.iterations += 1
+            if self.trace_file is None:
+                return
+            # Profiling must not fail the run: tracing stops on errors.
+            try:
+                if self._trace is None:
+                    self._trace = self._open_trace()
+                line = dict(iteration=self._traced + self.iterations,
+                            **record)
+                self._trace.write(json.dumps(line, sort_keys=True) + "\n")
+                self._trace.flush()
+            except (OSError, TypeError, ValueError) as error:
+                log.warning("Cannot write the phase trace %s: %s",
+                            self.trace_file, error)
+                self.trace_file = None
+
+    def _open_trace(self):
+        if not self.append:
+            return os.fdopen(create_secure_fd(self.trace_file), "w")
+        if os.path.isfile(self.trace_file):
+            # Number the iterations after those of the trace.
+            with open(self.trace_file) as trace:
+                self._traced = sum(1 for line in trace if line.strip())
+        # Only writable by the user, as by create_secure_fd().
+        return os.fdopen(os.open(self.trace_file,
+                                 os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                 stat.S_IWUSR | stat.S_IRUSR), "a")
+
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+    def summary(self):
+        return format_summary(self.phases, self.counters,
+                              time.perf_counter() - self.start,
+                              self.iterations)
+
+
+def enable(trace_file=None, append=False):
+    """
+    Start profiling the phases, writing the iterations to trace_file (if
+    set), appended to it if append. Returns the PhaseProfiler.
+    """
+    global _profiler
+    previous = disable()
+    _profiler = PhaseProfiler(trace_file, append)
+    if previous is not None:
+        # Keep the memory snapshots of command_profile() going.
+        _profiler.on_phase_end = previous.on_phase_end
+    return _profiler
+
+
+def disable():
+    """
+    Stop profiling the phases. Returns the PhaseProfiler that was enabled,
+    if any.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.close()
+    return profiler
+
+
+def phase(name):
+    """
+    A context manager timing the phase `name`.
+    """
+    if _profiler is None:
+        return _NO_PHASE
+    return _profiler.phase(name)
+
+
+def timed(name):
+    """
+    Decorator timing the calls of a function as the phase `name`.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """
+    Add value to the counter `name`.
+    """
+    if _profiler is not None:
+        _profiler.count(name, value)
+
+
+def iteration(**fields):
+    """
+    A context manager recording the phases and counters of an iteration of
+    the current thread; the iteration is written to the trace file with
+    `fields` when it ends. The record (a dict) can be updated meanwhile.
+    """
+    if _profiler is None:
+        return contextlib.nullcontext({})
+    return _profiler.iteration(fields)
+
+
+def load_trace(trace_file):
+    """
+    Returns the (phases, counters, wall time, iterations) totals of the
+    iterations of a trace file.
+    """
+    phases = {}
+    counters = {}
+    wall = 0.0
+    iterations = 0
+    with open(trace_file) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            iterations += 1
+            wall += record.get("wall", 0.0)
+            for name, (calls, seconds) in record["phases"].items():
+                total = phases.setdefault(name, [0, 0.0])
+                total[0] += calls
+                total[1] += seconds
+            for name, value in record["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+    return phases, counters, wall, iterations
+
+
+def format_summary(phases, counters, wall, iterations):
+    """
+    Format the totals of the phases and counters as a table, from the most
+    to the least expensive phase. Nested phases are timed inclusively, so
+    the percentages of the wall time may add up to more than 100%.
+    """
+    lines = ["Phase timings over {} iteration(s), {:.3f}s wall time:".format(
+        iterations, wall),
+        "{:<28} {:>8} {:>11} {:>11} {:>7}".format(
+            "phase", "calls", "total (s)", "mean (ms)", "wall %")]
+    for name, (calls, seconds) in sorted(phases.items(),
+                                         key=lambda item: -item[1][1]):
+        lines.append("{:<28} {:>8} {:>11.3f} {:>11.3f} {:>7.1f}".format(
+            name, calls, seconds, 1000 * seconds / calls,
+            100 * seconds / wall if wall else 0.0))
+    if counters:
+        lines.append("{:<28} {:>8}".format("counter", "value"))
+        for name in sorted(counters):
+            lines.append("{:<28} {:>8}".format(name, counters[name]))
+    return "\n".join(lines)
+
+
+class _MemoryTracer(object):
+    """
+    Traces the allocations of a command with tracemalloc: the traced memory
+    at the end of every outermost phase, and a snapshot at the end of the
+    first call of each of them.
+    """
+
+    def __init__(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        self._lock = threading.Lock()
+        # (phase, current bytes, peak bytes) at the end of the phases.
+        self.boundaries = []
+        self.snapshots = [("start", self._snapshot())]
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False,
+                               "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>")])
+
+    def phase_end(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self.boundaries.append((name, current, peak))
+            if name not in (phase for phase, _ in self.snapshots):
+                self.snapshots.append((name, self._snapshot()))
+
+    def stop(self):
+        """
+        Returns the report of the allocations, and stops tracing.
+        """
+        self.snapshots.append(("end", self._snapshot()))
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started:
+            tracemalloc.stop()
+        mib = 1024.0 * 1024.0
+        lines = ["Traced memory: {:.1f} MiB at the end, {:.1f} MiB "
+                 "peak".format(current / mib, peak / mib)]
+        if self.boundaries:
+            lines += ["", "{:<28} {:>13} {:>13}".format(
+                "end of phase", "current (MiB)", "peak (MiB)")]
+        for name, phase_current, phase_peak in self.boundaries:
+            lines.append("{:<28} {:>13.1f} {:>13.1f}".format(
+                name, phase_current / mib, phase_peak / mib))
+        lines += ["", "Top {} allocation sites at the end:".format(
+            TOP_ALLOCATIONS)]
+        lines += [str(statistic) for statistic in self.snapshots[-1][
+            1].statistics("lineno")[:TOP_ALLOCATIONS]]
+        for (_, previous), (name, snapshot) in zip(self.snapshots,
+                                                   self.snapshots[1:]):
+            lines += ["", "Top allocation growth up to the end of {}:".format(
+                name)]
+            lines += [str(statistic) for statistic in snapshot.compare_to(
+                previous, "lineno")[:TOP_ALLOCATIONS // 2]]
+        return "\n".join(lines) + "\n"
+
+
+def _reserve_profile_path(out_dir, command):
+    """
+    Returns the path (without extension) of the profile of the next
+    iteration of `command` in out_dir, numbered after the profiles of every
+    command there, and creates its .pstats file.
+    """
+    iteration = max([int(match.group(1)) for match in map(
+        _PROFILE_NAME.match, os.listdir(out_dir)) if match] + [0])
+    while True:
+        iteration += 1
+        path = os.path.join(out_dir, "{}-{:04d}".format(command, iteration))
+        try:
+            os.close(os.open(path + ".pstats",
+                             os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                             stat.S_IWUSR | stat.S_IRUSR))
+            return path
+        except FileExistsError:
+            # Another invocation took this number.
+            continue
+
+
+def command_profile(command, out_dir=None, memory=False):
+    """
+    A context manager running `command` under cProfile and, if memory,
+    tracemalloc, when out_dir (or AUTOTUNE_PROFILE_OUT) is set; a no-op
+    context manager otherwise. AUTOTUNE_PROFILE_MEMORY also enables
+    tracemalloc.
+    """
+    out_dir = out_dir or os.environ.get(PROFILE_OUT_ENV)
+    if not out_dir:
+        return contextlib.nullcontext()
+    memory = memory or os.environ.get(PROFILE_MEMORY_ENV, "") not in (
+        "", "0")
+    return _command_profile(command, out_dir, memory)
+
+
+@contextlib.contextmanager
+def _command_profile(command, out_dir, memory):
+    global _profiler
+    os.makedirs(out_dir, exist_ok=True)
+    path = _reserve_profile_path(out_dir, command)
+    tracer = own_profiler = None
+    if memory:
+        tracer = _MemoryTracer()
+        # Phases are needed for the snapshots, but not their trace.
+        if _profiler is None:
+            own_profiler = _profiler = PhaseProfiler()
+        _profiler.on_phase_end = tracer.phase_end
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield path
+    finally:
+        profile.disable()
+        if tracer is not None:
+            # Before building the stats, whose allocations are traced too.
+            if _profiler is not None:
+                _profiler.on_phase_end = None
+            if own_profiler is not None and _profiler is own_profiler:
+                _profiler = None
+            with os.fdopen(create_secure_fd(path + ".memory.txt"),
+                           "w") as file:
+                file.write(tracer.stop())
+        profile.create_stats()
+        # The same format as Profile.dump_stats().
+        with os.fdopen(create_secure_fd(path + ".pstats"), "wb") as file:
+            marshal.dump(profile.stats, file)
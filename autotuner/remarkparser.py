@@ -23,14 +23,26 @@ class AutoTuning(Remark):
             key_tuple += (self.DebugLoc,)
         return key_tuple
 
+    @property
+    def region_key(self):
+        """
+        The key of the code region the remark configures: key without
+        Args, shared by remarks configuring a code region differently.
+        """
+        key_tuple = super().key + (self.CodeRegionType, self.Pass)
+        if hasattr(self, "DebugLoc"):
+            key_tuple += (self.DebugLoc,)
+        return key_tuple
 
-def get_remarks(input_file):
-    all_remarks = []
 
+def iter_remarks(input_file):
+    """
+    Yields the remarks of input_file one document at a time.
+    """
     with open(input_file) as input_file_handler:
-        docs = yaml.load_all(input_file_handler, Loader=Loader)
+        for remark in yaml.load_all(input_file_handler, Loader=Loader):
+            yield remark
 
-        for remark in docs:
-            all_remarks.append(remark)
 
-    return all_remarks
+def get_remarks(input_file):
+    return list(iter_remarks(input_file))
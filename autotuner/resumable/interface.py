@@ -8,12 +8,17 @@ import logging
 import os
 import random
 import types
+import uuid
 import dill as pickle # Use dill because it supports lambda functions.
 
+from autotuner import profiling
+from autotuner.dbutils import clear_config_db
 from autotuner.dbutils import create_config_db_session
 from autotuner.iomanager import EmptySearchSpaceError
+from autotuner.iomanager import llvm_input_shard_dir
 from autotuner.iomanagerutils import create_io_manager
 from autotuner.resumable.run_manager import ResumableRunManager
+from autotuner.search.decomposed import configure_decomposed_search
 from autotuner.utils import create_secure_fd
 from autotuner.utils import check_file_permissions
 from opentuner import ConfigurationManipulator
@@ -60,6 +65,17 @@ class AutoTunerState:
             self.use_prev_configs = True
             self.inject_seed = True
 
+        if getattr(args, "use_similar_configs", False) \
+            and args.use_optimal_configs != "retune":
+            args.use_similar_configs = False
+            log.warning("'use-optimal-configs=retune' must be enabled to "
+                        "seed from similar configurations! Disabling "
+                        "use-similar-configs.")
+
+        if getattr(args, "decompose", None):
+            # The decomposed search keeps its own per-group searches.
+            args.technique = ["DecomposedSearch"]
+
         if "CONFIG_DB_DIR" in os.environ:
             self.config_db_dir = os.environ["CONFIG_DB_DIR"]
         else:
@@ -67,8 +83,13 @@ class AutoTunerState:
             log.warning("Environment variable CONFIG_DB_DIR is not set; "
                         "a default directory is used for saving the "
                         "config database: %s", self.config_db_dir)
+        # Identifies the code regions of this run in the config database,
+        # which other runs may share.
+        self.config_db_run_id = uuid.uuid4().hex
         # Always create config_db since program-params need it.
-        self.config_db = create_config_db_session(self.config_db_dir)
+        self.config_db = create_config_db_session(
+            self.config_db_dir, self.config_db_run_id,
+            getattr(args, "workload", ""))
 
         # Init search space.
         search_space = self._init_search_space()
@@ -101,8 +122,12 @@ class AutoTunerState:
             # found otherwise assign random values and store the seed baseline
             # in 'initial_config.json' and forward its path to OpenTuner.
             # This file will act as initial seed configurations for OpenTuner.
+            similar_config_threshold = None
+            if getattr(self.args, "use_similar_configs", False):
+                similar_config_threshold = self.args.similar_config_threshold
             seed_config = self.iomanager.seed_baseline(self.task_map,
-                self.config_db, os.path.join(data_dir, "initial_config.json"))
+                self.config_db, os.path.join(data_dir, "initial_config.json"),
+                similar_config_threshold)
             self.args.seed_configuration.append(seed_config)
             log.info("Seed configuration injected to the AutoTuner.")
 
@@ -122,7 +147,10 @@ class AutoTunerState:
     def __setstate__(self, state):
         self.__dict__.update(state)
         # Since introducing program-param, config_db is always created.
-        self.config_db = create_config_db_session(self.config_db_dir)
+        # States saved by older versions use the code regions of run "".
+        self.config_db = create_config_db_session(
+            self.config_db_dir, self.__dict__.get("config_db_run_id", ""),
+            getattr(self.args, "workload", ""))
         # Do not re-seed if the state is being loaded.
         self.args.seed_configuration = []
 
@@ -155,7 +183,12 @@ class AutoTunerState:
             config_db=self.config_db,
             use_hash_matching=self.args.use_hash_matching,
             use_prev_configs=self.use_prev_configs,
-            inject_seed=self.inject_seed)
+            inject_seed=self.inject_seed,
+            pruning_thresholds={
+                "size": self.args.prune_min_size,
+                "depth": self.args.prune_min_depth,
+                "dynamic_values": self.args.prune_min_dynamic_values,
+            })
 
         # Clean up the tuning opportunity files since they are no longer needed
         # after the search space is generated.
@@ -164,6 +197,7 @@ class AutoTunerState:
 
         return search_space
 
+    @profiling.timed("manipulator")
     def _init_manipulator(self):
         manipulator = ConfigurationManipulator()
         for _, task in self.task_map.items():
@@ -184,6 +218,7 @@ class StateSerializer:
     def check_state_exists(self):
         file_exists_error_or_path(self.data_dir, self.state_file)
 
+    @profiling.timed("state.serialize")
     def serialize(self, auto_tuner):
         auto_tuner_state = auto_tuner.auto_tuner_state
         # Add extra necessary information into AutoTunerState.
@@ -202,6 +237,7 @@ class StateSerializer:
         with os.fdopen(file_fd, 'wb') as file:
             pickle.dump(auto_tuner_state, file)
 
+    @profiling.timed("state.deserialize")
     def deserialize(self):
         file_path = os.path.join(self.data_dir, self.state_file)
         check_file_permissions(file_path)
@@ -225,8 +261,16 @@ class AutoTunerInterface:
         self.process_deterministic(args, data_dir)
         interface = self._create_default_measurement_interface(
             self.auto_tuner_state)
-        self.api = ResumableRunManager(interface, self.auto_tuner_state.args)
+        with profiling.phase("run_manager"):
+            self.api = ResumableRunManager(interface,
+                                           self.auto_tuner_state.args)
         self.auto_tuner_state.tuning_run_id = self.api.tuning_run.id
+        if getattr(args, "decompose", None):
+            num_groups = configure_decomposed_search(
+                self.api.search_driver.root_technique,
+                self.auto_tuner_state.task_map, args.decompose)
+            log.info("Decomposed the search space into %s groups by %s",
+                     num_groups, args.decompose)
         log.info("Initialized a new tuning run (ID: %s)",
                  self.api.tuning_run.id)
 
@@ -234,8 +278,9 @@ class AutoTunerInterface:
         self.auto_tuner_state = auto_tuning_state
         interface = self._create_default_measurement_interface(
             auto_tuning_state)
-        self.api = ResumableRunManager(interface, auto_tuning_state.args,
-                                       auto_tuning_state)
+        with profiling.phase("run_manager"):
+            self.api = ResumableRunManager(interface, auto_tuning_state.args,
+                                           auto_tuning_state)
         log.info("Resumed a tuning run (ID: %s)", self.api.tuning_run.id)
 
     def next_config(self, trials=1, retry_limit=5):
@@ -245,14 +290,16 @@ class AutoTunerInterface:
         """
         self.auto_tuner_state.current_desired_result_ids.clear()
         for trial_id in range(trials):
-            desired_result = self.api.get_next_desired_result()
-            retry_count = 1
-            # Sometimes search techniques can't avoid producing duplicates,
-            # and therefore result in returning None.
-            # We should retry it until the limit.
-            while desired_result is None and retry_count <= retry_limit:
+            with profiling.phase("propose"):
                 desired_result = self.api.get_next_desired_result()
-                retry_count += 1
+                retry_count = 1
+                # Sometimes search techniques can't avoid producing
+                # duplicates, and therefore result in returning None.
+                # We should retry it until the limit.
+                while desired_result is None and retry_count <= retry_limit:
+                    desired_result = self.api.get_next_desired_result()
+                    retry_count += 1
+            profiling.count("proposals", retry_count)
             # If search space is very small, sometimes the techniques
             # have trouble finding a config that hasn't already been tested.
             # Give a warning and make it try again.
@@ -264,7 +311,8 @@ class AutoTunerInterface:
                 log.warning("Only %s configurations were generated",
                             trial_id)
                 # Save the current desired_results into the database.
-                self.api.commit(force=True)
+                with profiling.phase("results_db.commit"):
+                    self.api.commit(force=True)
                 return
             cfg = desired_result.configuration.data
             if trials == 1:
@@ -279,7 +327,10 @@ class AutoTunerInterface:
             self.auto_tuner_state.iomanager.build_llvm_input(
                 cfg, self.auto_tuner_state.task_map, file_name,
                 config_db=self.auto_tuner_state.config_db,
-                use_hash_matching=self.auto_tuner_state.args.use_hash_matching)
+                use_hash_matching=self.auto_tuner_state.args.use_hash_matching,
+                omit_baseline=getattr(self.auto_tuner_state.args,
+                                      "omit_baseline_regions", False),
+                shard_dir=self._shard_dir(file_name))
 
             log.info("Generated a new configuration (ID: %s)",
                      desired_result.id)
@@ -293,11 +344,22 @@ class AutoTunerInterface:
         self.auto_tuner_state.best_result = self.api.search_driver.best_result
 
         # Save the current desired_results into the database.
-        self.api.commit(force=True)
+        with profiling.phase("results_db.commit"):
+            self.api.commit(force=True)
 
-    def feedback(self, feedback_values):
+    def feedback(self, feedback_values, group_feedback=None, commit=True):
         """
         Report the performance feedback.
+
+        Args:
+            feedback_values: a performance value per configuration generated
+                in the previous iteration.
+            group_feedback: optional dict of trial -> {group: value} used to
+                attribute the performance to groups of code regions when
+                tuning with --decompose.
+            commit: commit the results to the database; pass False when
+                next_config() follows, so that an iteration is committed
+                once.
         """
         desired_result_ids = self.auto_tuner_state.current_desired_result_ids
         if len(feedback_values) != len(desired_result_ids):
@@ -318,28 +380,52 @@ class AutoTunerInterface:
             else:
                 result = Result(time=feedback)
 
-            current_desired_result = self.api.session.query(
-                resultsdb.models.DesiredResult).get(
-                desired_result_ids[trial_id])
-            self.api.report_result(current_desired_result,
-                                   result)
+            with profiling.phase("report_result"):
+                current_desired_result = self.api.session.query(
+                    resultsdb.models.DesiredResult).get(
+                    desired_result_ids[trial_id])
+                if group_feedback and trial_id in group_feedback:
+                    self._report_group_feedback(current_desired_result,
+                                                group_feedback[trial_id])
+                self.api.report_result(current_desired_result,
+                                       result)
             log.info("Received performance feedback %f for "
                      "configuration (ID: %s)", feedback,
                      desired_result_ids[trial_id])
-        self.api.commit(force=True)
+        with profiling.phase("results_db.commit"):
+            if commit:
+                self.api.commit(force=True)
+            else:
+                self.api.session.flush()
 
         # Clean up config files from the previous iteration.
         files = glob.glob(self.auto_tuner_state.config_file + "*")
         _remove_files(files)
 
-    def dump(self, config_update=False):
+    def _report_group_feedback(self, desired_result, group_times):
+        root_technique = self.api.search_driver.root_technique
+        if not hasattr(root_technique, "report_group_times"):
+            log.warning("Group feedback is only used with --decompose; "
+                        "ignoring it.")
+            return
+        config_hash = self.api.manipulator.hash_config(
+            desired_result.configuration.data)
+        root_technique.report_group_times(config_hash, group_times)
+
+    def _shard_dir(self, config_file):
+        if not getattr(self.auto_tuner_state.args, "shard_llvm_input", False):
+            return None
+        return llvm_input_shard_dir(config_file)
+
+    def dump(self, config_update=False, update_policy="better"):
         """
         Dump the best config without terminating the tuning run.
 
         Args:
             config_update: Specifying if the optimal conditions (found) will "
-            "be stored in database for re-using. It will overwrite the "
-            "existing configurations; if any."
+            "be stored in database for re-using, with the best performance."
+            update_policy: Policy for the existing configurations, see
+            dbutils.UPDATE_POLICIES.
 
         Returns:
             True if best configuration is available or False otherwise.
@@ -359,12 +445,17 @@ class AutoTunerInterface:
                 self.auto_tuner_state.iomanager.update_config_db(
                     best_cfg, self.auto_tuner_state.task_map,
                     config_db=self.auto_tuner_state.config_db,
-                    use_hash_matching=hash_option)
+                    use_hash_matching=hash_option,
+                    objective=self.auto_tuner_state.objective,
+                    objective_value=best_performance, policy=update_policy)
             self.auto_tuner_state.iomanager.build_llvm_input(
                 best_cfg, self.auto_tuner_state.task_map,
                 self.auto_tuner_state.config_file,
                 config_db=self.auto_tuner_state.config_db,
-                use_hash_matching=hash_option)
+                use_hash_matching=hash_option,
+                omit_baseline=getattr(self.auto_tuner_state.args,
+                                      "omit_baseline_regions", False),
+                shard_dir=self._shard_dir(self.auto_tuner_state.config_file))
 
             log.info("Wrote optimal configuration to %s; re-compile with "
                      "-fautotune to apply it",
@@ -375,13 +466,15 @@ class AutoTunerInterface:
             log.warning("Optimal configuration has not yet been found")
             return False
 
-    def finalize(self, config_update):
+    def finalize(self, config_update, update_policy="better"):
         """
         Finalize the tuning run and save the best config.
         """
-        if self.dump(config_update):
+        if self.dump(config_update, update_policy):
             self.api.finish()
             if self.auto_tuner_state.config_db:
+                # The code regions of this run are no longer needed.
+                clear_config_db(self.auto_tuner_state.config_db)
                 self.auto_tuner_state.config_db.commit()
                 self.auto_tuner_state.config_db.close()
             log.info("Finalized a tuning run (ID: %s)",
@@ -435,6 +528,7 @@ class AutoTunerInterface:
         with os.fdopen(file_fd, 'wb') as file:
             pickle.dump(random_state, file)
 
+    @profiling.timed("results_db.replay")
     def _process_all_results(self):
         search_driver = self.api.search_driver
         search_driver.new_results = []
@@ -6,26 +6,34 @@ Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 from __future__ import print_function
 
 import argparse
+import contextlib
 import logging
 import os
+import sys
 try:
     from importlib.metadata import metadata, PackageNotFoundError
 except ImportError:
     from importlib_metadata import metadata, PackageNotFoundError
 
-import opentuner
-
+# opentuner, the tuning state (dill) and the config database (SQLAlchemy)
+# are imported by the commands using them only, so that the CLI starts fast:
+# see create_parser().
 import autotuner.utils as utils
-from autotuner.resumable.interface import AutoTunerInterface
-from autotuner.resumable.interface import StateSerializer
+from autotuner import profiling
 from autotuner.iomanager import argument_parser as io_argument_parser
 
 log = logging.getLogger(__name__)
 
 MAX_PARALLELISM = 4096 # Define maximum number of trials in parallel.
+# The commands of a tuning run, which load opentuner.
+TUNING_COMMANDS = ["minimize", "maximize", "feedback", "dump", "finalize"]
+# The console format of opentuner's logging, for the other commands.
+LOG_FORMAT = "[%(relativeCreated)6.0fs] %(levelname)7s %(name)s: %(message)s"
 
 
 def initialize(data_dir, args, objective, trials):
+    from autotuner.resumable.interface import AutoTunerInterface
+    from autotuner.resumable.interface import StateSerializer
     state_serializer = StateSerializer(data_dir)
     # Check if the autotuner state exists already at initialization.
     state_serializer.check_state_exists()
@@ -37,17 +45,22 @@ def initialize(data_dir, args, objective, trials):
     state_serializer.serialize(auto_tuner)
 
 
-def feedback(data_dir, feedback_numbers, trials):
+def feedback(data_dir, feedback_numbers, trials, group_feedback=None):
+    from autotuner.resumable.interface import AutoTunerInterface
+    from autotuner.resumable.interface import StateSerializer
     state_serializer = StateSerializer(data_dir)
     auto_tuning_state = state_serializer.deserialize()
     auto_tuner = AutoTunerInterface()
     auto_tuner.resume(auto_tuning_state)
-    auto_tuner.feedback(feedback_numbers)
+    # next_config() commits the results with the new configurations.
+    auto_tuner.feedback(feedback_numbers, group_feedback, commit=False)
     auto_tuner.next_config(trials)
     state_serializer.serialize(auto_tuner)
 
 
 def dump(data_dir):
+    from autotuner.resumable.interface import AutoTunerInterface
+    from autotuner.resumable.interface import StateSerializer
     state_serializer = StateSerializer(data_dir)
     auto_tuning_state = state_serializer.deserialize()
     auto_tuner = AutoTunerInterface()
@@ -55,12 +68,36 @@ def dump(data_dir):
     auto_tuner.dump()
 
 
-def finalize(data_dir, update_type):
+def finalize(data_dir, update_type, update_policy="better"):
+    from autotuner.resumable.interface import AutoTunerInterface
+    from autotuner.resumable.interface import StateSerializer
     state_serializer = StateSerializer(data_dir)
     auto_tuning_state = state_serializer.deserialize()
     auto_tuner = AutoTunerInterface()
     auto_tuner.resume(auto_tuning_state)
-    auto_tuner.finalize(update_type)
+    auto_tuner.finalize(update_type, update_policy)
+
+
+def transfer_configs(config_db_dir, command, path, chunk_size):
+    """
+    Export the optimal configurations of the config database to `path` or
+    import them from it.
+    """
+    from autotuner.dbutils import create_config_db_session
+    from autotuner.dbutils import export_configs
+    from autotuner.dbutils import import_configs
+    config_db = create_config_db_session(config_db_dir)
+    try:
+        if command == "export-configs":
+            counts = export_configs(config_db, path, chunk_size)
+            action = "Exported"
+        else:
+            counts = import_configs(config_db, path, chunk_size)
+            action = "Imported"
+    finally:
+        config_db.close()
+    log.info("%s %s optimal configurations and %s code region features "
+             "(%s)", action, counts["config"], counts["feature"], path)
 
 
 def parse_metadata(project_name):
@@ -86,7 +123,18 @@ def parse_metadata(project_name):
     return version_message
 
 
-def create_parser():
+def create_parser(argv=None):
+    """
+    Returns the parser of the command line. If the command line arguments
+    argv (without the program name) are given, the options importing
+    opentuner or the config database are only added to the parser of the
+    command they select.
+    """
+    command = utils.requested_command(argv) if argv is not None else None
+
+    def needed(*commands):
+        return argv is None or command in commands
+
     # Create the top-level parser
     top_parser = argparse.ArgumentParser(prog="llvm-autotune",
                                 formatter_class=argparse.RawTextHelpFormatter)
@@ -98,7 +146,11 @@ def create_parser():
     sub_parsers.required = True
 
     # Create parsers for the "minimize/maximize" command
-    parent_parsers = opentuner.argparsers()
+    if needed("minimize", "maximize"):
+        import opentuner
+        parent_parsers = opentuner.argparsers()
+    else:
+        parent_parsers = []
     parent_parsers.append(io_argument_parser)
     # Suppress help messages from parent argument parsers (opentuner) which
     # users should not be aware of.
@@ -126,8 +178,12 @@ def create_parser():
         _add_arg_deterministic(parser)
         _add_config_db_arguments(parser)
         _add_code_region_filtering_arguments(parser)
+        _add_region_pruning_arguments(parser)
+        if needed("minimize", "maximize"):
+            _add_decompose_arguments(parser)
         _add_use_dynamic_values(parser)
         _add_arg_baseline_config(parser)
+        _add_profile_arguments(parser)
 
     # Create the the parser for the "feedback" command
     feedback_parser = sub_parsers.add_parser("feedback",
@@ -136,11 +192,13 @@ def create_parser():
                                      "and generate new test configurations")
 
     _add_arg_trials(feedback_parser)
+    _add_profile_arguments(feedback_parser)
 
-    sub_parsers.add_parser("dump",
+    dump_parser = sub_parsers.add_parser("dump",
                            formatter_class=argparse.RawTextHelpFormatter,
                            help="Dump the current best configuration without "
                                 "terminating the tuning run")
+    _add_profile_arguments(dump_parser)
     feedback_parser.add_argument("values", type=float, nargs='*',
                                  help="Performance tuning result(s)")
     feedback_parser.add_argument("-i", "--feedback-file",
@@ -149,6 +207,11 @@ def create_parser():
                                       "specified on command line are "
                                       "overridden by those specified in the "
                                       "file")
+    feedback_parser.add_argument("--group-feedback-file",
+                                 help="Load per-group performance feedback "
+                                      "(e.g. per-function times from a "
+                                      "profile) for --decompose from a CSV "
+                                      "file of 'trial,group,value' rows")
 
     # Create the parser for the "finalize" command.
     finalize_parser = sub_parsers.add_parser("finalize",
@@ -159,21 +222,55 @@ def create_parser():
                                  dest="config_update", action="store_true",
                                  help="specifiy if the optimal configuration "
                                       "will be stored in configs.db upon "
-                                      "completion. It will overwrite previous "
-                                      "rows on conflict. "
+                                      "completion, with its performance. "
                                       "Default: No update.")
+    if needed("finalize"):
+        _add_config_update_policy(finalize_parser)
+    _add_profile_arguments(finalize_parser)
+
+    # Create the parsers for the "export-configs/import-configs" commands.
+    export_parser = sub_parsers.add_parser("export-configs",
+                           formatter_class=argparse.RawTextHelpFormatter,
+                           help="Export the optimal configurations stored "
+                                "in the config database to a portable "
+                                "JSON lines file")
+    import_parser = sub_parsers.add_parser("import-configs",
+                           formatter_class=argparse.RawTextHelpFormatter,
+                           help="Import optimal configurations from a file "
+                                "written by export-configs; stored "
+                                "configurations are overwritten on "
+                                "conflict")
+    for parser in (export_parser, import_parser):
+        parser.add_argument("file",
+                            help="Path of the file; compressed with gzip "
+                                 "if it ends with '.gz'")
+        parser.add_argument("--config-db", dest="config_db",
+                            help="Directory of configs.db or URL of the "
+                                 "config database. Default: CONFIG_DB_DIR, "
+                                 "or AUTOTUNE_DATADIR if it is not set")
+        parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                            default=1000,
+                            help="Number of rows read or committed at a "
+                                 "time. Default: 1000")
+
+    for parser in sub_parsers.choices.values():
+        _add_profile_out_arguments(parser)
 
     return top_parser
 
 
 def main():
     # Create the top-level parser
-    top_parser = create_parser()
+    top_parser = create_parser(sys.argv[1:])
 
     # Parse arguments
     args = top_parser.parse_args()
-    # Use opentuner's logging format.
-    opentuner.init_logging()
+    if args.command in TUNING_COMMANDS:
+        # Use opentuner's logging, which also writes opentuner.log.
+        import opentuner
+        opentuner.init_logging()
+    else:
+        logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
     # Get data_dir where tuning state and other tuning related data is saved
     # from the environment variable AUTOTUNE_DATADIR.
     if "AUTOTUNE_DATADIR" in os.environ:
@@ -183,25 +280,81 @@ def main():
         log.warning(
             "Environment variable AUTOTUNE_DATADIR is not set; "
             "a default directory is used for saving the data: %s", data_dir)
+    trace_file = None
+    if getattr(args, "profile_phases", None) is not None:
+        # Every command is an iteration of the trace of the tuning run.
+        trace_file = args.profile_phases or os.path.join(
+            data_dir, profiling.PHASE_TRACE_FILE)
+        profiling.enable(trace_file, append=True)
     try:
-        if args.command == "minimize" or args.command == "maximize":
-            initialize(data_dir, args, args.command, args.trials)
-        elif args.command == "feedback":
-            if args.feedback_file:
-                values = utils.parse_feedback_file(args.feedback_file)
-            elif args.values:
-                values = args.values
-            else:
-                raise Exception("No performance feedback provided")
-            feedback(data_dir, values, args.trials)
-        elif args.command == "dump":
-            dump(data_dir)
-        elif args.command == "finalize":
-            finalize(data_dir, args.config_update)
+        with _profile_command(args), \
+                profiling.iteration(command=args.command):
+            _run_command(args, data_dir)
     except Exception as error:
         log.error(error)
         log.error("Executing command %s failed", args.command)
         exit(1)
+    finally:
+        if trace_file is not None:
+            _report_phases(args.command, trace_file)
+
+
+def _run_command(args, data_dir):
+    if args.command == "minimize" or args.command == "maximize":
+        initialize(data_dir, args, args.command, args.trials)
+    elif args.command == "feedback":
+        if args.feedback_file:
+            values = utils.parse_feedback_file(args.feedback_file)
+        elif args.values:
+            values = args.values
+        else:
+            raise Exception("No performance feedback provided")
+        group_feedback = None
+        if args.group_feedback_file:
+            group_feedback = utils.parse_group_feedback_file(
+                args.group_feedback_file)
+        feedback(data_dir, values, args.trials, group_feedback)
+    elif args.command == "dump":
+        dump(data_dir)
+    elif args.command == "finalize":
+        finalize(data_dir, args.config_update,
+                 args.config_update_policy)
+    elif args.command in ("export-configs", "import-configs"):
+        config_db_dir = args.config_db or \
+            os.environ.get("CONFIG_DB_DIR", data_dir)
+        transfer_configs(config_db_dir, args.command, args.file,
+                         args.chunk_size)
+
+
+@contextlib.contextmanager
+def _profile_command(args):
+    """
+    Profile the command with --profile-out (or AUTOTUNE_PROFILE_OUT).
+    """
+    path = None
+    try:
+        with profiling.command_profile(args.command, args.profile_out,
+                                       args.profile_memory) as path:
+            yield
+    finally:
+        if path:
+            log.info("Profile of the command written to %s.pstats", path)
+            if os.path.isfile(path + ".memory.txt"):
+                log.info("Memory allocations of the command written to "
+                         "%s.memory.txt", path)
+
+
+def _report_phases(command, trace_file):
+    """
+    Log the phase timings of the command and, when the tuning run ends,
+    those of all its iterations in trace_file.
+    """
+    profiler = profiling.disable()
+    log.info("%s\nPhase trace appended to %s", profiler.summary(),
+             trace_file)
+    if command == "finalize" and os.path.isfile(trace_file):
+        log.info("Whole tuning run:\n%s", profiling.format_summary(
+            *profiling.load_trace(trace_file)))
 
 
 def _add_arg_trials(parser):
@@ -246,6 +399,22 @@ def _add_arg_deterministic(parser):
                              "'--deterministic=True'.")
 
 
+def _add_config_update_policy(parser):
+    from autotuner.dbutils import UPDATE_POLICIES
+    parser.add_argument("--config-update-policy",
+                        dest="config_update_policy",
+                        choices=UPDATE_POLICIES, default="better",
+                        help="What to do with a configuration already "
+                             "stored for the same code region and "
+                             "workload, with --store-optimal-configs.\n"
+                             "better: Keep it if its performance is better "
+                             "for the same objective (Default). Only for a "
+                             "--workload tag: configurations stored without "
+                             "tag are always replaced.\n"
+                             "overwrite: Replace it.")
+    return parser
+
+
 def _add_arg_search_space(parser):
     parser.add_argument("--search-space",
                         help="Specify the path of search space file")
@@ -274,6 +443,27 @@ def _add_config_db_arguments(parser):
                              "retune: Retune all the code regions and use "
                              "the optimal configurations (found in database) "
                              "as starting point for AutoTuner.\n")
+    parser.add_argument("--workload", dest="workload", default="",
+                        metavar="TAG",
+                        help="Workload tag of the optimal configurations "
+                             "used with --use-optimal-configs and stored "
+                             "by 'finalize --store-optimal-configs', so "
+                             "that configurations tuned for different "
+                             "inputs of the program are kept apart. "
+                             "Default: no tag.")
+    parser.add_argument("--use-similar-configs",
+                        dest="use_similar_configs", action="store_true",
+                        help="With --use-optimal-configs=retune, seed code "
+                             "regions without a stored optimal configuration "
+                             "with the configuration of the most similar "
+                             "stored code region (same type and pass, "
+                             "similar function/region name, DynamicConfigs "
+                             "and BaselineConfig).")
+    parser.add_argument("--similar-config-threshold",
+                        dest="similar_config_threshold", type=float,
+                        default=0.5,
+                        help="Minimum similarity score in [0, 1] for "
+                             "--use-similar-configs (default: 0.5).")
     return parser
 
 
@@ -306,6 +496,36 @@ def _add_code_region_filtering_arguments(parser):
                                  'other', 'llvm-param', 'program-param'])
     return parser
 
+
+def _add_region_pruning_arguments(parser):
+    parser.add_argument('--prune-min-size', type=int, metavar='N',
+                        help='Keep code regions whose size reported by the '
+                             'compiler is smaller than N at their baseline '
+                             'decision instead of tuning them.')
+    parser.add_argument('--prune-min-depth', type=int, metavar='N',
+                        help='Keep code regions whose loop depth reported by '
+                             'the compiler is smaller than N at their '
+                             'baseline decision instead of tuning them.')
+    parser.add_argument('--prune-min-dynamic-values', type=int, metavar='N',
+                        help='Keep code regions for which the compiler '
+                             'suggests fewer than N dynamic values for every '
+                             'parameter at their baseline decision instead '
+                             'of tuning them.')
+    return parser
+
+
+def _add_decompose_arguments(parser):
+    from autotuner.search.decomposed import DECOMPOSE_CHOICES
+    parser.add_argument('--decompose', choices=DECOMPOSE_CHOICES,
+                        help='Tune the code regions of each function/file '
+                             'with an independent search, batching one '
+                             'proposal per group into every trial. '
+                             'Per-group timings can be reported with '
+                             "'feedback --group-feedback-file'. Overrides "
+                             '--technique.')
+    return parser
+
+
 def _add_use_dynamic_values(parser):
     parser.add_argument('--use-dynamic-values', action='store_true',
                         help='Turn on dynamic values suggested by the compiler'
@@ -317,6 +537,47 @@ def _add_arg_baseline_config(parser):
                         help='Start the search from the baseline configuration'
                              ' instead of a random point in the search space'
                              ' (default).')
+    parser.add_argument('--omit-baseline-regions', action='store_true',
+                        help='Leave the code regions whose parameters all '
+                             'take the baseline decision of the compiler '
+                             '(BaselineConfig) out of the generated compiler '
+                             'configuration files.')
+    parser.add_argument('--shard-llvm-input', action='store_true',
+                        help='Also write each compiler configuration file '
+                             'as one file per source file, with a manifest '
+                             '(manifest.json), into <file>.shards/ next to '
+                             'it (e.g. config.shards/ for config.yaml), so '
+                             'that each compilation can read only its own '
+                             'shard.')
+
+
+def _add_profile_arguments(parser):
+    parser.add_argument('--profile-phases', nargs='?', const='',
+                        metavar='FILE',
+                        help='Time the phases of the command (search space '
+                             'parsing, proposal, input emission, state '
+                             'serialization...) and append them as a JSON '
+                             'line to FILE (default: ' +
+                             profiling.PHASE_TRACE_FILE + ' in '
+                             'AUTOTUNE_DATADIR); finalize also reports the '
+                             'phases of the whole tuning run.')
+    return parser
+
+
+def _add_profile_out_arguments(parser):
+    parser.add_argument('--profile-out', metavar='DIR',
+                        help='Profile the command with cProfile into '
+                             'DIR/<command>-<N>.pstats, N numbering the '
+                             'profiled commands in DIR. Default: the '
+                             'directory of ' + profiling.PROFILE_OUT_ENV +
+                             ', if set.')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='With --profile-out, also trace the memory '
+                             'allocations of the command with tracemalloc, '
+                             'with a snapshot after each phase, into '
+                             'DIR/<command>-<N>.memory.txt (or set ' +
+                             profiling.PROFILE_MEMORY_ENV + '=1).')
+    return parser
 
 
 def _suppress_help_messages(parsers):
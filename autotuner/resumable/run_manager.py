@@ -8,6 +8,26 @@ import logging
 from opentuner import resultsdb
 from opentuner.api import TuningRunManager
 from opentuner.resultsdb.models import Base as DBModel
+from opentuner.resultsdb.models import DesiredResult
+from opentuner.resultsdb.models import Result
+from sqlalchemy import Index
+
+from autotuner.dbutils import configure_sqlite_engine
+from autotuner.dbutils import create_missing_indexes
+
+# Indexes on the results database for the queries of the search driver that
+# the OpenTuner indexes do not cover: results_query(config=...) (duplicate
+# and pending result checks), the REQUESTED desired results of a tuning run
+# and the results ordered by collection date (see
+# AutoTunerInterface._process_all_results).
+RESULT_INDEXES = [
+    Index("ix_result_autotuner_configuration", Result.tuning_run_id,
+          Result.configuration_id),
+    Index("ix_result_autotuner_collection_date", Result.tuning_run_id,
+          Result.collection_date),
+    Index("ix_desired_result_autotuner_state", DesiredResult.tuning_run_id,
+          DesiredResult.state),
+]
 
 
 class ResumableRunManager(TuningRunManager):
@@ -24,10 +44,12 @@ class ResumableRunManager(TuningRunManager):
                                                       **kwargs)
         else:
             # Initialize a new run manager with the existing tuning state.
+            # TuningRunMain connects to the database of the tuning state.
             super(TuningRunManager, self).__init__(measurement_interface, args,
                                                    **kwargs)
-            self.engine, self.Session = resultsdb.connect(
-                tuning_state.args.database)
+            configure_sqlite_engine(self.engine)
+            # Tuning states saved by older versions lack the indexes.
+            create_missing_indexes(self.engine, RESULT_INDEXES)
             # Resume the tuning run from the database
             self.tuning_run = self.session.query(
                 resultsdb.models.TuningRun).get(tuning_state.tuning_run_id)
@@ -69,6 +91,14 @@ class ResumableRunManager(TuningRunManager):
             # Suppress logs from opentuner modules.
             logging.getLogger("opentuner").setLevel(logging.CRITICAL)
 
+    def init(self):
+        """
+        Override init from TuningRunMain to set the SQLite pragmas of the
+        autotuner on the results database, connected to by TuningRunMain.
+        """
+        configure_sqlite_engine(self.engine)
+        super(ResumableRunManager, self).init()
+
     def attach_db_session(self, obj):
         """
         Find database instances recursively and attach a new session with them.
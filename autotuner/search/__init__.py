@@ -0,0 +1,6 @@
+# coding=utf-8
+"""
+Search techniques registered with opentuner by the autotuner.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+__all__ = ["decomposed", "surrogate"]
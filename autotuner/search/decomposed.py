@@ -0,0 +1,177 @@
+# coding=utf-8
+"""
+A decomposed search technique for large loop-level search spaces.
+
+Code regions in different functions (or files) interact weakly, so tuning
+them jointly in one huge configuration space wastes evaluations.
+DecomposedSearch partitions the parameters into groups of code regions and
+runs one small local search per group on top of a shared incumbent
+configuration. Every trial batches one proposal per group into a single
+compile and run. When per-group timings are reported (e.g. per-function
+times from a profile), each group accepts or rejects its own proposal;
+otherwise the overall result decides for the few groups changed.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import logging
+import random
+
+from opentuner.search import technique
+
+from autotuner.search.surrogate import is_censored
+from autotuner.search.surrogate import mutate_parameter
+from autotuner.search.surrogate import objective_value
+
+log = logging.getLogger(__name__)
+
+DECOMPOSE_CHOICES = ["function", "file"]
+
+
+def group_tasks(task_map, group_by):
+    """
+    Partition the parameters of `task_map` by the function or the file of
+    their code region.
+
+    Returns a dict of group name -> list of parameter names. Code regions
+    without the requested information (e.g. program-param) share the group
+    named "".
+    """
+    groups = dict()
+    for _, task in sorted(task_map.items()):
+        code_region = task.code_region
+        if group_by == "file":
+            group = getattr(code_region.debug_loc, "file_name", "")
+        else:
+            group = code_region.func_name
+        groups.setdefault(group or "", []).extend(
+            param.name for param in task.param_list)
+    return groups
+
+
+class DecomposedSearch(technique.SearchTechnique):
+    """
+    Tune groups of parameters with independent local searches sharing a
+    single measurement per trial.
+    """
+
+    def __init__(self, unattributed_groups=1, *pargs, **kwargs):
+        super(DecomposedSearch, self).__init__(*pargs, **kwargs)
+        # Number of groups changed per trial without per-group timings.
+        self.unattributed_groups = unattributed_groups
+        # group name -> list of parameter names
+        self.groups = dict()
+        self.group_order = []
+        self.cursor = 0
+        self.incumbent = None
+        self.incumbent_value = float('inf')
+        # group name -> best time attributed to the group
+        self.group_values = dict()
+        # config hash -> groups changed by the proposal
+        self.proposals = dict()
+        # config hash -> {group name: time}, reported with the feedback
+        self.group_feedback = dict()
+        self.attributed = False
+
+    @classmethod
+    def get_hyper_parameters(cls):
+        return ['unattributed_groups']
+
+    def set_groups(self, groups):
+        """
+        Set the parameter groups (see group_tasks()) and restart the search.
+        """
+        self.groups = {group: list(names) for group, names in groups.items()
+                       if names}
+        self.group_order = sorted(self.groups)
+        random.shuffle(self.group_order)
+        self.cursor = 0
+        self.incumbent = None
+        self.incumbent_value = float('inf')
+        self.group_values = dict()
+        self.proposals = dict()
+        self.group_feedback = dict()
+        self.attributed = False
+
+    def report_group_times(self, config_hash, group_times):
+        """
+        Record the time spent in each group for the configuration with
+        `config_hash`; used when its result is processed.
+        """
+        self.group_feedback[config_hash] = dict(group_times)
+        self.attributed = True
+
+    def _next_groups(self):
+        if self.attributed:
+            count = len(self.group_order)
+        else:
+            count = min(self.unattributed_groups, len(self.group_order))
+        groups = []
+        for _ in range(count):
+            groups.append(self.group_order[self.cursor])
+            self.cursor = (self.cursor + 1) % len(self.group_order)
+        return groups
+
+    def desired_configuration(self):
+        if self.incumbent is None or not self.groups:
+            return self.manipulator.random()
+
+        cfg = self.manipulator.copy(self.incumbent)
+        params = self.manipulator.parameters_dict(cfg)
+        groups = self._next_groups()
+        for group in groups:
+            # One local proposal per group.
+            mutate_parameter(params[random.choice(self.groups[group])], cfg)
+        self.proposals[self.manipulator.hash_config(cfg)] = groups
+        return cfg
+
+    def on_result(self, result):
+        """
+        Called for every new result, regardless of who requested it.
+        """
+        cfg = result.configuration.data
+        config_hash = self.manipulator.hash_config(cfg)
+        groups = self.proposals.pop(config_hash, [])
+        group_times = self.group_feedback.pop(config_hash, {})
+        value = objective_value(self.objective, result)
+        if not is_censored(result) and result.state != 'OK':
+            value = float('inf')
+
+        if self.incumbent is None or \
+                (not group_times and value < self.incumbent_value):
+            self.incumbent = self.manipulator.copy(cfg)
+            self.incumbent_value = value
+            self.group_values.update(group_times)
+            return
+        if not group_times:
+            return
+
+        # Each group keeps its own proposal iff the time attributed to the
+        # group improved, regardless of the other groups.
+        accepted = 0
+        for group in groups or group_times:
+            time = group_times.get(group)
+            if time is None or \
+                    time >= self.group_values.get(group, float('inf')):
+                continue
+            for name in self.groups.get(group, []):
+                self.incumbent[name] = cfg[name]
+            self.group_values[group] = time
+            accepted += 1
+        self.incumbent_value = min(self.incumbent_value, value)
+        if accepted:
+            log.debug("%s: accepted proposals of %d group(s)", self.name,
+                      accepted)
+
+
+def configure_decomposed_search(root_technique, task_map, group_by):
+    """
+    Set the parameter groups of the DecomposedSearch used as the root
+    technique. Returns the number of groups, or None if the root technique
+    is not a DecomposedSearch.
+    """
+    if not isinstance(root_technique, DecomposedSearch):
+        return None
+    root_technique.set_groups(group_tasks(task_map, group_by))
+    return len(root_technique.groups)
+
+
+technique.register(DecomposedSearch())
@@ -0,0 +1,376 @@
+# coding=utf-8
+"""
+A surrogate-model-guided search technique for opentuner.
+
+Every result reported to opentuner costs a full compile and benchmark run.
+SurrogateRandomForest fits a small random forest over the results seen so far
+and proposes the candidate with the highest expected improvement, so fewer
+evaluations are spent on configurations that are unlikely to be better.
+Select it with `--technique SurrogateRandomForest`.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import logging
+import math
+import random
+
+import numpy
+
+from opentuner.search import technique
+from opentuner.search.objective import MaximizeRate
+from opentuner.search.objective import MinimizeCycle
+
+log = logging.getLogger(__name__)
+
+# Standard deviations (in unit space) of the normal mutations applied to
+# numeric parameters when generating candidates around good configurations.
+MUTATION_SIGMAS = (0.02, 0.05, 0.1)
+
+
+class RegressionTree(object):
+    """
+    A CART regression tree stored as flat node arrays.
+    """
+
+    def __init__(self, max_depth=8, min_samples_leaf=2, max_features=None,
+                 random_state=None):
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.max_features = max_features
+        self.random_state = random_state or numpy.random.RandomState()
+        # Node arrays; a leaf has feature == -1.
+        self.feature = []
+        self.threshold = []
+        self.left = []
+        self.right = []
+        self.value = []
+
+    def fit(self, features, targets):
+        self.feature, self.threshold = [], []
+        self.left, self.right, self.value = [], [], []
+        self._grow(features, targets, numpy.arange(len(targets)), 0)
+        return self
+
+    def _new_node(self, value):
+        self.feature.append(-1)
+        self.threshold.append(0.0)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.value.append(value)
+        return len(self.value) - 1
+
+    def _grow(self, features, targets, index, depth):
+        node = self._new_node(float(targets[index].mean()))
+        if depth >= self.max_depth or \
+                len(index) < 2 * self.min_samples_leaf or \
+                numpy.ptp(targets[index]) == 0:
+            return node
+
+        split = self._best_split(features[index], targets[index])
+        if split is None:
+            return node
+        feature, threshold = split
+        mask = features[index, feature] <= threshold
+        self.feature[node] = feature
+        self.threshold[node] = threshold
+        self.left[node] = self._grow(features, targets, index[mask],
+                                     depth + 1)
+        self.right[node] = self._grow(features, targets, index[~mask],
+                                      depth + 1)
+        return node
+
+    def _best_split(self, features, targets):
+        num_samples, num_features = features.shape
+        max_features = self.max_features or num_features
+        candidates = self.random_state.permutation(num_features)[
+            :max_features]
+        leaf = self.min_samples_leaf
+
+        best_score = None
+        best_split = None
+        for feature in candidates:
+            order = numpy.argsort(features[:, feature], kind="mergesort")
+            values = features[order, feature]
+            sorted_targets = targets[order]
+            left_sum = numpy.cumsum(sorted_targets)[:-1]
+            left_sq_sum = numpy.cumsum(sorted_targets ** 2)[:-1]
+            left_count = numpy.arange(1, num_samples)
+            right_sum = left_sum[-1] + sorted_targets[-1] - left_sum
+            right_sq_sum = left_sq_sum[-1] + sorted_targets[-1] ** 2 - \
+                left_sq_sum
+            right_count = num_samples - left_count
+            # Sum of squared errors of both children.
+            score = (left_sq_sum - left_sum ** 2 / left_count) + \
+                (right_sq_sum - right_sum ** 2 / right_count)
+            # Only split between distinct values and keep leaves large enough.
+            valid = values[1:] > values[:-1]
+            valid[:leaf - 1] = False
+            if leaf > 1:
+                valid[-(leaf - 1):] = False
+            if not valid.any():
+                continue
+            position = numpy.flatnonzero(valid)[
+                numpy.argmin(score[valid])]
+            if best_score is None or score[position] < best_score:
+                best_score = score[position]
+                best_split = (int(feature), float(
+                    (values[position] + values[position + 1]) / 2))
+        return best_split
+
+    def predict(self, features):
+        predictions = numpy.empty(len(features))
+        for row, sample in enumerate(features):
+            node = 0
+            while self.feature[node] != -1:
+                if sample[self.feature[node]] <= self.threshold[node]:
+                    node = self.left[node]
+                else:
+                    node = self.right[node]
+            predictions[row] = self.value[node]
+        return predictions
+
+
+class RandomForest(object):
+    """
+    A bagged ensemble of RegressionTree. The spread of the tree predictions
+    is used as the uncertainty of the surrogate model.
+    """
+
+    def __init__(self, num_trees=20, max_depth=8, min_samples_leaf=2,
+                 seed=None):
+        self.num_trees = num_trees
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.random_state = numpy.random.RandomState(seed)
+        self.trees = []
+
+    def fit(self, features, targets):
+        features = numpy.asarray(features, dtype=float)
+        targets = numpy.asarray(targets, dtype=float)
+        num_samples, num_features = features.shape
+        max_features = max(1, int(math.ceil(math.sqrt(num_features))))
+        self.trees = []
+        for _ in range(self.num_trees):
+            sample = self.random_state.randint(0, num_samples, num_samples)
+            tree = RegressionTree(self.max_depth, self.min_samples_leaf,
+                                  max_features, self.random_state)
+            self.trees.append(tree.fit(features[sample], targets[sample]))
+        return self
+
+    def predict(self, features):
+        """
+        Returns the mean and the standard deviation of the tree predictions.
+        """
+        features = numpy.asarray(features, dtype=float)
+        predictions = numpy.array([tree.predict(features)
+                                   for tree in self.trees])
+        return predictions.mean(axis=0), predictions.std(axis=0)
+
+
+def expected_improvement(mean, std, best):
+    """
+    Expected improvement over `best` for a minimization problem.
+    """
+    mean = numpy.asarray(mean, dtype=float)
+    std = numpy.maximum(numpy.asarray(std, dtype=float), 1e-12)
+    improvement = best - mean
+    z = improvement / std
+    cdf = 0.5 * (1.0 + numpy.vectorize(math.erf)(z / math.sqrt(2.0)))
+    pdf = numpy.exp(-0.5 * z ** 2) / math.sqrt(2.0 * math.pi)
+    return improvement * cdf + std * pdf
+
+
+def objective_value(objective, result):
+    """
+    Returns the value of `result` as a number to minimize for the given
+    opentuner objective.
+    """
+    if isinstance(objective, MaximizeRate):
+        value = result.rate
+        return -value if value is not None else float('inf')
+    if isinstance(objective, MinimizeCycle):
+        value = result.cycle
+    else:
+        value = result.time
+    return float(value) if value is not None else float('inf')
+
+
+def is_censored(result):
+    """
+    True iff `result` is a run terminated early (TIMEOUT) with a finite time:
+    its values are lower bounds of the actual ones rather than failures.
+    """
+    return result.state == 'TIMEOUT' and result.time is not None and \
+        math.isfinite(result.time)
+
+
+def encode_configuration(manipulator, cfg, item_codes):
+    """
+    Encode a configuration built from the parameters created by
+    _parse_param (Integer/Float, Enum, Permutation and Selection) into a
+    fixed-length feature vector.
+
+    Args:
+        manipulator: the ConfigurationManipulator of the tuning run.
+        cfg: the configuration data.
+        item_codes (dict): per-parameter item -> code cache for ordered
+            parameters; updated in place so that codes stay stable.
+    """
+    features = []
+    for param in manipulator.parameters(cfg):
+        if param.is_primitive():
+            features.append(param.get_unit_value(cfg))
+            continue
+
+        value = cfg[param.name]
+        if hasattr(param, "options"):
+            # EnumParameter (including bool).
+            options = param.options
+            index = options.index(value) if value in options else 0
+            features.append(index / float(max(len(options) - 1, 1)))
+        elif isinstance(value, dict) and "order" in value:
+            # SelectionParameter: an ordered list and the selected size.
+            order = list(value["order"])
+            size = int(value.get("size", len(order)))
+            features.append(size / float(max(len(order), 1)))
+            features.extend(_encode_order(param.name, order, item_codes,
+                                          selected=size))
+        elif isinstance(value, (list, tuple)):
+            # PermutationParameter.
+            features.extend(_encode_order(param.name, value, item_codes))
+        else:
+            features.append(0.0)
+    return features
+
+
+def _encode_order(name, order, item_codes, selected=None):
+    codes = item_codes.setdefault(name, {})
+    if not codes:
+        unique_items = sorted(set(str(item) for item in order))
+        for index, item in enumerate(unique_items):
+            codes[item] = (index + 1) / float(len(unique_items))
+    selected = len(order) if selected is None else selected
+    return [codes.get(str(item), 0.0) if position < selected else -1.0
+            for position, item in enumerate(order)]
+
+
+def mutate_parameter(param, cfg):
+    """
+    Apply a local random change to `param` in `cfg`.
+    """
+    # Prefer local moves so that mutations explore the neighbourhood of
+    # good configurations.
+    if param.is_primitive():
+        param.op1_normal_mutation(cfg, random.choice(MUTATION_SIGMAS))
+    elif hasattr(param, "op1_small_random_change"):
+        param.op1_small_random_change(cfg)
+    else:
+        param.op1_randomize(cfg)
+
+
+class SurrogateRandomForest(technique.SearchTechnique):
+    """
+    Propose configurations by expected improvement under a random forest
+    surrogate fitted to all results of the tuning run.
+    """
+
+    def __init__(self, initial_samples=10, num_candidates=256,
+                 num_trees=20, mutation_rate=0.1, *pargs, **kwargs):
+        super(SurrogateRandomForest, self).__init__(*pargs, **kwargs)
+        self.initial_samples = initial_samples
+        self.num_candidates = num_candidates
+        self.num_trees = num_trees
+        self.mutation_rate = mutation_rate
+        # config hash -> (cfg, features, value)
+        self.observations = dict()
+        # hashes of configurations proposed but not yet measured.
+        self.pending = set()
+        self.item_codes = dict()
+
+    @classmethod
+    def get_hyper_parameters(cls):
+        return ['initial_samples', 'num_candidates', 'num_trees',
+                'mutation_rate']
+
+    def on_result(self, result):
+        """
+        Called for every new result, regardless of who requested it.
+        """
+        cfg = result.configuration.data
+        config_hash = self.manipulator.hash_config(cfg)
+        self.pending.discard(config_hash)
+        value = objective_value(self.objective, result)
+        if not is_censored(result) and result.state != 'OK':
+            value = float('inf')
+        features = encode_configuration(self.manipulator, cfg,
+                                        self.item_codes)
+        previous = self.observations.get(config_hash)
+        if previous is None or value < previous[2]:
+            self.observations[config_hash] = (cfg, features, value)
+
+    def _is_new(self, cfg):
+        config_hash = self.manipulator.hash_config(cfg)
+        return config_hash not in self.observations and \
+            config_hash not in self.pending
+
+    def _propose(self, cfg):
+        self.pending.add(self.manipulator.hash_config(cfg))
+        return cfg
+
+    def _mutate(self, cfg):
+        new_cfg = self.manipulator.copy(cfg)
+        params = self.manipulator.parameters(new_cfg)
+        mutated = False
+        for param in params:
+            if random.random() < self.mutation_rate:
+                mutate_parameter(param, new_cfg)
+                mutated = True
+        if not mutated:
+            mutate_parameter(random.choice(params), new_cfg)
+        return new_cfg
+
+    def _candidates(self, ranked_cfgs):
+        candidates = []
+        for index in range(self.num_candidates):
+            if index % 2 == 0 and ranked_cfgs:
+                # Exploit: mutate one of the best configurations so far.
+                parent = ranked_cfgs[index // 2 % len(ranked_cfgs)]
+                cfg = self._mutate(parent)
+            else:
+                cfg = self.manipulator.random()
+            if self._is_new(cfg):
+                candidates.append(cfg)
+        return candidates
+
+    def desired_configuration(self):
+        observations = list(self.observations.values())
+        finite = [value for _, _, value in observations
+                  if math.isfinite(value)]
+        if len(finite) < self.initial_samples:
+            return self._propose(self.manipulator.random())
+
+        # Failed or timed-out configurations are modeled as slightly worse
+        # than the worst measured configuration.
+        penalty = max(finite) + (max(finite) - min(finite) or 1.0)
+        targets = [value if math.isfinite(value) else penalty
+                   for _, _, value in observations]
+        features = [features for _, features, _ in observations]
+
+        ranked = sorted(observations, key=lambda obs: obs[2])
+        candidates = self._candidates([cfg for cfg, _, _ in ranked[:5]])
+        if not candidates:
+            return self._propose(self.manipulator.random())
+
+        forest = RandomForest(self.num_trees,
+                              seed=random.randint(0, 2 ** 31 - 1))
+        forest.fit(features, targets)
+        mean, std = forest.predict([
+            encode_configuration(self.manipulator, cfg, self.item_codes)
+            for cfg in candidates])
+        scores = expected_improvement(mean, std, min(finite))
+        best = int(numpy.argmax(scores))
+        log.debug("%s: proposing candidate with predicted value %f "
+                  "(EI %f)", self.name, mean[best], scores[best])
+        return self._propose(candidates[best])
+
+
+technique.register(SurrogateRandomForest())
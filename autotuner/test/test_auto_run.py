@@ -29,6 +29,10 @@ class TestAutoRun(unittest.TestCase):
             curr_dir, "Inputs", "test_sample.ini")
         self.args.tuner = None
         self.args.output = None
+        self.args.workers = None
+        self.args.run_cpus = None
+        self.args.compile_cpus = None
+        self.args.serialize_runs = False
         self.args.stage_order = ["loop"]
         self.args.search_config_file = os.path.join(
             curr_dir, "Inputs", "test_search_space_config.yaml")
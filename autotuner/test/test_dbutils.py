@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the config database and the settings of the SQLite databases.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+import types
+import unittest
+import unittest.mock as mock
+
+from opentuner import resultsdb
+
+from autotuner.dbutils import add_code_region_features
+from autotuner.dbutils import add_current_code_region
+from autotuner.dbutils import clear_config_db
+from autotuner.dbutils import configure_sqlite_engine
+from autotuner.dbutils import create_config_db_session
+from autotuner.dbutils import create_missing_indexes
+from autotuner.dbutils import export_configs
+from autotuner.dbutils import get_current_code_regions
+from autotuner.dbutils import get_optimal_config
+from autotuner.dbutils import import_configs
+from autotuner.dbutils import optimal_config_exists
+from autotuner.dbutils import update_optimal_configs
+from autotuner.dbutils import SQLITE_WAL_ENV
+from autotuner.dbutils import _set_sqlite_pragmas
+from autotuner.resumable.run_manager import RESULT_INDEXES
+
+
+def _remark(hashcode, args):
+    return types.SimpleNamespace(CodeRegionHash=hashcode,
+                                 CodeRegionType="loop",
+                                 Pass="loop-unroll", Args=args)
+
+
+def _code_region(index, function="main"):
+    return {"Name": "for.body{}".format(index), "Pass": "loop-unroll",
+            "Function": function, "CodeRegionType": "loop",
+            "Hashcode": str(index), "Invocation": 0}
+
+
+def _tuning_run(data_dir, run_id, num_regions, num_updates, barrier,
+                errors):
+    """
+    A tuning run sharing the config database with others.
+    """
+    try:
+        barrier.wait(60)
+        session = create_config_db_session(data_dir, run_id)
+        for update in range(num_updates):
+            clear_config_db(session)
+            for index in range(num_regions):
+                add_current_code_region(
+                    session, _code_region(index, function=run_id), seen=False)
+            session.commit()
+            # Let the other runs write in between.
+            time.sleep(0.01)
+            update_optimal_configs(session, [
+                _remark(index, [{"UnrollCount": update}])
+                for index in range(num_regions)])
+            functions = [region.code_region.func_name
+                         for region in get_current_code_regions(session)]
+            if functions != [run_id] * num_regions:
+                raise AssertionError("code regions of other runs: {}".format(
+                    functions))
+        session.close()
+    except Exception as error:
+        errors.put("{}: {!r}".format(run_id, error))
+
+
+def _indexes(path):
+    with sqlite3.connect(path) as connection:
+        return {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+class TestDBUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_config_db(self):
+        session = create_config_db_session(self.temp_dir.name)
+        connection = session.connection()
+        self.assertEqual(connection.exec_driver_sql(
+            "PRAGMA journal_mode").scalar(), "wal")
+        # NORMAL
+        self.assertEqual(connection.exec_driver_sql(
+            "PRAGMA synchronous").scalar(), 1)
+        self.assertEqual(connection.exec_driver_sql(
+            "PRAGMA busy_timeout").scalar(), 30000)
+        session.close()
+        self.assertIn("ix_current_code_region_run_hash", _indexes(
+            os.path.join(self.temp_dir.name, "configs.db")))
+
+    @mock.patch.dict(os.environ, {SQLITE_WAL_ENV: "0"})
+    def test_config_db_without_wal(self):
+        session = create_config_db_session(self.temp_dir.name)
+        connection = session.connection()
+        self.assertEqual(connection.exec_driver_sql(
+            "PRAGMA journal_mode").scalar(), "delete")
+        # FULL
+        self.assertEqual(connection.exec_driver_sql(
+            "PRAGMA synchronous").scalar(), 2)
+        session.close()
+
+    def test_wal_fallback(self):
+        # SQLite keeps the journal mode when it cannot switch to WAL, e.g. on
+        # a network file system.
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value
+        cursor.fetchone.return_value = ("delete",)
+        _set_sqlite_pragmas(connection, None)
+        self.assertEqual([call.args[0] for call in cursor.execute.mock_calls],
+                         ["PRAGMA busy_timeout=30000",
+                          "PRAGMA journal_mode=WAL",
+                          "PRAGMA journal_mode=DELETE",
+                          "PRAGMA synchronous=FULL"])
+
+    def test_results_db(self):
+        path = os.path.join(self.temp_dir.name, "autotuner.db")
+        engine, _ = resultsdb.connect("sqlite:///" + path)
+        # Only the engines of the autotuner get its pragmas.
+        with engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql(
+                "PRAGMA journal_mode").scalar(), "delete")
+        configure_sqlite_engine(engine)
+        with engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql(
+                "PRAGMA journal_mode").scalar(), "wal")
+        names = {index.name for index in RESULT_INDEXES}
+        self.assertTrue(names <= _indexes(path))
+
+        # Databases written by older versions get the missing indexes.
+        with sqlite3.connect(path) as connection:
+            for name in names:
+                connection.execute("DROP INDEX " + name)
+        create_missing_indexes(engine, RESULT_INDEXES)
+        create_missing_indexes(engine, RESULT_INDEXES)
+        self.assertTrue(names <= _indexes(path))
+        engine.dispose()
+
+    def test_optimal_configs(self):
+        session = create_config_db_session(self.temp_dir.name)
+        update_optimal_configs(session, [_remark(1, [{"UnrollCount": 2}])])
+        self.assertTrue(optimal_config_exists(session, 1, "loop",
+                                              "loop-unroll"))
+        update_optimal_configs(session, [_remark(1, [{"UnrollCount": 4}])])
+        session.commit()
+        self.assertEqual(get_optimal_config(session, "1", "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 4}])
+        self.assertIsNone(get_optimal_config(session, "2", "loop",
+                                             "loop-unroll"))
+        session.close()
+
+        # Parameters are stored as JSON.
+        with sqlite3.connect(os.path.join(self.temp_dir.name,
+                                          "configs.db")) as connection:
+            params = connection.execute(
+                "SELECT params FROM optimalConfigs").fetchall()
+        self.assertEqual(params, [(b'[{"UnrollCount":4}]',)])
+
+    def test_update_policy(self):
+        session = create_config_db_session(self.temp_dir.name, "run1",
+                                           workload="ref")
+        update_optimal_configs(session, [_remark(1, [{"UnrollCount": 2}])],
+                               "minimize", 10.0)
+        # A worse run keeps the stored configuration...
+        update_optimal_configs(session, [_remark(1, [{"UnrollCount": 4}])],
+                               "minimize", 12.0)
+        self.assertEqual(get_optimal_config(session, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 2}])
+        # ...a better one replaces it.
+        update_optimal_configs(session, [_remark(1, [{"UnrollCount": 8}])],
+                               "minimize", 8.0)
+        self.assertEqual(get_optimal_config(session, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 8}])
+        update_optimal_configs(session, [_remark(1, [{"UnrollCount": 0}])],
+                               "minimize", 9.0, policy="overwrite")
+        self.assertEqual(get_optimal_config(session, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 0}])
+        # Higher values are better when maximizing.
+        update_optimal_configs(session, [_remark(2, [{"UnrollCount": 2}])],
+                               "maximize", 10.0)
+        update_optimal_configs(session, [_remark(2, [{"UnrollCount": 4}])],
+                               "maximize", 12.0)
+        self.assertEqual(get_optimal_config(session, 2, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 4}])
+        self.assertRaises(ValueError, update_optimal_configs, session, [],
+                          policy="first")
+        session.close()
+
+        # Without workload tag, the performance of runs on different inputs
+        # is not compared.
+        untagged = create_config_db_session(self.temp_dir.name, "run2")
+        update_optimal_configs(untagged, [_remark(1, [{"UnrollCount": 2}])],
+                               "minimize", 10.0)
+        update_optimal_configs(untagged, [_remark(1, [{"UnrollCount": 4}])],
+                               "minimize", 12.0)
+        self.assertEqual(get_optimal_config(untagged, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 4}])
+        untagged.close()
+
+        with sqlite3.connect(os.path.join(self.temp_dir.name,
+                                          "configs.db")) as connection:
+            row = connection.execute(
+                "SELECT objective, objective_value, run_id, timestamp FROM "
+                "optimalConfigs WHERE hashcode = '1' AND "
+                "workload = 'ref'").fetchone()
+        self.assertEqual(row[:3], ("minimize", 9.0, "run1"))
+        self.assertIsNotNone(row[3])
+
+    def test_workloads(self):
+        path = os.path.join(self.temp_dir.name, "configs.db")
+        # A database written before configurations had a workload.
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "CREATE TABLE optimalConfigs (hashcode VARCHAR, "
+                "code_region_type VARCHAR, pass_name VARCHAR, params BLOB, "
+                "PRIMARY KEY (hashcode, code_region_type, pass_name))")
+            connection.execute(
+                "INSERT INTO optimalConfigs VALUES (?, ?, ?, ?)",
+                ("1", "loop", "loop-unroll", b'[{"UnrollCount":2}]'))
+            connection.execute("CREATE TABLE configDbVersion "
+                               "(version INTEGER PRIMARY KEY)")
+            connection.execute("INSERT INTO configDbVersion VALUES (3)")
+        untagged = create_config_db_session(self.temp_dir.name)
+        small = create_config_db_session(self.temp_dir.name,
+                                         workload="small")
+        self.assertEqual(get_optimal_config(untagged, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 2}])
+        self.assertFalse(optimal_config_exists(small, 1, "loop",
+                                               "loop-unroll"))
+        update_optimal_configs(small, [_remark(1, [{"UnrollCount": 8}])],
+                               "minimize", 5.0)
+        self.assertEqual(get_optimal_config(small, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 8}])
+        self.assertEqual(get_optimal_config(untagged, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 2}])
+
+        # Workloads and performance are exported.
+        export_path = os.path.join(self.temp_dir.name, "configs.jsonl")
+        export_configs(untagged, export_path)
+        target = create_config_db_session(
+            tempfile.mkdtemp(dir=self.temp_dir.name), workload="small")
+        import_configs(target, export_path)
+        self.assertEqual(get_optimal_config(target, 1, "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 8}])
+        for session in (untagged, small, target):
+            session.close()
+
+    def test_upgrade_pickled_config_db(self):
+        path = os.path.join(self.temp_dir.name, "configs.db")
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "CREATE TABLE optimalConfigs (hashcode VARCHAR, "
+                "code_region_type VARCHAR, pass_name VARCHAR, params BLOB, "
+                "PRIMARY KEY (hashcode, code_region_type, pass_name))")
+            connection.execute(
+                "INSERT INTO optimalConfigs VALUES (?, ?, ?, ?)",
+                ("7", "loop", "loop-unroll",
+                 pickle.dumps([{"UnrollCount": 8}])))
+        session = create_config_db_session(self.temp_dir.name)
+        self.assertEqual(get_optimal_config(session, "7", "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 8}])
+        session.close()
+        # The database is converted once.
+        session = create_config_db_session(self.temp_dir.name)
+        self.assertEqual(get_optimal_config(session, "7", "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 8}])
+        session.close()
+
+    def test_export_import_configs(self):
+        source = create_config_db_session(self.temp_dir.name)
+        update_optimal_configs(source, [_remark(hashcode, [{"UnrollCount":
+                                                            hashcode}])
+                                        for hashcode in range(5)])
+        add_code_region_features(source, {
+            "Hashcode": "1", "CodeRegionType": "loop",
+            "Pass": "loop-unroll", "Name": "for.body",
+            "Function": "main", "DynamicConfigs": {"UnrollCount": [2, 4]}})
+        source.commit()
+        for file_name in ("configs.jsonl", "configs.jsonl.gz"):
+            path = os.path.join(self.temp_dir.name, file_name)
+            self.assertEqual(export_configs(source, path, chunk_size=2),
+                             {"config": 5, "feature": 1})
+
+            target_dir = tempfile.mkdtemp(dir=self.temp_dir.name)
+            target = create_config_db_session(target_dir)
+            update_optimal_configs(target, [_remark(3, [{"UnrollCount": 0}])])
+            target.commit()
+            self.assertEqual(import_configs(target, path, chunk_size=2),
+                             {"config": 5, "feature": 1})
+            # Imported rows overwrite the stored ones.
+            self.assertEqual(get_optimal_config(target, "3", "loop",
+                                                "loop-unroll"),
+                             [{"UnrollCount": 3}])
+            target.close()
+
+        with open(path.replace(".gz", ""), "w") as file:
+            file.write('{"format": "other"}\n')
+        target = create_config_db_session(self.temp_dir.name)
+        self.assertRaises(ValueError, import_configs, target,
+                          path.replace(".gz", ""))
+        target.close()
+        source.close()
+
+    def test_current_code_regions_per_run(self):
+        path = os.path.join(self.temp_dir.name, "configs.db")
+        # A database written before the rows were scoped per run.
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "CREATE TABLE currentCodeRegions (name VARCHAR, "
+                "pass_name VARCHAR, func_name VARCHAR, "
+                "code_region_type VARCHAR, hashcode VARCHAR, "
+                "debug_file VARCHAR, debug_line VARCHAR, "
+                "debug_column VARCHAR, invocation VARCHAR, seen BOOLEAN, "
+                "PRIMARY KEY (name, pass_name, func_name, code_region_type, "
+                "hashcode, debug_file, debug_line, debug_column, "
+                "invocation))")
+            connection.execute(
+                "INSERT INTO currentCodeRegions VALUES "
+                "('for.body0', 'loop-unroll', 'main', 'loop', '0', '', '', "
+                "'', '0', 0)")
+        old_run = create_config_db_session(self.temp_dir.name)
+        self.assertEqual(len(get_current_code_regions(old_run)), 1)
+
+        run1 = create_config_db_session(self.temp_dir.name, "run1")
+        run2 = create_config_db_session(self.temp_dir.name, "run2")
+        for index in range(3):
+            add_current_code_region(run1, _code_region(index), seen=False)
+        run1.commit()
+        add_current_code_region(run2, _code_region(0), seen=False)
+        clear_config_db(run2)
+        run2.commit()
+        self.assertEqual(len(get_current_code_regions(run1)), 3)
+        self.assertEqual(len(get_current_code_regions(run2)), 0)
+        self.assertEqual(len(get_current_code_regions(old_run)), 1)
+        for session in (old_run, run1, run2):
+            session.close()
+
+    def test_concurrent_runs(self):
+        context = multiprocessing.get_context("spawn")
+        errors = context.Queue()
+        barrier = context.Barrier(4)
+        runs = [context.Process(target=_tuning_run,
+                                args=(self.temp_dir.name, "run{}".format(run),
+                                      20, 10, barrier, errors))
+                for run in range(4)]
+        for run in runs:
+            run.start()
+        for run in runs:
+            run.join(120)
+            self.assertEqual(run.exitcode, 0)
+        self.assertTrue(errors.empty(), errors.get() if not errors.empty()
+                        else None)
+        session = create_config_db_session(self.temp_dir.name)
+        self.assertEqual(get_optimal_config(session, "19", "loop",
+                                            "loop-unroll"),
+                         [{"UnrollCount": 9}])
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the declarative tuner configured by the [Metric Setting] section.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import os
+import sys
+import tempfile
+import unittest
+import unittest.mock as mock
+from configparser import Error as ConfigParserError
+from configparser import NoOptionError
+
+from opentuner.search.objective import MaximizeRate
+from opentuner.search.objective import MinimizeCycle
+
+from autotuner.tuners.declarative_tuner import Tuner
+
+
+def _python(code):
+    return '"{}" -c "{}"'.format(sys.executable, code)
+
+
+class TestDeclarativeTuner(unittest.TestCase):
+
+    def setUp(self):
+        self.args = mock.MagicMock()
+        self.args.output = None
+        self.args.run_cpus = None
+        self.args.compile_cpus = None
+        self.args.serialize_runs = False
+        curr_dir = os.path.dirname(__file__)
+        self.search_space = os.path.join(
+            curr_dir, "Inputs", "run", "search_space_loop_only.yaml")
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        self.desired_result = mock.MagicMock()
+        self.desired_result.configuration.id = 1
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.temp_dir.cleanup()
+
+    def _tuner(self, run_cmd, **setting):
+        return Tuner(self.args, None, None, self.search_space, None,
+                     self.temp_dir.name, run_cmd, metric_setting=setting)
+
+    def test_minimize_stdout_metric(self):
+        tuner = self._tuner(_python("print('cycles: 1200'); print('done')"),
+                            MetricRegex=r"cycles: (\d+)",
+                            SuccessMarker="done")
+        self.assertIsInstance(tuner.objective(), MinimizeCycle)
+        result = tuner.run(self.desired_result, None, None)
+        self.assertEqual(result.cycle, 1200)
+
+    def test_maximize_median_of_repetitions(self):
+        counter = os.path.join(self.temp_dir.name, "counter")
+        # Prints a rate of 10, 30 then 20 on successive runs.
+        run_cmd = _python(
+            "import os; n = os.path.getsize('counter') "
+            "if os.path.exists('counter') else 0; "
+            "open('counter', 'a').write('x'); "
+            "print('rate = %d' % [10, 30, 20][n])")
+        tuner = self._tuner(run_cmd, MetricRegex=r"rate = (\d+)",
+                            Objective="max", Repetitions="3")
+        self.assertIsInstance(tuner.objective(), MaximizeRate)
+        result = tuner.run(self.desired_result, None, None)
+        self.assertEqual(result.rate, 20)
+        self.assertEqual(os.path.getsize(counter), 3)
+
+    def test_file_metric(self):
+        with open(os.path.join(self.temp_dir.name, "result.txt"), "w") as file:
+            file.write("score 1\nscore 2\nscore 3\n")
+        tuner = self._tuner(_python("pass"), MetricRegex=r"score (\d+)",
+                            MetricSource="result.txt",
+                            MetricOccurrence="last")
+        result = tuner.run(self.desired_result, None, None)
+        self.assertEqual(result.cycle, 3)
+
+        # With workers, the file is read by the worker of the trial.
+        worker = mock.MagicMock()
+        worker.stream_program.return_value = {
+            "returncode": 0, "time": 1.0, "timeout": False,
+            "stopped_early": False, "metrics": {}, "stdout": "",
+            "stderr": ""}
+        worker.scan_file.return_value = {"metric": 7.0}
+        tuner._remote.worker = worker
+        result = tuner.run(self.desired_result, None, None)
+        self.assertEqual(result.cycle, 7)
+        worker.scan_file.assert_called_once_with(
+            "result.txt", [tuner.metric],
+            cwd=[self.temp_dir.name, "RunDir"])
+
+    def test_failed_runs(self):
+        tuner = self._tuner(_python("print('cycles: 12')"),
+                            MetricRegex=r"cycles: (\d+)",
+                            SuccessMarker="validated")
+        result = tuner.run(self.desired_result, None, None)
+        self.assertEqual(result.cycle, float('inf'))
+        self.assertTrue(os.path.isfile("errors_log/errors_1.log"))
+
+        tuner = self._tuner(_python("import time; time.sleep(30)"),
+                            MetricRegex=r"cycles: (\d+)", Timeout="0.5")
+        with mock.patch.object(Tuner, "_print_errors") as mock_print_errors:
+            result = tuner.run(self.desired_result, None, None)
+        mock_print_errors.assert_called_once()
+        self.assertEqual(result.cycle, float('inf'))
+
+        # The metric captured is not a number.
+        tuner = self._tuner(_python("print('cycles: NR')"),
+                            MetricRegex=r"cycles: (\S+)")
+        result = tuner.run(self.desired_result, None, None)
+        self.assertEqual(result.cycle, float('inf'))
+
+    def test_invalid_settings(self):
+        with self.assertRaises(NoOptionError):
+            self._tuner("true")
+        with self.assertRaises(ConfigParserError):
+            self._tuner("true", MetricRegex="(\\d+)", Objective="fastest")
+        with self.assertRaises(ConfigParserError):
+            self._tuner("true", MetricRegex="(\\d+)", Repetitions="0")
+        # A result file is only complete once the run finished.
+        with self.assertRaises(ConfigParserError):
+            self._tuner("true", MetricRegex="(\\d+)",
+                        MetricSource="result.txt", StopWhenCaptured="yes")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the decomposed search technique.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import argparse
+import random
+import unittest
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import Result
+from opentuner.api import TuningRunManager
+from opentuner.measurement.inputmanager import FixedInputManager
+from opentuner.measurement.interface import DefaultMeasurementInterface
+from opentuner.search.manipulator import EnumParameter
+from opentuner.search.objective import MinimizeTime
+
+from autotuner.models import CodeRegion
+from autotuner.models import DebugLoc
+from autotuner.models import Task
+from autotuner.search.decomposed import configure_decomposed_search
+from autotuner.search.decomposed import group_tasks
+
+FUNCTIONS = ["foo", "bar", "baz"]
+UNROLL = [0, 1, 2, 4, 8]
+
+
+def _task_map():
+    task_map = {}
+    for tuning_id in range(1, 10):
+        func_name = FUNCTIONS[tuning_id % len(FUNCTIONS)]
+        code_region = CodeRegion("loop-unroll", "for.body", func_name, "loop",
+                                 str(tuning_id))
+        code_region.set_debug_loc(DebugLoc(func_name + ".c", tuning_id, 1))
+        task_map[tuning_id] = Task(
+            tuning_id,
+            [EnumParameter(str(tuning_id) + "UnrollCount", UNROLL)],
+            code_region)
+    return task_map
+
+
+def _group_times(cfg):
+    # Each loop is fastest when unrolled by 4.
+    times = dict.fromkeys(FUNCTIONS, 0.0)
+    for tuning_id in range(1, 10):
+        times[FUNCTIONS[tuning_id % len(FUNCTIONS)]] += abs(
+            UNROLL.index(cfg[str(tuning_id) + "UnrollCount"]) - 3)
+    return times
+
+
+class DecomposedSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.task_map = _task_map()
+
+    def test_group_tasks(self):
+        groups = group_tasks(self.task_map, "function")
+        self.assertEqual(sorted(groups), ["bar", "baz", "foo"])
+        self.assertEqual(groups["bar"], ["1UnrollCount", "4UnrollCount",
+                                         "7UnrollCount"])
+        groups = group_tasks(self.task_map, "file")
+        self.assertEqual(sorted(groups), ["bar.c", "baz.c", "foo.c"])
+
+        self.task_map[1].code_region.func_name = ""
+        self.assertEqual(group_tasks(self.task_map, "function")[""],
+                         ["1UnrollCount"])
+
+    def _tune(self, attributed, budget=100):
+        manipulator = ConfigurationManipulator()
+        for task in self.task_map.values():
+            for param in task.param_list:
+                manipulator.add_parameter(param)
+        parser = argparse.ArgumentParser(parents=opentuner.argparsers())
+        args = parser.parse_args(["--technique", "DecomposedSearch",
+                                  "--database", "sqlite://", "--no-dups"])
+        interface = DefaultMeasurementInterface(
+            args=args, manipulator=manipulator, objective=MinimizeTime(),
+            input_manager=FixedInputManager(), project_name="test",
+            program_name="decomposed", program_version="0.1")
+        api = TuningRunManager(interface, args)
+        root = api.search_driver.root_technique
+        self.assertEqual(configure_decomposed_search(root, self.task_map,
+                                                     "function"), 3)
+        try:
+            best = None
+            for _ in range(budget):
+                desired_result = api.get_next_desired_result()
+                if desired_result is None:
+                    continue
+                cfg = desired_result.configuration.data
+                times = _group_times(cfg)
+                if attributed:
+                    root.report_group_times(manipulator.hash_config(cfg),
+                                            times)
+                value = sum(times.values())
+                api.report_result(desired_result, Result(time=value))
+                best = value if best is None else min(best, value)
+            return best
+        finally:
+            api.session.close()
+
+    def test_attributed_search(self):
+        self.assertEqual(self._tune(attributed=True), 0)
+
+    def test_unattributed_search(self):
+        # Without per-group timings, one group is changed per trial.
+        self.assertLessEqual(self._tune(attributed=False), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
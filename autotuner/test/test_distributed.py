@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the distributed evaluation of trials on workers.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock as mock
+
+from autotuner.distributed import Coordinator
+from autotuner.distributed import HANDSHAKE_TIMEOUT
+from autotuner.distributed import WorkerError
+from autotuner.distributed import _digest
+from autotuner.distributed import parse_address
+from autotuner.distributed import receive_message
+from autotuner.distributed import send_message
+from autotuner.distributed import serve
+from autotuner.tuners.metrics import MetricExtractor
+from autotuner.tuners.simple_tuner import SimpleTuner
+
+SAMPLE_INI = """
+[Compiling Setting]
+CompileDir = {compile_dir}
+LLVMInputFile = %(CompileDir)s/input.yaml
+CompileCommand = "{python}" -c "import shutil; shutil.copy('input.yaml', 'built.yaml')"
+RunDir = %(CompileDir)s
+RunCommand = "{python}" -c "print('ran in', __import__('os').getcwd())"
+"""
+
+
+def _python(code):
+    return '"{}" -c "{}"'.format(sys.executable, code)
+
+
+class TestDistributed(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.coordinator = Coordinator(retries=1, acquire_timeout=30,
+                                       token="secret")
+        self.threads = []
+
+    def tearDown(self):
+        self.coordinator.close()
+        for thread in self.threads:
+            thread.join(10)
+        self.temp_dir.cleanup()
+
+    def _start_worker(self, name):
+        work_dir = os.path.join(self.temp_dir.name, name)
+        os.mkdir(work_dir)
+        settings = {"CompileDir": work_dir, "RunDir": work_dir,
+                    "LLVMInputFile": os.path.join(work_dir, "input.yaml"),
+                    "CompileCommand": _python("import os; print(os.getcwd())"),
+                    "RunCommand": _python("print('cycles: 42')")}
+        thread = threading.Thread(
+            target=serve,
+            args=(self.coordinator.address, settings, "secret", name))
+        thread.start()
+        self.threads.append(thread)
+        self.assertTrue(self.coordinator.wait_for_workers(
+            len(self.threads), timeout=30))
+        return work_dir
+
+    def _start_failing_worker(self):
+        def fail():
+            with socket.create_connection(self.coordinator.address) as sock:
+                nonce = receive_message(sock)["nonce"]
+                send_message(sock, {"op": "hello", "name": "failing",
+                                    "digest": _digest("secret", nonce)})
+                # Die on the first request.
+                receive_message(sock)
+
+        thread = threading.Thread(target=fail)
+        thread.start()
+        self.threads.append(thread)
+        self.assertTrue(self.coordinator.wait_for_workers(
+            len(self.threads), timeout=30))
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address("node1:8000"), ("node1", 8000))
+        self.assertEqual(parse_address(":8000"), ("127.0.0.1", 8000))
+        self.assertRaises(ValueError, parse_address, "node1")
+
+    def test_run_trial(self):
+        work_dir = self._start_worker("worker0")
+
+        def trial(worker):
+            worker.put_input("input data")
+            called = worker.call_program(
+                ["./coordinator_compile", "CompileCommand"],
+                cwd=["/coordinator/dir", "CompileDir"])
+            # The worker runs its own RunCommand.
+            streamed = worker.stream_program(
+                ["./coordinator_run", "RunCommand"],
+                [MetricExtractor("cycles", r"cycles: (\d+)", int)])
+            return called, streamed
+
+        called, streamed = self.coordinator.run_trial(trial)
+        with open(os.path.join(work_dir, "input.yaml")) as file:
+            self.assertEqual(file.read(), "input data")
+        self.assertEqual(called["returncode"], 0)
+        self.assertEqual(os.path.realpath(called["stdout"].strip()),
+                         os.path.realpath(work_dir))
+        self.assertEqual(streamed["metrics"], {"cycles": 42})
+
+    def test_scan_file(self):
+        work_dir = self._start_worker("worker0")
+        with open(os.path.join(work_dir, "result.txt"), "w") as file:
+            file.write("cycles: 42\n")
+        extractors = [MetricExtractor("cycles", r"cycles: (\d+)", int)]
+
+        # Result files are read in the RunDir of the worker.
+        def trial(worker):
+            return [worker.scan_file(name, extractors,
+                                     cwd=["/coordinator/dir", "RunDir"])
+                    for name in ("result.txt", "missing.txt")]
+
+        self.assertEqual(self.coordinator.run_trial(trial),
+                         [{"cycles": 42}, None])
+
+    def test_refuse_unknown_command(self):
+        self._start_worker("worker0")
+        self.coordinator.retries = 0
+
+        def trial(worker):
+            return worker.call_program([_python("print('forged')"), None])
+
+        with self.assertRaises(WorkerError) as context:
+            self.coordinator.run_trial(trial)
+        self.assertIn("refused", str(context.exception))
+
+    def test_reject_wrong_token(self):
+        with socket.create_connection(self.coordinator.address) as sock:
+            receive_message(sock)
+            send_message(sock, {"op": "hello", "name": "forged",
+                                "digest": _digest("guess", "nonce")})
+            # The coordinator hangs up instead of accepting the worker.
+            self.assertIsNone(receive_message(sock))
+        self.assertFalse(self.coordinator.wait_for_workers(1, timeout=0.1))
+
+    def test_silent_client(self):
+        # A client that never answers the challenge does not hold up the
+        # workers connecting after it.
+        with socket.create_connection(self.coordinator.address):
+            start = time.time()
+            self._start_worker("worker0")
+            self.assertLess(time.time() - start, HANDSHAKE_TIMEOUT)
+
+    def test_retry_on_worker_failure(self):
+        self._start_failing_worker()
+
+        def trial(worker):
+            worker.put_input("input data")
+            return worker.name
+
+        # The failing worker connected first gets the first trial.
+        self._start_worker("worker0")
+        names = {self.coordinator.run_trial(trial) for _ in range(2)}
+        self.assertEqual(names, {"worker0"})
+        self.assertEqual([worker.name for worker in self.coordinator.workers],
+                         ["worker0"])
+
+    def test_no_retries_left(self):
+        self._start_failing_worker()
+        self.coordinator.retries = 0
+        self.coordinator.acquire_timeout = 1
+        self.assertRaises(WorkerError, self.coordinator.run_trial,
+                          lambda worker: worker.put_input("input data"))
+
+    def test_wait_for_workers(self):
+        self.assertFalse(self.coordinator.wait_for_workers(1, timeout=0.1))
+        # A local worker failing to start is reported instead of waited for.
+        self.coordinator.spawn_local_workers(
+            os.path.join(self.temp_dir.name, "missing.ini"), 1,
+            os.path.join(self.temp_dir.name, "workers"))
+        with self.assertRaises(WorkerError):
+            self.coordinator.wait_for_workers(1, timeout=60)
+
+    def test_tuner_with_local_workers(self):
+        compile_dir = os.path.join(self.temp_dir.name, "build")
+        os.mkdir(compile_dir)
+        config_file = os.path.join(self.temp_dir.name, "sample.ini")
+        with open(config_file, "w") as file:
+            file.write(SAMPLE_INI.format(compile_dir=compile_dir,
+                                         python=sys.executable))
+        self.coordinator.spawn_local_workers(
+            config_file, 2, os.path.join(self.temp_dir.name, "workers"))
+        self.assertTrue(self.coordinator.wait_for_workers(2, timeout=60))
+
+        args = mock.MagicMock()
+        args.output = self.temp_dir.name
+        args.early_termination_factor = None
+        args.run_cpus = None
+        args.compile_cpus = None
+        args.serialize_runs = False
+        search_space = os.path.join(os.path.dirname(__file__), "Inputs",
+                                    "run", "search_space_loop_only.yaml")
+        tuner = SimpleTuner(args, compile_dir, "/coordinator/input.yaml",
+                            search_space, "./coordinator_compile",
+                            compile_dir, "./coordinator_run",
+                            coordinator=self.coordinator)
+        self.assertTrue(tuner.parallel_compile)
+        config_data = tuner.manipulator().random()
+        results = [tuner.compile(config_data, compile_id)
+                   for compile_id in range(4)]
+        for result in results:
+            self.assertLess(result.time, float('inf'))
+        self.assertIs(tuner.run_precompiled(None, None, None, results[0], 0),
+                      results[0])
+        for index in range(2):
+            worker_dir = os.path.join(self.temp_dir.name, "workers",
+                                      "worker{}".format(index))
+            self.assertTrue(os.path.isfile(
+                os.path.join(worker_dir, "built.yaml")))
+        self.assertFalse(os.listdir(compile_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,12 +4,17 @@
 Tests for divide command
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
+import json
 import os
 import shutil
+import tempfile
 import unittest
 import unittest.mock as mock
 import yaml
 from autotuner.main import divide_main
+from autotuner.remarkparser import AutoTuning
+from autotuner.remarkparser import get_remarks
+from autotuner.yamlmanager import YAMLManager
 try:
     from yaml import CLoader as Loader
 except ImportError:
@@ -25,6 +30,7 @@ class TestAutotunerDivide(unittest.TestCase):
         self.args = mock.MagicMock()
         self.args.command = "divide"
         self.args.parse_format = "yaml"
+        self.args.max_open_files = 64
 
     def compare_yaml_content(self, expected_yaml_path, actual_yaml_path):
         """
@@ -71,6 +77,46 @@ class TestAutotunerDivide(unittest.TestCase):
         # remove test output
         shutil.rmtree("test_divide_output")
 
+    def test_output_shards(self):
+        curr_dir = os.path.dirname(__file__)
+        remarks = get_remarks(os.path.join(curr_dir,
+                                           "Inputs/divide/llvm_input.yaml"))
+        llvm_param = AutoTuning()
+        llvm_param.Pass = "none"
+        llvm_param.CodeRegionType = "llvm-param"
+        llvm_param.CodeRegionHash = 0
+        llvm_param.Args = [{"-unroll-threshold": 300}]
+        remarks[-1].DebugLoc = dict(remarks[-1].DebugLoc,
+                                    File="lib/core_main.c")
+        yaml_manager = YAMLManager()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shard_dir = os.path.join(temp_dir, "config.shards")
+            manifest = yaml_manager.output_shards(shard_dir,
+                                                  [llvm_param] + remarks)
+            self.assertEqual(manifest["shards"], {
+                "core_list_join.c": "core_list_join.c.yaml",
+                "core_main.c": "core_main.c.yaml",
+                "lib/core_main.c": "core_main.c.1.yaml"})
+            with open(os.path.join(shard_dir, "manifest.json")) as file:
+                self.assertEqual(json.load(file), manifest)
+
+            def shard(name):
+                return [remark.CodeRegionType for remark in get_remarks(
+                    os.path.join(shard_dir, name))]
+
+            # Every shard gets the remarks without a source file.
+            self.assertEqual(shard("core_list_join.c.yaml"),
+                             ["llvm-param"] + ["loop"] * 3)
+            self.assertEqual(len(shard("core_main.c.yaml")), 3)
+            self.assertEqual(len(shard("core_main.c.1.yaml")), 2)
+            self.assertEqual(shard(manifest["default"]), ["llvm-param"])
+
+            # The shards of the previous input are removed.
+            manifest = yaml_manager.output_shards(shard_dir, remarks[:3])
+            self.assertEqual(sorted(os.listdir(shard_dir)),
+                             ["core_list_join.c.yaml", "manifest.json",
+                              "no_name.yaml"])
+
 
 if __name__ == "__main__":
     unittest.main(buffer=True)
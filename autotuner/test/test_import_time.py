@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the modules imported by the command-line interfaces. Their
+import time is measured by benchmarks/import_time_benchmark.py.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# Modules only imported by the commands tuning or using the databases.
+HEAVY_MODULES = ["opentuner", "sqlalchemy", "dill", "numpy"]
+
+
+def _import_times(module, args=None, cwd=None, env=None):
+    """
+    Returns a dict of module -> cumulative import time (us) of the modules
+    imported by importing `module` in a new interpreter, or by running it
+    with the command line arguments `args`.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, **(env or {}))
+    command = ["-m", module] + args if args is not None else \
+        ["-c", "import " + module]
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + command, cwd=cwd,
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if line.startswith("import time:") and len(fields) == 3 and \
+                fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+
+    def check_import(self, module, heavy_modules=HEAVY_MODULES):
+        times = _import_times(module)
+        self.assertFalse([name for name in heavy_modules if name in times],
+                         "{} imports heavy modules".format(module))
+
+    def test_auto_tuner(self):
+        self.check_import("autotuner.main")
+
+    def test_llvm_autotune(self):
+        self.check_import("autotuner.resumable.main",
+                          HEAVY_MODULES + ["yaml", "defusedxml"])
+
+    def test_export_configs(self):
+        # Commands other than those of a tuning run do not load opentuner.
+        with tempfile.TemporaryDirectory() as temp_dir:
+            times = _import_times(
+                "autotuner.resumable.main", ["export-configs", "out.jsonl"],
+                cwd=temp_dir, env={"AUTOTUNE_DATADIR": temp_dir,
+                                   "CONFIG_DB_DIR": temp_dir})
+            self.assertNotIn("opentuner", times)
+            self.assertFalse(os.path.exists(
+                os.path.join(temp_dir, "opentuner.log")))
+
+    def test_merge_and_divide(self):
+        # merge and divide only need the YAML manager.
+        self.check_import("autotuner.yamlmanager")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,16 +5,29 @@ Tests for merge command
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
 import os
+import tempfile
 import unittest
 import unittest.mock as mock
 import yaml
 from autotuner.main import merge_main
+from autotuner.yamlmanager import YAMLManager
 try:
     from yaml import CLoader as Loader
 except ImportError:
     from yaml import Loader
 
 
+REMARK = """--- !AutoTuning
+Pass: loop-unroll
+Name: {name}
+DebugLoc: {{ File: core_main.c, Line: 10, Column: 3 }}
+Function: main
+CodeRegionType: loop
+Args:
+  - UnrollCount: {count}
+"""
+
+
 class TestAutotunerMerge(unittest.TestCase):
     """
     Test the 'merge' subcommand in autotuner
@@ -24,6 +37,8 @@ class TestAutotunerMerge(unittest.TestCase):
         self.args = mock.MagicMock()
         self.args.command = "merge"
         self.args.parse_format = "yaml"
+        self.args.deduplicate = None
+        self.args.prefer_file = None
 
     def compare_yaml_content(self, expected_yaml_path, actual_yaml_path):
         """
@@ -64,6 +79,70 @@ class TestAutotunerMerge(unittest.TestCase):
             curr_dir, "Outputs/merge/llvm_input.yaml"),
             "actual_merge_result.yaml")
 
+    def test_merge_deduplicate(self):
+        curr_dir = os.path.dirname(__file__)
+        input_files = [
+            os.path.join(curr_dir,
+                         "Inputs/merge/llvm_input_core_list_join.c.yaml"),
+            os.path.join(curr_dir, "Inputs/merge/llvm_input_core_main.c.yaml")]
+        # Every remark of the repeated input is a duplicate.
+        self.args.input_file = input_files + input_files[1:]
+        self.args.output = "actual_merge_result.yaml"
+        self.args.deduplicate = "first"
+
+        with self.assertRaises(SystemExit) as context:
+            merge_main(self.args)
+        self.assertEqual(context.exception.code, 0)
+        self.compare_yaml_content(os.path.join(
+            curr_dir, "Outputs/merge/llvm_input.yaml"),
+            "actual_merge_result.yaml")
+
+    def test_merge_conflicts(self):
+        yaml_manager = YAMLManager()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            inputs = []
+            for name, remarks in [("a.yaml", [("for.body", 2),
+                                              ("for.cond", 2)]),
+                                  ("b.yaml", [("for.body", 4),
+                                              ("for.cond", 2),
+                                              ("while.body", 8)])]:
+                inputs.append(os.path.join(temp_dir, name))
+                with open(inputs[-1], "w") as file:
+                    for remark in remarks:
+                        file.write(REMARK.format(name=remark[0],
+                                                 count=remark[1]))
+            output_file = os.path.join(temp_dir, "merged.yaml")
+
+            def merge(input_files, policy, prefer_file=None):
+                stats = yaml_manager.merge_llvm_input_files(
+                    input_files, output_file, policy, prefer_file)
+                with open(output_file) as stream:
+                    remarks = yaml.load_all(stream, Loader=Loader)
+                    return stats, [(remark.Name, remark.Args[0]["UnrollCount"])
+                                   for remark in remarks]
+
+            stats, remarks = merge(inputs, None)
+            self.assertEqual(len(remarks), 5)
+            self.assertEqual(stats, {"read": 5, "written": 5,
+                                     "duplicates": 0, "conflicts": 0})
+            stats, remarks = merge(inputs, "first")
+            self.assertEqual(remarks, [("for.body", 2), ("for.cond", 2),
+                                       ("while.body", 8)])
+            self.assertEqual(stats, {"read": 5, "written": 3,
+                                     "duplicates": 1, "conflicts": 1})
+            _, remarks = merge(inputs, "last")
+            self.assertEqual(remarks, [("for.body", 4), ("for.cond", 2),
+                                       ("while.body", 8)])
+            _, remarks = merge(inputs, "prefer", inputs[0])
+            self.assertEqual(remarks[0], ("for.body", 2))
+            _, remarks = merge(inputs[::-1], "prefer", inputs[1])
+            self.assertEqual(remarks, [("for.body", 4), ("for.cond", 2),
+                                       ("while.body", 8)])
+            self.assertEqual(
+                [remark.Name for remark in yaml_manager.parse_llvm_inputs(
+                    inputs, "last")],
+                ["for.body", "for.cond", "while.body"])
+
 
 if __name__ == "__main__":
     unittest.main(buffer=True)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the metric extraction helpers of tuner plugins.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+from autotuner.tuners.metrics import MetricExtractor
+from autotuner.tuners.metrics import scan_file
+from autotuner.tuners.metrics import stream_program
+from autotuner.tuners.metrics import tail_lines
+
+
+def _python(code):
+    return '"{}" -c "{}"'.format(sys.executable, code)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.temp_file = os.path.join(self.temp_dir.name, "result.txt")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_metric_extractor(self):
+        extractor = MetricExtractor("ticks", r"Total ticks\s*:\s*(\d+)", int)
+        self.assertEqual(extractor.search("Total ticks      : 1234\n"), 1234)
+        self.assertIsNone(extractor.search("Total time (secs): 12.3\n"))
+        extractor = MetricExtractor("valid", r"validated", str)
+        self.assertEqual(extractor.search("operation validated."),
+                         "validated")
+
+    def test_stream_program(self):
+        result = stream_program(
+            _python("print('rate: 1'); print('rate: 2'); print('ticks: 3')"),
+            [MetricExtractor("rate", r"rate: (\d+)", int, last=True),
+             MetricExtractor("ticks", r"ticks: (\d+)", int)])
+        self.assertEqual(result['returncode'], 0)
+        self.assertFalse(result['timeout'])
+        self.assertEqual(result['metrics'], {"rate": 2, "ticks": 3})
+        self.assertIn("ticks: 3", result['stdout'])
+
+    def test_stream_program_stop_when_captured(self):
+        result = stream_program(
+            _python("import time; print('ticks: 3', flush=True); "
+                    "time.sleep(30)"),
+            [MetricExtractor("ticks", r"ticks: (\d+)", int)],
+            stop_when_captured=True)
+        self.assertTrue(result['stopped_early'])
+        self.assertEqual(result['returncode'], 0)
+        self.assertEqual(result['metrics'], {"ticks": 3})
+        self.assertLess(result['time'], 20)
+
+        # Without extractors nothing is captured: the command runs to the
+        # end.
+        result = stream_program(
+            _python("print('start', flush=True); print('done')"), [],
+            stop_when_captured=True)
+        self.assertFalse(result['stopped_early'])
+        self.assertIn("done", result['stdout'])
+
+    def test_stream_program_timeout(self):
+        result = stream_program(_python("import time; time.sleep(30)"), [],
+                                limit=0.5)
+        self.assertTrue(result['timeout'])
+        self.assertNotEqual(result['returncode'], 0)
+        self.assertLess(result['time'], 20)
+
+    @unittest.skipUnless(hasattr(os, "sched_getaffinity"),
+                         "CPU pinning is not supported")
+    def test_stream_program_cpus(self):
+        cpu = min(os.sched_getaffinity(0))
+        result = stream_program(
+            _python("import os; print(sorted(os.sched_getaffinity(0)))"),
+            [MetricExtractor("cpus", r"\[(.*)\]", str)], cpus=[cpu])
+        self.assertEqual(result['metrics'], {"cpus": str(cpu)})
+
+    def test_scan_file(self):
+        with open(self.temp_file, "w") as file:
+            file.write("557.xz_r 1 (base)\n557.xz_r 1 321.5 ok\n")
+        found = scan_file(self.temp_file, [MetricExtractor(
+            "cycles", r"^(?=.*557\.xz_r)\s*\S+\s+\S+\s+(?!\(base\))(\S+)")])
+        self.assertEqual(found, {"cycles": 321.5})
+
+    def test_tail_lines(self):
+        with open(self.temp_file, "w") as file:
+            for index in range(5000):
+                file.write("line [{}]\n".format(index))
+            file.write("end")
+        with open(self.temp_file) as file:
+            expected = file.readlines()[-2:]
+        self.assertEqual(tail_lines(self.temp_file, 2), expected)
+        self.assertEqual(tail_lines(self.temp_file, 1), ["end"])
+        self.assertEqual(len(tail_lines(self.temp_file, 10000)), 5001)
+
+
+if __name__ == "__main__":
+    unittest.main()
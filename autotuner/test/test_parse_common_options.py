@@ -28,7 +28,7 @@ class TestParseCommonOptions(unittest.TestCase):
         self.args.tuner = False
         self.args.output = False
 
-    @mock.patch("autotuner.tuners.tunerbase.get_available_tuners")
+    @mock.patch("autotuner.tuners.plugins.get_available_tuners")
     def test_list_tuners(self, mock_get_available_tuners):
         """
         Test the --list-tuner flag for autotuner
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the discovery and loading of tuners.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+from importlib.metadata import EntryPoint
+
+from autotuner.tuners import plugins
+from autotuner.tuners.tunerbase import CustomTunerBase
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestPlugins(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.plugin_dir = os.path.join(self.temp_dir.name, "plugins")
+        os.mkdir(self.plugin_dir)
+        shutil.copy(os.path.join(TEST_DIR, "dummy_tuner.py"),
+                    self.plugin_dir)
+        patcher = mock.patch.dict(os.environ, {
+            "AUTOTUNE_CACHE_DIR": os.path.join(self.temp_dir.name, "cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        plugins._DIR_CACHE.clear()
+        self.addCleanup(plugins._DIR_CACHE.clear)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_find_tuners(self):
+        self.assertEqual(plugins.find_tuners(self.plugin_dir),
+                         ("dummy_tuner",))
+        open(os.path.join(self.plugin_dir, "other_tuner.py"), "w").close()
+        open(os.path.join(self.plugin_dir, "helper.py"), "w").close()
+        # Make sure the modification time changes on coarse file systems.
+        mtime = os.stat(self.plugin_dir).st_mtime_ns
+        os.utime(self.plugin_dir, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+        self.assertEqual(plugins.find_tuners(self.plugin_dir),
+                         ("dummy_tuner", "other_tuner"))
+        self.assertEqual(plugins.find_tuners(
+            os.path.join(self.plugin_dir, "missing")), ())
+
+    def test_disk_cache(self):
+        tuners = plugins.find_tuners(self.plugin_dir)
+        self.assertTrue(os.path.isfile(plugins._cache_path()))
+        plugins._DIR_CACHE.clear()
+        with mock.patch("os.listdir") as mock_listdir:
+            self.assertEqual(plugins.find_tuners(self.plugin_dir), tuners)
+            mock_listdir.assert_not_called()
+
+    def test_available_tuners(self):
+        entry_point = EntryPoint(name="installed_tuner",
+                                 value="autotuner.test.dummy_tuner",
+                                 group=plugins.ENTRY_POINT_GROUP)
+        with mock.patch("autotuner.tuners.plugins._entry_points",
+                        return_value=[entry_point]):
+            tuners = plugins.get_available_tuners(self.plugin_dir)
+        self.assertEqual(tuners[0], "dummy_tuner")
+        self.assertIn("declarative_tuner", tuners)
+        self.assertEqual(tuners[-1], "installed_tuner")
+
+    def test_load_tuner(self):
+        tuner = plugins.load_tuner("dummy_tuner", self.plugin_dir)
+        self.assertTrue(issubclass(tuner, CustomTunerBase))
+        self.assertRaises(IOError, plugins.load_tuner, "dummy_tuner",
+                          os.path.join(self.plugin_dir, "missing"))
+        with mock.patch("autotuner.tuners.plugins._entry_points",
+                        return_value=[]):
+            self.assertRaises(ImportError, plugins.load_tuner,
+                              "missing_tuner", self.plugin_dir)
+
+    def test_load_entry_point(self):
+        entry_points = [
+            EntryPoint(name="module_tuner",
+                       value="autotuner.test.dummy_tuner",
+                       group=plugins.ENTRY_POINT_GROUP),
+            EntryPoint(name="class_tuner",
+                       value="autotuner.test.dummy_tuner:Tuner",
+                       group=plugins.ENTRY_POINT_GROUP)]
+        with mock.patch("autotuner.tuners.plugins._entry_points",
+                        return_value=entry_points):
+            for name in ["module_tuner", "class_tuner"]:
+                self.assertTrue(issubclass(plugins.load_tuner(name),
+                                           CustomTunerBase))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the phase timers and counters of --profile-phases.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import json
+import os
+import pstats
+import tempfile
+import threading
+import tracemalloc
+import unittest
+import unittest.mock as mock
+
+from autotuner import profiling
+from autotuner.yamlmanager import YAMLManager
+
+INPUTS_DIR = os.path.join(os.path.dirname(__file__), "Inputs")
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.temp_dir.name,
+                                       profiling.PHASE_TRACE_FILE)
+        self.addCleanup(profiling.disable)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_trace(self):
+        with open(self.trace_file) as file:
+            return [json.loads(line) for line in file]
+
+    def test_disabled(self):
+        @profiling.timed("function")
+        def function(value):
+            return value + 1
+
+        self.assertIs(profiling.phase("a"), profiling.phase("b"))
+        with profiling.iteration(trial=1) as record:
+            self.assertEqual(function(1), 2)
+            profiling.count("counter")
+        self.assertEqual(record, {})
+        self.assertIsNone(profiling.disable())
+
+    def test_iterations(self):
+        profiler = profiling.enable(self.trace_file)
+
+        @profiling.timed("inner")
+        def inner():
+            profiling.count("calls")
+
+        def other_thread(trial):
+            with profiling.iteration(trial=trial, state="ERROR"):
+                inner()
+
+        with profiling.phase("setup"):
+            inner()
+        for trial in range(2):
+            with profiling.iteration(trial=trial) as record:
+                with profiling.phase("outer"):
+                    inner()
+                    inner()
+                record["state"] = "OK"
+                # Iterations of other threads are recorded apart.
+                thread = threading.Thread(target=other_thread,
+                                          args=(trial + 10,))
+                thread.start()
+                thread.join()
+
+        self.assertIs(profiling.disable(), profiler)
+        trace = self.read_trace()
+        self.assertEqual([(line["iteration"], line["trial"], line["state"])
+                          for line in trace],
+                         [(1, 10, "ERROR"), (2, 0, "OK"), (3, 11, "ERROR"),
+                          (4, 1, "OK")])
+        self.assertEqual(trace[0]["counters"], {"calls": 1})
+        self.assertEqual(trace[1]["counters"], {"calls": 2})
+        trace = trace[1:]
+        self.assertEqual({name: calls for name, (calls, _)
+                          in trace[0]["phases"].items()},
+                         {"outer": 1, "inner": 2})
+        self.assertEqual(profiler.phases["inner"][0], 7)
+        self.assertEqual(profiler.counters, {"calls": 7})
+        self.assertLessEqual(trace[0]["phases"]["outer"][1],
+                             trace[0]["wall"])
+
+        summary = profiler.summary()
+        self.assertIn("over 4 iteration(s)", summary)
+        for name in ["setup", "outer", "inner", "calls"]:
+            self.assertIn(name, summary)
+
+    def test_append(self):
+        for command in ["minimize", "feedback"]:
+            profiling.enable(self.trace_file, append=True)
+            with profiling.iteration(command=command):
+                with profiling.phase("propose"):
+                    pass
+            profiling.disable()
+        self.assertEqual([(line["iteration"], line["command"])
+                          for line in self.read_trace()],
+                         [(1, "minimize"), (2, "feedback")])
+        phases, counters, _, iterations = profiling.load_trace(
+            self.trace_file)
+        self.assertEqual(phases["propose"][0], 2)
+        self.assertEqual((counters, iterations), ({}, 2))
+
+    def test_yaml_manager_phases(self):
+        profiler = profiling.enable()
+        yaml_manager = YAMLManager()
+        search_space = yaml_manager.generate_search_space(
+            [os.path.join(INPUTS_DIR, "opp", "core_main.c.yaml")],
+            os.path.join(INPUTS_DIR, "parse",
+                         "test_search_space_config.yaml"))
+        task_map = yaml_manager.parse_search_space(search_space)
+        config = {param.name: param.seed_value()
+                  for task in task_map.values()
+                  for param in task.param_list}
+        yaml_manager.build_llvm_input(
+            config, task_map, os.path.join(self.temp_dir.name, "input.yaml"))
+        profiling.disable()
+
+        for name in ["opp_parsing", "search_space.generate",
+                     "search_space.parse", "emit_input"]:
+            self.assertEqual(profiler.phases[name][0], 1, name)
+        self.assertEqual(profiler.counters["search_space_regions"],
+                         len(search_space))
+        self.assertEqual(profiler.counters["input_regions"], len(task_map))
+
+
+class TestCommandProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.out_dir = os.path.join(self.temp_dir.name, "profiles")
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in [profiling.PROFILE_OUT_ENV, profiling.PROFILE_MEMORY_ENV]:
+            os.environ.pop(name, None)
+        self.addCleanup(profiling.disable)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_disabled(self):
+        with profiling.command_profile("merge") as path:
+            self.assertIsNone(path)
+        self.assertFalse(os.path.exists(self.out_dir))
+
+    def test_pstats(self):
+        paths = []
+        for command, out_dir in [("minimize", self.out_dir),
+                                 ("feedback", None), ("feedback", None)]:
+            os.environ[profiling.PROFILE_OUT_ENV] = self.out_dir
+            with profiling.command_profile(command, out_dir) as path:
+                sorted(range(1000))
+            paths.append(path)
+        self.assertEqual([os.path.basename(path) for path in paths],
+                         ["minimize-0001", "feedback-0002", "feedback-0003"])
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         ["feedback-0002.pstats", "feedback-0003.pstats",
+                          "minimize-0001.pstats"])
+        stats = pstats.Stats(paths[0] + ".pstats")
+        self.assertIn("<built-in method builtins.sorted>",
+                      [function for _, _, function in stats.stats])
+
+    def test_memory(self):
+        os.environ[profiling.PROFILE_MEMORY_ENV] = "1"
+        with profiling.command_profile("minimize", self.out_dir) as path:
+            with profiling.phase("search_space.parse"):
+                with profiling.phase("opp_parsing"):
+                    data = [str(index) for index in range(10000)]
+            with profiling.phase("propose"):
+                pass
+        self.assertFalse(tracemalloc.is_tracing())
+        # No phase profiler is left enabled.
+        self.assertIsNone(profiling.disable())
+        with open(path + ".memory.txt") as file:
+            report = file.read()
+        self.assertIn("Top allocation growth up to the end of "
+                      "search_space.parse", report)
+        self.assertIn("propose", report)
+        # Only the outermost phases are snapshotted.
+        self.assertNotIn("opp_parsing", report)
+        self.assertIn(__file__, report)
+        del data
+
+    def test_memory_with_phases(self):
+        profiler = profiling.enable()
+        with profiling.command_profile("feedback", self.out_dir,
+                                       memory=True) as path:
+            with profiling.phase("propose"):
+                pass
+        self.assertIs(profiling.disable(), profiler)
+        self.assertIsNone(profiler.on_phase_end)
+        self.assertEqual(profiler.phases["propose"][0], 1)
+        with open(path + ".memory.txt") as file:
+            self.assertIn("propose", file.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
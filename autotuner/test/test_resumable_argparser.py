@@ -67,3 +67,53 @@ class ParserTest(unittest.TestCase):
         parsed = self.parser.parse_args(['minimize', '--use-dynamic-values'])
         self.assertTrue(parsed.use_dynamic_values)
 
+
+    def test_region_pruning_thresholds(self):
+        parsed = self.parser.parse_args(['minimize'])
+        self.assertIsNone(parsed.prune_min_size)
+        self.assertIsNone(parsed.prune_min_dynamic_values)
+
+        parsed = self.parser.parse_args(['maximize', '--prune-min-size', '16',
+                                         '--prune-min-depth', '2'])
+        self.assertEqual(parsed.prune_min_size, 16)
+        self.assertEqual(parsed.prune_min_depth, 2)
+
+    def test_decompose(self):
+        parsed = self.parser.parse_args(['minimize'])
+        self.assertIsNone(parsed.decompose)
+
+        parsed = self.parser.parse_args(['minimize', '--decompose', 'file'])
+        self.assertEqual(parsed.decompose, 'file')
+
+        parsed = self.parser.parse_args(['feedback', '1.0',
+                                         '--group-feedback-file', 'a.csv'])
+        self.assertEqual(parsed.group_feedback_file, 'a.csv')
+
+    def test_optimal_configs_workload(self):
+        parsed = self.parser.parse_args(['minimize'])
+        self.assertEqual(parsed.workload, '')
+
+        parsed = self.parser.parse_args(['maximize', '--workload', 'large',
+                                         '--use-hash-matching',
+                                         '--use-optimal-configs', 'reuse'])
+        self.assertEqual(parsed.workload, 'large')
+
+        parsed = self.parser.parse_args(['finalize'])
+        self.assertEqual(parsed.config_update_policy, 'better')
+        parsed = self.parser.parse_args(['finalize',
+                                         '--store-optimal-configs',
+                                         '--config-update-policy',
+                                         'overwrite'])
+        self.assertEqual(parsed.config_update_policy, 'overwrite')
+
+    def test_export_import_configs(self):
+        parsed = self.parser.parse_args(['export-configs', 'configs.jsonl'])
+        self.assertEqual(parsed.file, 'configs.jsonl')
+        self.assertIsNone(parsed.config_db)
+        self.assertEqual(parsed.chunk_size, 1000)
+
+        parsed = self.parser.parse_args(['import-configs', 'configs.jsonl.gz',
+                                         '--config-db', 'sqlite:///a.db',
+                                         '--chunk-size', '10'])
+        self.assertEqual(parsed.config_db, 'sqlite:///a.db')
+        self.assertEqual(parsed.chunk_size, 10)
@@ -204,6 +204,12 @@ class TestAutoRun(unittest.TestCase):
         # created properly.
         mock_result.assert_called_with(time=0, rate=60)
 
+        # The commit is left to next_config() when it follows.
+        self.auto_tuner.api.reset_mock()
+        self.auto_tuner.feedback([70], commit=False)
+        self.auto_tuner.api.commit.assert_not_called()
+        self.auto_tuner.api.session.flush.assert_called_once()
+
     @mock.patch("autotuner.resumable.interface.create_config_db_session")
     @mock.patch("autotuner.resumable.interface.Result")
     @mock.patch.object(AutoTunerState, "_init_search_space")
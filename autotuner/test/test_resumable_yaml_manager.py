@@ -4,6 +4,7 @@
 Tests for Autotuner's yaml manager for resumable interface.
 Copyright (C) 2022-2022, Huawei Technologies Co., Ltd. All rights reserved.
 """
+import json
 import os
 import shutil
 import subprocess
@@ -140,6 +141,127 @@ class YAMLTest(unittest.TestCase):
         self.assertTrue(self.cmp_files(expected, self.args.output))
 
 
+    def test_static_pruning(self):
+        """
+        Verify that code regions below the static pruning thresholds are left
+        out of the search space, and that code regions without the matching
+        metadata are kept.
+        """
+        opp_file = os.path.join(
+            os.path.dirname(__file__),
+            "Inputs",
+            "region_pruning",
+            "loop_static_meta.yaml",
+        )
+        yaml_manager = YAMLManager()
+
+        def region_names(search_space):
+            return [elem['CodeRegion']['Name'] for elem in search_space]
+
+        search_space = yaml_manager.generate_search_space(
+            [opp_file], self.args.search_config_file)
+        self.assertEqual(region_names(search_space),
+                         ["for.cond10.preheader", "for.body13", "for.body4",
+                          "for.body"])
+
+        search_space = yaml_manager.generate_search_space(
+            [opp_file], self.args.search_config_file,
+            pruning_thresholds={"size": 8})
+        self.assertEqual(region_names(search_space),
+                         ["for.cond10.preheader", "for.body13", "for.body"])
+
+        search_space = yaml_manager.generate_search_space(
+            [opp_file], self.args.search_config_file,
+            pruning_thresholds={"depth": 2, "dynamic_values": 2})
+        self.assertEqual(region_names(search_space),
+                         ["for.body4", "for.body"])
+
+        search_space = yaml_manager.generate_search_space(
+            [opp_file], self.args.search_config_file,
+            pruning_thresholds={"size": None, "depth": 3})
+        self.assertEqual(region_names(search_space), ["for.body"])
+
+
+    def test_search_space_dimensions(self):
+        search_space = [
+            {'Params': {'UnrollCount': {'Type': 'enum',
+                                        'Value': [0, 1, 2, 4, 8]},
+                        'ForceInline': {'Type': 'bool'}}},
+            {'Params': {'PeelCount': {'Type': 'int', 'Min': 0, 'Max': 9}}},
+        ]
+        dimensions, log_size = yamlmanager.search_space_dimensions(
+            search_space)
+        self.assertEqual(dimensions, 3)
+        self.assertAlmostEqual(log_size, 2)
+
+
+    def test_param_encoders(self):
+        """
+        Verify the arguments written for each kind of parameter, with the
+        encoders built by parse_search_space() and with those built for a
+        task of an older tuning state.
+        """
+        search_space = [{
+            'TuningId': 12,
+            'CodeRegion': {'Pass': 'loop-unroll', 'Name': 'for.body',
+                           'Function': 'main', 'CodeRegionType': 'loop',
+                           'Hashcode': '7', 'Invocation': '0'},
+            'Params': {'UnrollCount': {'Type': 'enum', 'Value': [0, 2, 4]},
+                       'MachineScheduling': {
+                           'Type': 'enum',
+                           'Value': ['TopDown', 'BottomUp', 'Bidirectional']},
+                       'OptPass': {'Type': 'permutation',
+                                   'Value': ['licm', 'gvn']}}}]
+        task_map = YAMLManager().parse_search_space(search_space)
+        task = task_map[12]
+        self.assertEqual([encoder.raw_name for encoder in task.encoders],
+                         ['UnrollCount', 'MachineScheduling', 'OptPass'])
+        config = {'12UnrollCount': 4, '12MachineScheduling': 'BottomUp',
+                  '12OptPass': ['gvn', 'licm']}
+        expected = [{'UnrollCount': 4}, {'ForceBottomUp': 1},
+                    {'ForceTopDown': 0}, {'OptPass': ['gvn', 'licm']}]
+        remarks = yamlmanager._prepare_remarks(config, task_map, False)
+        self.assertEqual(remarks[0].Args, expected)
+
+        task.encoders = None
+        remarks = yamlmanager._prepare_remarks(config, task_map, False)
+        self.assertEqual(remarks[0].Args, expected)
+        self.assertEqual(task.encoders[2].raw_name, 'OptPass')
+
+
+    def test_omit_baseline(self):
+        """
+        Verify that code regions at their baseline decision are left out of
+        the LLVM input with omit_baseline.
+        """
+        opp_file = os.path.join(
+            os.path.dirname(__file__), "Inputs", "opp", "baseline.yaml"
+        )
+        yaml_manager = YAMLManager()
+        search_space = yaml_manager.generate_search_space(
+            [opp_file], self.args.search_config_file)
+        baseline_file = os.path.join(self.temp_dir.name, "baseline.json")
+        task_map = yaml_manager.parse_search_space(search_space, False, True,
+                                                   baseline_file)
+        with open(baseline_file) as file:
+            config = json.load(file)
+
+        def region_names(omit_baseline):
+            yaml_manager.build_llvm_input(config, task_map, self.args.output,
+                                          omit_baseline=omit_baseline)
+            with open(self.args.output) as file:
+                return [getattr(remark, "Name", None) for remark
+                        in yaml.load_all(file, Loader=Loader)]
+
+        all_regions = region_names(False)
+        self.assertEqual(len(all_regions), 5)
+        self.assertEqual(region_names(True), ["dummy"])
+        config["5UnrollCount"] = 2
+        config["2MachineScheduling"] = "TopDown"
+        self.assertEqual(region_names(True),
+                         [all_regions[1], all_regions[4]])
+
+
     def test_yaml_dump(self):
         """
         Verify that each code region is dumped on a single line.
@@ -4,14 +4,18 @@
 Tests for run command
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
+import json
 import os
+import tempfile
 import unittest
 import unittest.mock as mock
 import yaml
 from configparser import ConfigParser
+from autotuner.main import _parse_fidelity_run_cmds
 from autotuner.main import run_main
 from autotuner.tuners.simple_tuner import SimpleTuner
 from autotuner.yamlmanager import YAMLManager
+from opentuner import MeasurementInterface
 from opentuner import Result
 try:
     from yaml import CLoader as Loader
@@ -36,6 +40,10 @@ class TestAutotunerRun(unittest.TestCase):
             curr_dir, "Inputs", "run", "search_space_loop_only.yaml")
         self.args.tuner = None
         self.args.output = None
+        self.args.workers = None
+        self.args.run_cpus = None
+        self.args.compile_cpus = None
+        self.args.serialize_runs = False
 
         self.test_configuration_data = {
             '1PeelCount': 0,
@@ -214,6 +222,181 @@ class TestAutotunerRun(unittest.TestCase):
 
         mock_print_errors.assert_called()
 
+    @mock.patch.object(SimpleTuner, "call_program")
+    def test_simpletuner_fidelity_ladder(self, mock_call_program):
+        """
+        Check that candidates are screened with the cheap run commands and
+        only promising ones are run with the full run command
+        """
+        self.args.fidelity_eta = 2
+        # The full run takes 10x the time of the cheap run.
+        scale = {"test": 1, "ref": 10}
+        speed = {}
+
+        def call_program(cmd, cwd, limit):
+            return {"returncode": 0, "time": scale[cmd] * speed["value"]}
+
+        mock_call_program.side_effect = call_program
+        tuner = SimpleTuner(self.args, None, None,
+                            self.args.search_space, None, "some run_dir",
+                            "ref", fidelity_run_cmds=["test"])
+
+        def evaluate(config_hash, value):
+            speed["value"] = value
+            desired_result = mock.MagicMock()
+            desired_result.configuration.hash = config_hash
+            return tuner.evaluate(desired_result, None, None)
+
+        # The first candidate is always validated at full fidelity.
+        result = evaluate("a", 2.0)
+        self.assertEqual(result.time, 20.0)
+        self.assertEqual(tuner._trial_metadata(),
+                         {"fidelity": 2, "fidelities": 2,
+                          "extrapolated": False})
+        # A clearly worse candidate is stopped after the cheap run and
+        # reported with its extrapolated time.
+        mock_call_program.reset_mock()
+        result = evaluate("b", 3.0)
+        mock_call_program.assert_called_once_with(
+            "test", cwd="some run_dir", limit=120)
+        self.assertEqual(result.time, 30.0)
+        self.assertIsNone(result.confidence)
+        self.assertEqual(tuner._trial_metadata(),
+                         {"fidelity": 1, "fidelities": 2,
+                          "extrapolated": True})
+        # A better candidate is promoted to full fidelity.
+        result = evaluate("c", 1.0)
+        self.assertEqual(result.time, 10.0)
+        self.assertEqual(tuner.run_cmd, "ref")
+
+    @mock.patch.object(SimpleTuner, "call_program")
+    def test_simpletuner_trials_file(self, mock_call_program):
+        """
+        Check that the fidelity of each trial is written to the trials file
+        in the output directory
+        """
+        self.args.fidelity_eta = 2
+        self.args.early_termination_factor = None
+        mock_call_program.return_value = {"returncode": 0, "time": 1.0,
+                                          "timeout": False}
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.args.output = output_dir
+            tuner = SimpleTuner(self.args, None, None,
+                                self.args.search_space, "some compile_cmd",
+                                "some run_dir", "ref",
+                                fidelity_run_cmds=["test"])
+            desired_result = mock.MagicMock()
+            desired_result.id = 7
+            desired_result.configuration.hash = "a"
+            with mock.patch.object(tuner, "_build_llvm_input"):
+                tuner.compile_and_run(desired_result, None, None)
+                # Compilation errors have no fidelity.
+                mock_call_program.return_value = {
+                    "returncode": 1, "time": 1.0, "timeout": False,
+                    "stderr": ""}
+                tuner.compile_and_run(desired_result, None, None)
+            with open(os.path.join(output_dir, "trials.jsonl")) as file:
+                trials = [json.loads(line) for line in file]
+        self.assertEqual(trials, [
+            {"trial": 7, "configuration": "a", "state": "OK",
+             "fidelity": 2, "fidelities": 2, "extrapolated": False,
+             "measurement": {"run_cpus": None, "compile_cpus": None,
+                             "serialized_runs": False, "runs": 0,
+                             "run_time_variation": None}},
+            {"trial": 7, "configuration": "a", "state": "ERROR"}])
+
+    @mock.patch.object(MeasurementInterface, "call_program")
+    def test_simpletuner_early_termination(self, mock_call_program):
+        """
+        Check that runs slower than the fastest run times the early
+        termination factor are killed and reported as censored results
+        """
+        self.args.fidelity_eta = 3
+        self.args.early_termination_factor = 2.0
+        tuner = SimpleTuner(self.args, None, None,
+                            self.args.search_space, None, "some run_dir",
+                            "some run_cmd")
+        desired_result = mock.MagicMock()
+
+        mock_call_program.return_value = {"returncode": 0, "time": 10,
+                                          "timeout": False}
+        result = tuner.evaluate(desired_result, None, None)
+        self.assertEqual(result.time, 10)
+        mock_call_program.assert_called_once_with(
+            "some run_cmd", limit=120, memory_limit=None, cwd="some run_dir")
+
+        mock_call_program.reset_mock()
+        mock_call_program.return_value = {"returncode": -9, "time": 20,
+                                          "timeout": True, "stderr": ""}
+        result = tuner.evaluate(desired_result, None, None)
+        mock_call_program.assert_called_once_with(
+            "some run_cmd", limit=20.0, memory_limit=None, cwd="some run_dir")
+        self.assertEqual(result.state, "TIMEOUT")
+        self.assertEqual(result.time, 20.0)
+
+    @mock.patch("autotuner.tuners.metrics.stream_program")
+    @mock.patch.object(MeasurementInterface, "call_program")
+    def test_simpletuner_cpu_isolation(self, mock_call_program,
+                                       mock_stream_program):
+        """
+        Check that runs are pinned to the run CPUs and that the variation of
+        repeated runs of a run command is recorded in the trials file
+        """
+        self.args.run_cpus = [2, 3]
+        self.args.serialize_runs = True
+        self.args.early_termination_factor = None
+        mock_call_program.return_value = {"returncode": 0, "time": 5,
+                                          "timeout": False, "stderr": ""}
+        mock_stream_program.side_effect = [
+            {"returncode": 0, "time": time, "timeout": False,
+             "stopped_early": False, "metrics": {}, "stdout": "",
+             "stderr": ""} for time in (1.0, 1.5, 2.0, 30.0)]
+        tuner = SimpleTuner(self.args, None, None,
+                            self.args.search_space, "some compile_cmd",
+                            "some run_dir", "some run_cmd")
+        self.assertIsNotNone(tuner.run_lock)
+
+        def run(desired_result, desired_input, limit):
+            for _ in range(3):
+                tuner.call_program(tuner.run_cmd, cwd=tuner.run_dir)
+            # Not a repeat of the run command.
+            tuner.call_program("some other run_cmd", cwd=tuner.run_dir)
+            return Result(time=1.5)
+
+        desired_result = mock.MagicMock()
+        desired_result.id = 1
+        desired_result.configuration.hash = "a"
+        with tempfile.TemporaryDirectory() as output_dir, \
+                mock.patch.object(tuner, "_build_llvm_input"), \
+                mock.patch.object(tuner, "run", side_effect=run):
+            tuner.trials_file = os.path.join(output_dir, "trials.jsonl")
+            tuner.compile_and_run(desired_result, None, None)
+            with open(tuner.trials_file) as file:
+                measurement = json.loads(file.read())["measurement"]
+
+        # Compilations are not pinned without compile CPUs.
+        mock_call_program.assert_called_once_with(
+            "some compile_cmd", limit=1500, memory_limit=None, cwd=None)
+        mock_stream_program.assert_any_call(
+            "some run_cmd", [], cwd="some run_dir", limit=None,
+            max_lines=None, cpus=[2, 3], memory_limit=None)
+        self.assertEqual(measurement["run_cpus"], "2-3")
+        self.assertTrue(measurement["serialized_runs"])
+        self.assertEqual(measurement["runs"], 4)
+        self.assertAlmostEqual(measurement["run_time_variation"], 1 / 3.0)
+        self.assertEqual(len(tuner.run_time_variations), 1)
+
+    def test_parse_fidelity_run_cmds(self):
+        config = ConfigParser()
+        config["Compiling Setting"] = {
+            "FidelityRunCommands": "\n./run --size=test\n./run --size=train"}
+        self.assertEqual(
+            _parse_fidelity_run_cmds(config["Compiling Setting"]),
+            ["./run --size=test", "./run --size=train"])
+        config["Compiling Setting"] = {}
+        self.assertEqual(
+            _parse_fidelity_run_cmds(config["Compiling Setting"]), [])
+
 
 if __name__ == "__main__":
     unittest.main(buffer=True)
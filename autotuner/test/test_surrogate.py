@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the surrogate-model-guided search technique.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import random
+import unittest
+
+import dill as pickle
+import numpy
+
+from opentuner import ConfigurationManipulator
+from opentuner import Result
+from opentuner.search import technique
+from opentuner.search.manipulator import EnumParameter
+from opentuner.search.manipulator import IntegerParameter
+from opentuner.search.manipulator import PermutationParameter
+
+from autotuner.search.surrogate import RandomForest
+from autotuner.search.surrogate import SurrogateRandomForest
+from autotuner.search.surrogate import encode_configuration
+from autotuner.search.surrogate import expected_improvement
+from autotuner.search.surrogate import is_censored
+
+
+class SurrogateTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.manipulator = ConfigurationManipulator()
+        self.manipulator.add_parameter(
+            EnumParameter("1UnrollCount", [0, 1, 2, 4, 8]))
+        self.manipulator.add_parameter(
+            IntegerParameter("2PeelCount", 0, 10))
+        self.manipulator.add_parameter(
+            PermutationParameter("3OptPass", ["sroa", "gvn", "licm"]))
+
+    def test_random_forest_fit(self):
+        features = numpy.random.RandomState(0).uniform(size=(60, 3))
+        targets = 10 * (features[:, 0] > 0.5) + features[:, 1]
+        forest = RandomForest(num_trees=10, seed=0).fit(features, targets)
+        mean, std = forest.predict([[0.9, 0.0, 0.5], [0.1, 0.0, 0.5]])
+        self.assertGreater(mean[0], 8)
+        self.assertLess(mean[1], 2)
+        self.assertTrue(numpy.all(std >= 0))
+
+    def test_expected_improvement(self):
+        scores = expected_improvement([1.0, 2.0, 2.0], [0.1, 0.1, 1.0], 1.5)
+        # A better mean and a larger uncertainty both increase EI.
+        self.assertGreater(scores[0], scores[1])
+        self.assertGreater(scores[2], scores[1])
+        self.assertTrue(numpy.all(scores >= 0))
+
+    def test_encode_configuration(self):
+        item_codes = {}
+        cfg = {"1UnrollCount": 4, "2PeelCount": 10,
+               "3OptPass": ["licm", "sroa", "gvn"]}
+        features = encode_configuration(self.manipulator, cfg, item_codes)
+        self.assertEqual(len(features), 5)
+        self.assertAlmostEqual(features[0], 0.75)
+        self.assertEqual(features[2:], [2 / 3.0, 1.0, 1 / 3.0])
+
+        # Every configuration of the search space has the same length.
+        cfg = self.manipulator.random()
+        self.assertEqual(
+            len(encode_configuration(self.manipulator, cfg, item_codes)), 5)
+
+    def test_is_censored(self):
+        self.assertTrue(is_censored(Result(state="TIMEOUT", time=20.0)))
+        self.assertFalse(is_censored(Result(state="TIMEOUT",
+                                            time=float("inf"))))
+        self.assertFalse(is_censored(Result(state="OK", time=20.0)))
+
+    def test_technique_registered(self):
+        techniques, _ = technique.all_techniques()
+        self.assertIn("SurrogateRandomForest",
+                      [ele.name for ele in techniques])
+
+    def test_technique_serializable(self):
+        # The root technique is saved in the state of resumable tuning runs.
+        surrogate = SurrogateRandomForest()
+        surrogate.observations["hash"] = ({"1UnrollCount": 0}, [0.0], 1.0)
+        restored = pickle.loads(pickle.dumps(surrogate))
+        self.assertEqual(restored.observations, surrogate.observations)
+
+
+if __name__ == "__main__":
+    unittest.main()
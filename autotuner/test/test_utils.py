@@ -12,8 +12,12 @@ import unittest
 import unittest.mock as mock
 
 from autotuner.utils import parse_feedback_file
+from autotuner.utils import parse_group_feedback_file
 from autotuner.utils import create_secure_fd
 from autotuner.utils import check_file_permissions
+from autotuner.utils import format_cpu_list
+from autotuner.utils import isolate_cpus
+from autotuner.utils import parse_cpu_list
 
 
 class TestUtils(unittest.TestCase):
@@ -72,6 +76,43 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(IOError):
             parse_feedback_file(self.temp_file)
 
+    def test_parse_group_feedback_file(self):
+        with open(self.temp_file, "w") as file:
+            file.write("0,main,1.5\n")
+            file.write('0,"foo(int, int)",2\n')
+            file.write("1,main,1.25\n")
+        group_feedback = parse_group_feedback_file(self.temp_file)
+        self.assertEqual({0: {"main": 1.5, "foo(int, int)": 2.0},
+                          1: {"main": 1.25}}, group_feedback)
+
+        with open(self.temp_file, "w") as file:
+            file.write("0,1.5")
+        with self.assertRaises(IOError):
+            parse_group_feedback_file(self.temp_file)
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list("0-3,8, 10-11"),
+                         [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(format_cpu_list([11, 0, 1, 2, 3, 8, 10]),
+                         "0-3,8,10-11")
+        for cpu_list in ["", "a-b", "3-", "-1"]:
+            with self.assertRaises(ValueError):
+                parse_cpu_list(cpu_list)
+
+    @mock.patch("os.sched_getaffinity", create=True,
+                return_value=set(range(8)))
+    def test_isolate_cpus(self, _):
+        self.assertEqual(isolate_cpus(None, None), (None, None))
+        # Compilations use the CPUs left by runs.
+        self.assertEqual(isolate_cpus([0, 1], None),
+                         ([0, 1], [2, 3, 4, 5, 6, 7]))
+        # Shared CPUs are given to runs, unavailable ones are ignored.
+        with self.assertLogs("autotuner.utils", "WARNING"):
+            self.assertEqual(isolate_cpus([0, 1, 9], [1, 2]), ([0, 1], [2]))
+        with self.assertLogs("autotuner.utils", "WARNING"):
+            self.assertEqual(isolate_cpus(list(range(8)), None),
+                             (list(range(8)), None))
+        self.assertEqual(isolate_cpus(None, [4]), (None, [4]))
 
     @mock.patch("logging.Logger.info")
     def test_file_permissions(self, mock_logger):
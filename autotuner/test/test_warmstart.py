@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the similarity based warm start from the configuration database.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from opentuner.search.manipulator import EnumParameter
+
+from autotuner.dbutils import add_code_region_features
+from autotuner.dbutils import create_config_db_session
+from autotuner.dbutils import OptimalConfig
+from autotuner.models import CodeRegion
+from autotuner.models import Task
+from autotuner.warmstart import CodeRegionFeatures
+from autotuner.warmstart import SimilarConfigIndex
+from autotuner.warmstart import tokenize
+from autotuner.yamlmanager import YAMLManager
+
+
+def _code_region(hashcode, name, func_name, unroll_count=None):
+    return {"Hashcode": hashcode, "CodeRegionType": "loop",
+            "Pass": "loop-unroll", "Name": name, "Function": func_name,
+            "DynamicConfigs": {"UnrollCount": [0, 2, 4]},
+            "BaselineConfig": {"UnrollCount": unroll_count}}
+
+
+class WarmStartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config_db = create_config_db_session(self.temp_dir.name)
+        # Optimal configurations of a previous release.
+        for hashcode, name, func_name, unroll_count in [
+                ("1", "for.body", "_Z10matrixMultPfS_i", 4),
+                ("2", "while.cond", "_Z9parseLinePKc", 2)]:
+            add_code_region_features(
+                self.config_db, _code_region(hashcode, name, func_name))
+            entry = OptimalConfig()
+            entry.hashcode = hashcode
+            entry.code_region_type = "loop"
+            entry.pass_name = "loop-unroll"
+            entry.params = [{"UnrollCount": unroll_count}]
+            self.config_db.add(entry)
+        self.config_db.commit()
+
+    def tearDown(self):
+        self.config_db.close()
+        self.temp_dir.cleanup()
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("_ZN4llvm10DenseMapIfE4growEj"),
+                         {"zn", "llvm", "dense", "map", "if", "grow", "ej"})
+        self.assertEqual(tokenize(None), frozenset())
+
+    def test_lookup(self):
+        index = SimilarConfigIndex.from_config_db(self.config_db, 0.5)
+        self.assertEqual(len(index), 2)
+
+        params, score = index.lookup(
+            "loop", "loop-unroll",
+            CodeRegionFeatures("for.body", "_Z10matrixMultPfS_ii"))
+        self.assertEqual(params, [{"UnrollCount": 4}])
+        self.assertGreater(score, 0.5)
+
+        # Code regions of another pass or with unrelated names do not match.
+        self.assertEqual(index.lookup(
+            "loop", "loop-vectorize",
+            CodeRegionFeatures("for.body", "_Z10matrixMultPfS_ii")),
+            (None, 0.0))
+        self.assertEqual(index.lookup(
+            "loop", "loop-unroll",
+            CodeRegionFeatures("for.inc", "_Z7computev")), (None, 0.0))
+
+    def test_seed_baseline(self):
+        # The new release changed the hash of the matrixMult loop.
+        add_code_region_features(
+            self.config_db,
+            _code_region("3", "for.body", "_Z10matrixMultPfS_ii"))
+        task_map = {}
+        for tuning_id, hashcode in [(1, "3"), (2, "4")]:
+            code_region = CodeRegion("loop-unroll", "for.body",
+                                     "_Z10matrixMultPfS_ii", "loop",
+                                     hashcode)
+            param = EnumParameter(str(tuning_id) + "UnrollCount",
+                                  [0, 1, 2, 4, 8])
+            task_map[tuning_id] = Task(tuning_id, [param], code_region)
+
+        filepath = os.path.join(self.temp_dir.name, "initial_config.json")
+        YAMLManager.seed_baseline(task_map, self.config_db, filepath,
+                                  similar_config_threshold=0.5)
+        with open(filepath) as file:
+            seed = json.load(file)
+        self.assertEqual(seed["1UnrollCount"], 4)
+        # Without stored features only the names are compared.
+        self.assertEqual(seed["2UnrollCount"], 4)
+
+        # Without a threshold unmatched code regions keep OpenTuner's seed.
+        with mock.patch.object(EnumParameter, "seed_value", return_value=0):
+            YAMLManager.seed_baseline(task_map, self.config_db, filepath)
+        with open(filepath) as file:
+            seed = json.load(file)
+        self.assertEqual(seed["1UnrollCount"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
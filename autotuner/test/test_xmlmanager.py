@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for Autotuner's xml manager.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+from autotuner.iomanager import InvalidLLVMInputError
+from autotuner.xmlmanager import XMLManager
+
+SEARCH_CONFIG = """<search_config>
+<code_region type="loop"><params>
+<param type="enum"><name>UnrollCount</name><value>0</value><value>4</value>
+</param>
+<param type="bool"><name>Vectorize</name></param>
+</params></code_region>
+</search_config>
+"""
+
+CODE_REGION = """<code_region type="{type}"><name>{name}</name>
+<file_name>{file_name}</file_name><func_name>main</func_name>
+<start_line>{line}</start_line><end_line>{line}</end_line></code_region>
+"""
+
+
+def _opportunities(file_name, regions):
+    """
+    An opportunity file: <code_regions> elements without a root element.
+    """
+    return "".join(
+        "<code_regions>{}</code_regions>\n".format("".join(
+            CODE_REGION.format(type=region_type, name=name,
+                               file_name=file_name, line=line)
+            for line, (region_type, name) in enumerate(group)))
+        for group in regions)
+
+
+class XMLTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config_file = self._write("search_config.xml", SEARCH_CONFIG)
+        self.opp_files = [
+            self._write("a.xml", _opportunities(
+                "a.c", [[("loop", "for.body"), ("callsite", "call")],
+                        [("loop", "for.cond")]])),
+            self._write("b.xml", _opportunities(
+                "b.c", [[("loop", "while.body")]]))]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def test_search_space(self):
+        xml_manager = XMLManager()
+        search_space = xml_manager.generate_search_space(
+            self.opp_files, self.config_file)
+        tasks = search_space.getroot().findall("task")
+        self.assertEqual(
+            [(task.find("code_region/name").text,
+              task.find("tuning_id").text) for task in tasks],
+            [("for.body", "1"), ("for.cond", "2"), ("while.body", "3")])
+        for task in tasks:
+            self.assertEqual(
+                [param.find("name").text
+                 for param in task.find("params").findall("param")],
+                ["UnrollCount", "Vectorize"])
+
+        search_space_file = os.path.join(self.temp_dir.name,
+                                         "search_space.xml")
+        search_space.write(search_space_file)
+        task_map = xml_manager.parse_search_space(search_space_file)
+        self.assertEqual(sorted(task_map), [1, 2, 3])
+        config = {"{}{}".format(tuning_id, name): value
+                  for tuning_id in task_map
+                  for name, value in [("UnrollCount", "4"),
+                                      ("Vectorize", "1")]}
+        llvm_input = os.path.join(self.temp_dir.name, "llvm_input.xml")
+        xml_manager.build_llvm_input(config, task_map, llvm_input)
+        inputs = ElementTree.parse(llvm_input).getroot().findall("input")
+        self.assertEqual(len(inputs), 3)
+        self.assertEqual([param.find("value").text
+                          for param in inputs[0].iter("param")], ["4", "1"])
+
+    def test_merge_and_divide(self):
+        xml_manager = XMLManager()
+        task_map = xml_manager.parse_search_space(
+            xml_manager.generate_search_space(self.opp_files,
+                                              self.config_file))
+        config = {param.name: "0" for task in task_map.values()
+                  for param in task.param_list}
+        inputs = []
+        for index in range(2):
+            inputs.append(os.path.join(self.temp_dir.name,
+                                       "input{}.xml".format(index)))
+            xml_manager.build_llvm_input(config, task_map, inputs[-1])
+
+        merged = xml_manager.parse_llvm_inputs(inputs)
+        self.assertEqual(len(merged.getroot().findall("input")), 6)
+        divided = xml_manager.divide_llvm_input(inputs[0])
+        self.assertEqual(
+            {file_name: len(tree.getroot().findall("input"))
+             for file_name, tree in divided.items()}, {"a.c": 2, "b.c": 1})
+
+    def test_merge_differently_formatted_inputs(self):
+        xml_manager = XMLManager()
+        task_map = xml_manager.parse_search_space(
+            xml_manager.generate_search_space(self.opp_files,
+                                              self.config_file))
+        built = os.path.join(self.temp_dir.name, "built.xml")
+        xml_manager.build_llvm_input(
+            {param.name: "0" for task in task_map.values()
+             for param in task.param_list}, task_map, built)
+        # The same inputs, written compact and pretty-printed.
+        tree = ElementTree.parse(built)
+        for element in tree.getroot().iter():
+            if element.text is not None and not element.text.strip():
+                element.text = None
+            element.tail = None
+        compact = os.path.join(self.temp_dir.name, "compact.xml")
+        tree.write(compact)
+        ElementTree.indent(tree)
+        pretty = os.path.join(self.temp_dir.name, "pretty.xml")
+        tree.write(pretty)
+
+        merged = os.path.join(self.temp_dir.name, "merged.xml")
+        stats = xml_manager.merge_llvm_input_files([compact, pretty], merged,
+                                                   "first")
+        self.assertEqual(stats, {"read": 6, "written": 3, "duplicates": 3,
+                                 "conflicts": 0})
+
+    def test_streaming_merge_and_divide(self):
+        xml_manager = XMLManager()
+        task_map = xml_manager.parse_search_space(
+            xml_manager.generate_search_space(self.opp_files,
+                                              self.config_file))
+        inputs = []
+        for value in ["0", "4", "0"]:
+            inputs.append(os.path.join(self.temp_dir.name,
+                                       "input{}.xml".format(len(inputs))))
+            xml_manager.build_llvm_input(
+                {param.name: value for task in task_map.values()
+                 for param in task.param_list}, task_map, inputs[-1])
+
+        merged = os.path.join(self.temp_dir.name, "merged.xml")
+        # The code regions of the second input have other params: the
+        # inputs read are compared to the ones kept so far.
+        for policy, value, duplicates in [("first", "0", 3),
+                                          ("last", "0", 0)]:
+            stats = xml_manager.merge_llvm_input_files(inputs, merged,
+                                                       policy)
+            self.assertEqual(stats, {"read": 9, "written": 3,
+                                     "duplicates": duplicates,
+                                     "conflicts": 6 - duplicates})
+            root = ElementTree.parse(merged).getroot()
+            self.assertEqual({input_ele.find("params/param/value").text
+                              for input_ele in root.findall("input")},
+                             {value})
+        stats = xml_manager.merge_llvm_input_files(inputs, merged, "prefer",
+                                                   inputs[1])
+        self.assertEqual({input_ele.find("params/param/value").text
+                          for input_ele in ElementTree.parse(
+                              merged).getroot().findall("input")}, {"4"})
+        self.assertEqual(len(xml_manager.parse_llvm_inputs(
+            inputs, "first").getroot().findall("input")), 3)
+
+        stats = xml_manager.merge_llvm_input_files(inputs, merged)
+        self.assertEqual(stats, {"read": 9, "written": 9, "duplicates": 0,
+                                 "conflicts": 0})
+        self.assertEqual(
+            len(ElementTree.parse(merged).getroot().findall("input")), 9)
+
+        # The inputs of a.c and b.c alternate: with a single open file,
+        # a.c.xml is reopened and appended to.
+        output_dir = os.path.join(self.temp_dir.name, "divided")
+        os.mkdir(output_dir)
+        counts = xml_manager.divide_llvm_input_file(merged, output_dir,
+                                                    max_open_files=1)
+        self.assertEqual(counts, {os.path.join(output_dir, "a.c.xml"): 6,
+                                  os.path.join(output_dir, "b.c.xml"): 3})
+        for file_name, values in [("a.c.xml", ["0", "0", "4", "4", "0", "0"]),
+                                  ("b.c.xml", ["0", "4", "0"])]:
+            root = ElementTree.parse(
+                os.path.join(output_dir, file_name)).getroot()
+            self.assertEqual(
+                [input_ele.find("params/param/value").text
+                 for input_ele in root.findall("input")], values)
+
+        invalid = self._write("invalid.xml", "<search_config/>")
+        self.assertRaises(InvalidLLVMInputError,
+                          xml_manager.merge_llvm_input_files, [invalid],
+                          merged)
+        self.assertFalse(os.path.exists(merged))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+# coding=utf-8
+"""
+A tuner driven by the [Metric Setting] section of the config file, so that a
+workload can be tuned without writing a plugin:
+
+    MetricRegex      regular expression whose first group is the metric
+                     (required)
+    MetricSource     stdout (default) or the path of a result file, relative
+                     to RunDir
+    MetricOccurrence first (default) or last match of MetricRegex
+    Objective        min (default) or max
+    Timeout          limit of each run in seconds (default: none)
+    Repetitions      number of runs per configuration; the median metric is
+                     used (default: 1)
+    SuccessMarker    regular expression that must appear in stdout for a run
+                     to succeed (optional)
+    StopWhenCaptured kill a run once the metric (and the success marker) are
+                     found in stdout; requires MetricSource stdout
+                     (default: no)
+
+Use it with '--tuner declarative_tuner'.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import os
+import statistics
+from configparser import Error as ConfigParserError
+from configparser import NoOptionError
+
+from opentuner import Result
+from opentuner.search.objective import MaximizeRate
+from opentuner.search.objective import MinimizeCycle
+from autotuner.tuners.metrics import MetricExtractor
+from autotuner.tuners.tunerbase import CustomTunerBase
+from autotuner.utils import create_secure_fd
+
+SECTION = "Metric Setting"
+_BOOLEANS = {"1": True, "yes": True, "true": True, "on": True,
+             "0": False, "no": False, "false": False, "off": False}
+
+
+def _get(setting, key, default=None):
+    value = setting.get(key, default)
+    return value.strip() if isinstance(value, str) else value
+
+
+def _get_choice(setting, key, choices, default):
+    value = _get(setting, key, default).lower()
+    if value not in choices:
+        raise ConfigParserError("{} must be one of {}, got '{}'".format(
+            key, ", ".join(choices), value))
+    return value
+
+
+def _get_number(setting, key, convert, default):
+    value = _get(setting, key)
+    if not value:
+        return default
+    try:
+        number = convert(value)
+    except ValueError:
+        raise ConfigParserError("Invalid {}: '{}'".format(key, value))
+    if number <= 0:
+        raise ConfigParserError("{} must be positive".format(key))
+    return number
+
+
+class Tuner(CustomTunerBase):
+    """
+    A generic tuner extracting the metric to tune with regular expressions.
+    """
+
+    def __init__(self, *pargs, **kwargs):
+        super(Tuner, self).__init__(*pargs, **kwargs)
+        setting = self.metric_setting or {}
+        regex = _get(setting, "MetricRegex")
+        if not regex:
+            raise NoOptionError("MetricRegex", SECTION)
+        self.metric_source = _get(setting, "MetricSource", "stdout")
+        self.maximize = _get_choice(setting, "Objective",
+                                    ["min", "max"], "min") == "max"
+        last = _get_choice(setting, "MetricOccurrence",
+                           ["first", "last"], "first") == "last"
+        self.run_limit = _get_number(setting, "Timeout", float, None)
+        self.repetitions = _get_number(setting, "Repetitions", int, 1)
+        stop = _get(setting, "StopWhenCaptured", "no").lower()
+        if stop not in _BOOLEANS:
+            raise ConfigParserError(
+                "Invalid StopWhenCaptured: '{}'".format(stop))
+        if _BOOLEANS[stop] and self.metric_source != "stdout":
+            # The result file is only complete once the run finished.
+            raise ConfigParserError(
+                "StopWhenCaptured requires MetricSource = stdout")
+        self.stop_when_captured = _BOOLEANS[stop] and not last
+
+        self.metric = MetricExtractor("metric", regex, float, last=last)
+        self.stdout_extractors = []
+        if self.metric_source == "stdout":
+            self.stdout_extractors.append(self.metric)
+        marker = _get(setting, "SuccessMarker")
+        if marker:
+            self.stdout_extractors.append(
+                MetricExtractor("success", marker, str))
+        self.success_marker = bool(marker)
+
+    def run(self, desired_result, desired_input, limit):
+        """
+        Run the configuration `repetitions` times and return the median
+        metric.
+        """
+        values = []
+        total_time = 0.0
+        for _ in range(self.repetitions):
+            try:
+                run_result = self.stream_program(
+                    self.run_cmd, self.stdout_extractors, cwd=self.run_dir,
+                    limit=self.run_limit,
+                    stop_when_captured=self.stop_when_captured)
+                total_time += run_result['time']
+                value = self._extract(desired_result, run_result)
+            except ValueError as error:
+                # MetricRegex captured text that is not a number.
+                print("Error: invalid metric: {}".format(error))
+                value = None
+            if value is None:
+                return self._result(None, total_time)
+            values.append(value)
+        return self._result(statistics.median(values),
+                            total_time / self.repetitions)
+
+    def _extract(self, desired_result, run_result):
+        if run_result['returncode'] != 0:
+            self._print_errors(self.run_cmd, run_result)
+            return None
+        found = run_result['metrics']
+        if self.success_marker and "success" not in found:
+            self._log_errors(desired_result, run_result['stdout'])
+            return None
+        if self.metric_source != "stdout":
+            found = self.scan_file(self.metric_source, [self.metric],
+                                   cwd=self.run_dir)
+            if found is None:
+                print("Error: result file {} not found".format(
+                    self.metric_source))
+                return None
+        if "metric" not in found:
+            print("Error: metric not found in " + self.metric_source)
+            self._log_errors(desired_result, run_result['stdout'])
+            return None
+        return found["metric"]
+
+    def _result(self, value, time):
+        if self.maximize:
+            return Result(rate=-float('inf') if value is None else value,
+                          time=time)
+        return Result(cycle=float('inf') if value is None else value,
+                      time=time)
+
+    @staticmethod
+    def _log_errors(desired_result, output):
+        if not os.path.isdir('errors_log'):
+            os.mkdir('errors_log')
+        fd = create_secure_fd("errors_log/errors_" +
+                              str(desired_result.configuration.id) + ".log")
+        with os.fdopen(fd, 'w') as error_log_file:
+            error_log_file.write(output)
+
+    def objective(self):
+        """
+        Override the default object MinimizeTime
+        """
+        if self.maximize:
+            return MaximizeRate()
+        return MinimizeCycle()
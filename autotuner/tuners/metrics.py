@@ -0,0 +1,199 @@
+# coding=utf-8
+"""
+Helpers for tuner plugins to extract performance metrics from benchmark
+output without buffering it: process output is streamed line by line
+through compiled regular expressions, result files are scanned line by line
+or read from the end, and a process can be killed as soon as all metrics
+are captured.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import collections
+import os
+import re
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+# Number of trailing output lines kept for error reporting.
+TAIL_LINES = 100
+_BLOCK_SIZE = 8192
+
+
+class MetricExtractor(object):
+    """
+    Extract a metric from a line of text with a compiled regular expression.
+    The value is the first group of the match (or the whole match without
+    groups) passed through `convert`. By default the first match is kept;
+    with `last=True` later matches override it.
+    """
+
+    def __init__(self, name, pattern, convert=float, last=False):
+        self.name = name
+        self.regex = re.compile(pattern)
+        self.convert = convert
+        self.last = last
+
+    def search(self, line):
+        """
+        Returns the converted value found in `line`, or None.
+        """
+        match = self.regex.search(line)
+        if match is None:
+            return None
+        return self.convert(match.group(1) if self.regex.groups
+                            else match.group(0))
+
+
+def _feed(extractors, metrics, line):
+    """
+    Feed `line` to the extractors still looking for a value. Returns True
+    once every extractor has captured a value it will not override; never
+    without extractors, since nothing is captured then.
+    """
+    done = bool(extractors)
+    for extractor in extractors:
+        if extractor.name in metrics and not extractor.last:
+            continue
+        value = extractor.search(line)
+        if value is not None:
+            metrics[extractor.name] = value
+        if extractor.last or extractor.name not in metrics:
+            done = False
+    return done
+
+
+def _kill(process):
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # The process has already exited.
+        pass
+
+
+def _preexec(cpus, memory_limit):
+    """
+    A preexec_fn pinning the child to `cpus` and limiting its address space
+    to `memory_limit` bytes, or None if there is nothing to set.
+    """
+    if not cpus and not memory_limit:
+        return None
+
+    def preexec():
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        if memory_limit:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (memory_limit, memory_limit))
+    return preexec
+
+
+def stream_program(cmd, extractors, cwd=None, limit=None,
+                   stop_when_captured=False, max_lines=TAIL_LINES,
+                   cpus=None, memory_limit=None):
+    """
+    Run `cmd` in a shell and extract metrics from its stdout line by line.
+
+    Args:
+        cmd: the command to run.
+        extractors: a list of MetricExtractor.
+        cwd: the working directory of the command.
+        limit: kill the command after `limit` seconds.
+        stop_when_captured: kill the command as soon as every extractor
+            captured its value (none may use `last=True`); never without
+            extractors.
+        max_lines: number of trailing stdout lines returned (None for all).
+        cpus: pin the command to these CPUs.
+        memory_limit: limit the address space of the command (bytes).
+
+    Returns a dict similar to the one of MeasurementInterface.call_program:
+    'returncode', 'time', 'timeout', 'stderr', 'stdout' (only the last
+    `max_lines` lines), 'metrics' (name -> value) and 'stopped_early'
+    (killed after capturing all metrics; returncode is then 0).
+    """
+    metrics = {}
+    tail = collections.deque(maxlen=max_lines)
+    timed_out = threading.Event()
+    stopped_early = False
+    start = time.time()
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, shell=True, cwd=cwd,
+                                   stdout=subprocess.PIPE, stderr=stderr_file,
+                                   universal_newlines=True, errors="replace",
+                                   start_new_session=(os.name != "nt"),
+                                   preexec_fn=_preexec(cpus, memory_limit))
+
+        def on_timeout():
+            timed_out.set()
+            _kill(process)
+
+        timer = threading.Timer(limit, on_timeout) if limit else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        try:
+            with process.stdout:
+                for line in process.stdout:
+                    tail.append(line)
+                    if _feed(extractors, metrics, line) and \
+                            stop_when_captured:
+                        stopped_early = True
+                        _kill(process)
+                        break
+            process.wait()
+        except BaseException:
+            # E.g. a value the extractor cannot convert.
+            _kill(process)
+            process.wait()
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors="replace")
+
+    return {'returncode': 0 if stopped_early else process.returncode,
+            'time': time.time() - start,
+            'timeout': timed_out.is_set(),
+            'stopped_early': stopped_early,
+            'metrics': metrics,
+            'stdout': "".join(tail),
+            'stderr': stderr}
+
+
+def scan_file(path, extractors, stop_when_captured=True):
+    """
+    Extract metrics from the file at `path` line by line; stops reading once
+    every extractor captured its value if `stop_when_captured` is set.
+    Returns a dict of name -> value.
+    """
+    metrics = {}
+    with open(path, errors="replace") as file:
+        for line in file:
+            if _feed(extractors, metrics, line) and stop_when_captured:
+                break
+    return metrics
+
+
+def tail_lines(path, count):
+    """
+    Returns the last `count` lines of the file at `path` (as readlines()
+    would return them) by reading it backwards from the end.
+    """
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        data = b""
+        # One more line break than lines needed makes the first line whole.
+        while position > 0 and data.count(b"\n") <= count:
+            size = min(_BLOCK_SIZE, position)
+            position -= size
+            file.seek(position)
+            data = file.read(size) + data
+    lines = data.decode(errors="replace").splitlines(True)
+    return lines[-count:] if count > 0 else []
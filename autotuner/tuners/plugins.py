@@ -0,0 +1,180 @@
+# coding=utf-8
+"""
+Discovery and loading of the tuners selected with --tuner: the tuners of a
+plugin directory (--plugin-dir), of autotuner.tuners, and of installed
+packages declaring an entry point in the "autotuner.tuners" group, e.g. in
+their setup.py:
+
+    entry_points={"autotuner.tuners": ["my_tuner = my_package.my_tuner"]}
+
+An entry point refers to a module defining a Tuner class, or to the tuner
+class itself ("my_package.my_tuner:MyTuner").
+
+The tuners found in a directory are cached in tuners.json of
+AUTOTUNE_CACHE_DIR (default: ~/.cache/autotuner), and in memory, along with
+the modification time of the directory.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import importlib
+import importlib.util
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+
+from autotuner.utils import create_secure_fd
+
+log = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "autotuner.tuners"
+CACHE_FILE = "tuners.json"
+
+_TUNER_FILE = re.compile(r'^(.*)[.]py(c?)$')
+# Directory -> (modification time, tuners).
+_DIR_CACHE = {}
+
+
+def _cache_path():
+    cache_dir = os.environ.get("AUTOTUNE_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "autotuner")
+    return os.path.join(cache_dir, CACHE_FILE)
+
+
+def _read_cache(path):
+    try:
+        with open(path) as cache_file:
+            cache = json.load(cache_file)
+        if isinstance(cache, dict):
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _write_cache(path, cache):
+    # The cache is an optimization: failing to write it is not an error.
+    temp_path = "{}.{}".format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with os.fdopen(create_secure_fd(temp_path), 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(temp_path, path)
+    except OSError as error:
+        log.debug("Cannot write the tuner cache %s: %s", path, error)
+
+
+def _scan_tuners(directory):
+    tuners = []
+    for exist_file in sorted(os.listdir(directory)):
+        match = _TUNER_FILE.match(exist_file)
+        if match:
+            module = match.group(1)
+            if module[-6:].lower() == '_tuner' and module not in tuners:
+                tuners.append(module)
+    return tuple(tuners)
+
+
+def find_tuners(directory):
+    """
+    Returns the names of the tuner modules (*_tuner.py or .pyc) of
+    directory, cached as long as the directory is not modified.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return ()
+    key = os.path.realpath(directory)
+    cached = _DIR_CACHE.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    path = _cache_path()
+    cache = _read_cache(path)
+    entry = cache.get(key)
+    if isinstance(entry, dict) and entry.get("mtime_ns") == mtime:
+        tuners = tuple(entry.get("tuners", ()))
+    else:
+        tuners = _scan_tuners(directory)
+        cache[key] = {"mtime_ns": mtime, "tuners": list(tuners)}
+        _write_cache(path, cache)
+    _DIR_CACHE[key] = (mtime, tuners)
+    return tuners
+
+
+def _entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        from importlib_metadata import entry_points
+    entry_point_map = entry_points()
+    if hasattr(entry_point_map, "select"):
+        return list(entry_point_map.select(group=ENTRY_POINT_GROUP))
+    return list(entry_point_map.get(ENTRY_POINT_GROUP, ()))
+
+
+def _builtin_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def get_available_tuners(tuner_dir):
+    """
+    Returns the names of the tuners of tuner_dir (if set), of
+    autotuner.tuners and of the installed entry points.
+    """
+    tuners = find_tuners(tuner_dir) if tuner_dir else ()
+    default_tuners = find_tuners(_builtin_dir())
+    installed_tuners = tuple(
+        entry_point.name for entry_point in _entry_points()
+        if entry_point.name not in tuners + default_tuners)
+    return tuners + default_tuners + installed_tuners
+
+
+def _load_module_file(name, module_file):
+    module = sys.modules.get(name)
+    if module is not None and \
+            getattr(module, "__file__", None) == module_file:
+        return module
+    spec = importlib.util.spec_from_file_location(name, module_file)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def load_tuner(name, tuner_dir=None):
+    """
+    Returns the Tuner class of the tuner `name`, looked up in tuner_dir (if
+    set), then in autotuner.tuners, then in the installed entry points.
+
+    Raises:
+        IOError: tuner_dir does not exist.
+        ImportError: no tuner is named `name`.
+    """
+    if tuner_dir:
+        if not os.path.isdir(tuner_dir):
+            raise IOError("Error: " + tuner_dir + " not found")
+        for extension in (".py", ".pyc"):
+            module_file = os.path.abspath(
+                os.path.join(tuner_dir, name + extension))
+            if os.path.isfile(module_file):
+                return getattr(_load_module_file(name, module_file), 'Tuner')
+
+    if name in find_tuners(_builtin_dir()):
+        return getattr(importlib.import_module("autotuner.tuners." + name),
+                       'Tuner')
+
+    for entry_point in _entry_points():
+        if entry_point.name == name:
+            loaded = entry_point.load()
+            if inspect.ismodule(loaded):
+                return getattr(loaded, 'Tuner')
+            return loaded
+
+    raise ImportError("No tuner named " + name)
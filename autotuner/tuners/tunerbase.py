@@ -4,14 +4,25 @@ Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
 import abc
 import argparse
+import json
+import math
 import os
-import re
+import statistics
+import tempfile
+import threading
 from datetime import datetime
+from types import SimpleNamespace
 
 from opentuner import ConfigurationManipulator
 from opentuner import MeasurementInterface
 from opentuner import Result
+import autotuner.utils as utils
+from autotuner import profiling
+from autotuner.distributed import WorkerError
+from autotuner.iomanager import llvm_input_shard_dir
 from autotuner.iomanagerutils import create_io_manager
+from autotuner.tuners import metrics
+from autotuner.search.surrogate import objective_value
 
 argument_parser = argparse.ArgumentParser(add_help=False)
 argument_parser.add_argument('--time-after-convergence', '-tac', type=float,
@@ -21,9 +32,69 @@ argument_parser.add_argument('--time-after-convergence', '-tac', type=float,
 argument_parser.add_argument('-o', '--output', metavar='DIR',
                              help='write optimal yaml config into the given '
                                   'directory')
+argument_parser.add_argument('--fidelity-eta', type=int, default=3,
+                             metavar='ETA',
+                             help='with FidelityRunCommands in the config '
+                                  'file, promote a candidate to the next run '
+                                  'command only if it ranks in the best 1/ETA '
+                                  'of the candidates run with its current one')
+argument_parser.add_argument('--early-termination-factor', type=float,
+                             metavar='FACTOR',
+                             help='kill a run once it takes FACTOR times as '
+                                  'long as the fastest run so far and report '
+                                  'it as a censored (TIMEOUT) result')
+argument_parser.add_argument('--run-cpus', type=utils.parse_cpu_list,
+                             metavar='CPUS',
+                             help='pin the runs of the program to the CPU '
+                                  'list CPUS (e.g. 0-3,8)')
+argument_parser.add_argument('--compile-cpus', type=utils.parse_cpu_list,
+                             metavar='CPUS',
+                             help='pin compilations (and the tuner) to the '
+                                  'CPU list CPUS; defaults to the CPUs not '
+                                  'in --run-cpus')
+argument_parser.add_argument('--serialize-runs', action='store_true',
+                             help='never run two trials at the same time, '
+                                  'while compilations of parallel trials '
+                                  'proceed (see --workers)')
+argument_parser.add_argument('--workers', type=int, metavar='N',
+                             help='compile and run trials in parallel on N '
+                                  'workers (see the worker command), each '
+                                  'with its own build tree')
+argument_parser.add_argument('--listen', default='127.0.0.1:0',
+                             metavar='HOST:PORT',
+                             help='address the workers connect to (default: '
+                                  '%(default)s, i.e. a free local port)')
+argument_parser.add_argument('--local-workers', action='store_true',
+                             help='start the --workers as local processes, '
+                                  'each building in its own copy of '
+                                  'CompileDir')
+argument_parser.add_argument('--worker-timeout', type=float, default=300,
+                             metavar='SECONDS',
+                             help='fail if the --workers are not all '
+                                  'connected after SECONDS '
+                                  '(default: %(default)s)')
+argument_parser.add_argument('--worker-retries', type=int, default=2,
+                             metavar='N',
+                             help='retry a trial on another worker at most N '
+                                  'times if its worker fails '
+                                  '(default: %(default)s)')
+argument_parser.add_argument('--omit-baseline-regions', action='store_true',
+                             help='leave the code regions whose parameters '
+                                  'all take the baseline decision of the '
+                                  'compiler (BaselineConfig) out of the llvm '
+                                  'input')
+argument_parser.add_argument('--shard-llvm-input', action='store_true',
+                             help='also write the llvm input as one file per '
+                                  'source file, with a manifest, into '
+                                  '<input>.shards/ next to it, so that each '
+                                  'compilation can read only its own shard')
 
 STAGES = ['module', 'function', 'loop', 'machine_basic_block']
 
+# One JSON line per trial, in the output directory, with what opentuner's
+# results database has no field for.
+TRIALS_FILE = 'trials.jsonl'
+
 
 class TunerBase(MeasurementInterface):
     """
@@ -33,7 +104,7 @@ class TunerBase(MeasurementInterface):
     def __init__(self, args, compile_dir, llvm_config_file, search_space,
                  compile_cmd, fixed_llvm_config_files=None,
                  enable_final_compile=False, stage=None, config_db=None,
-                 *pargs, **kwargs):
+                 coordinator=None, *pargs, **kwargs):
         super(TunerBase, self).__init__(args, *pargs,
                                         **kwargs)
         self.iomanager = create_io_manager(args.parse_format)
@@ -43,6 +114,8 @@ class TunerBase(MeasurementInterface):
         self.task_map = self.iomanager.parse_search_space(search_space)
         self.config_db = config_db
         self.use_hash_matching = args.use_hash_matching
+        self.omit_baseline = args.omit_baseline_regions
+        self.shard_llvm_input = args.shard_llvm_input
 
         if fixed_llvm_config_files:
             self.fixed_llvm_config_tree = self.iomanager.parse_llvm_inputs(
@@ -59,6 +132,8 @@ class TunerBase(MeasurementInterface):
             self.output_dir = args.output
         else:
             self.output_dir = ""
+        self.trials_file = os.path.join(self.output_dir, TRIALS_FILE)
+        self._trials_lock = threading.Lock()
         if stage and not stage in STAGES:
             # if a stage is specified, it must be one of machine_basic_block,
             # function, loop, or module
@@ -66,6 +141,27 @@ class TunerBase(MeasurementInterface):
             raise Exception("Illegal stage: " + stage)
         self.stage = stage
 
+        # With a coordinator, trials are compiled and run on workers in
+        # parallel through compile()/run_precompiled().
+        self.coordinator = coordinator
+        if coordinator is not None:
+            self.parallel_compile = True
+        # Commands and directories the workers replace with their own.
+        self.templates = {compile_cmd: "CompileCommand",
+                          compile_dir: "CompileDir"}
+        self._remote = threading.local()
+
+        # Measurement isolation: CPU sets of runs and compilations (see
+        # utils.isolate_cpus), and a lock serializing runs.
+        self.run_cpus = args.run_cpus
+        self.compile_cpus = args.compile_cpus
+        self.run_lock = threading.Lock() if args.serialize_runs else None
+        self._measurements = _Measurements()
+        # Coefficient of variation of the run times of trials running a run
+        # command more than once.
+        self.run_time_variations = []
+
+    @profiling.timed("manipulator")
     def manipulator(self):
         """
         Overide manipulator from MeasurementInterface.
@@ -77,21 +173,228 @@ class TunerBase(MeasurementInterface):
         return manipulator
 
     def compile(self, config_data=None, compile_id=None):
+        if self.coordinator is not None and config_data is not None:
+            return self._run_on_worker(config_data, compile_id)
         # run the compile command
         compile_result = self.call_program(self.compile_cmd,
                                            cwd=self.compile_dir, limit=1500)
         return compile_result
 
+    def run_precompiled(self, desired_result, desired_input, limit,
+                        compile_result, result_id):
+        """
+        With a coordinator, compile() already returned the Result of the
+        whole trial.
+        """
+        return compile_result
+
+    def _run_on_worker(self, config_data, compile_id):
+        """
+        Run compile_and_run for `config_data` on a worker; called by the
+        measurement driver from one thread per pending trial.
+        """
+        # compile() only gets the configuration data and the id of the
+        # desired result, which is enough for compile_and_run.
+        configuration = SimpleNamespace(
+            data=config_data, id=compile_id,
+            hash=self.manipulator().hash_config(config_data))
+        desired_result = SimpleNamespace(id=compile_id,
+                                         configuration=configuration)
+
+        def trial(worker):
+            self._remote.worker = worker
+            try:
+                return self.compile_and_run(desired_result, None, None)
+            finally:
+                self._remote.worker = None
+
+        try:
+            return self.coordinator.run_trial(trial)
+        except WorkerError as error:
+            print(error)
+            return Result(state='ERROR', time=float('inf'),
+                          cycle=float('inf'), rate=-float('inf'))
+
+    def _template(self, value):
+        """
+        A (value, key) pair telling the worker to use its own value of `key`
+        in [Compiling Setting], if any.
+        """
+        if value is None:
+            return None
+        return [value, self.templates.get(value)]
+
+    def call_program(self, cmd, limit=None, memory_limit=None, **kwargs):
+        """
+        Override call_program from MeasurementInterface to run the command on
+        the worker of the current trial, if any, and pinned to the CPU set
+        of compilations or runs.
+        """
+        def execute(cpus):
+            worker = getattr(self._remote, "worker", None)
+            if worker is not None:
+                return worker.call_program(
+                    self._template(cmd), cwd=self._template(kwargs.get("cwd")),
+                    limit=limit, cpus=cpus)
+            if not cpus:
+                return super(TunerBase, self).call_program(
+                    cmd, limit=limit, memory_limit=memory_limit, **kwargs)
+            result = metrics.stream_program(
+                cmd, [], cwd=kwargs.get("cwd"), limit=limit, max_lines=None,
+                cpus=cpus, memory_limit=memory_limit)
+            del result['metrics'], result['stopped_early']
+            return result
+
+        return self._measure(cmd, execute)
+
+    def _stream_program(self, cmd, extractors, cwd=None, limit=None,
+                        stop_when_captured=False,
+                        max_lines=metrics.TAIL_LINES):
+        def execute(cpus):
+            worker = getattr(self._remote, "worker", None)
+            if worker is None:
+                return metrics.stream_program(
+                    cmd, extractors, cwd=cwd, limit=limit,
+                    stop_when_captured=stop_when_captured,
+                    max_lines=max_lines, cpus=cpus)
+            return worker.stream_program(
+                self._template(cmd), extractors, cwd=self._template(cwd),
+                limit=limit, stop_when_captured=stop_when_captured,
+                max_lines=max_lines, cpus=cpus)
+
+        return self._measure(cmd, execute)
+
+    def scan_file(self, path, extractors, cwd=None):
+        """
+        Extract metrics from the file at `path` (relative to `cwd`) written
+        by the run, on the worker of the current trial if any; see
+        autotuner.tuners.metrics.scan_file. Returns None if there is no such
+        file.
+        """
+        worker = getattr(self._remote, "worker", None)
+        if worker is not None:
+            return worker.scan_file(path, extractors,
+                                    cwd=self._template(cwd))
+        path = os.path.join(cwd or "", path)
+        if not os.path.isfile(path):
+            return None
+        return metrics.scan_file(path, extractors)
+
+    def _measure(self, cmd, execute):
+        """
+        Call `execute(cpus)` to run `cmd` with the CPU set of compilations or
+        runs. Runs are serialized with --serialize-runs, and the times of
+        successful runs are recorded for the result of the trial.
+        """
+        if cmd == self.compile_cmd:
+            with profiling.phase("compile"):
+                return execute(self.compile_cpus)
+        if self.run_lock is None:
+            with profiling.phase("run"):
+                result = execute(self.run_cpus)
+        else:
+            # The time waiting for the other runs is not a run phase.
+            with self.run_lock, profiling.phase("run"):
+                result = execute(self.run_cpus)
+        if result['returncode'] == 0 and not result.get('timeout') and \
+                not result.get('stopped_early'):
+            self._measurements.run_times.setdefault(cmd, []).append(
+                result['time'])
+        return result
+
+    def _record_measurement(self, result):
+        """
+        Record how `result` was measured for TRIALS_FILE, including the
+        variation of the run times of the trial when the plugin ran a run
+        command more than once. Times of different run commands (e.g. the
+        inputs of FidelityRunCommands) are not compared: the variation is
+        the largest one of a run command.
+        """
+        variations = []
+        for run_times in self._measurements.run_times.values():
+            if len(run_times) > 1 and statistics.mean(run_times) > 0:
+                variations.append(statistics.stdev(run_times) /
+                                  statistics.mean(run_times))
+        variation = max(variations) if variations else None
+        if variation is not None:
+            self.run_time_variations.append(variation)
+        self._measurements.record = {
+            'run_cpus': utils.format_cpu_list(self.run_cpus)
+            if self.run_cpus else None,
+            'compile_cpus': utils.format_cpu_list(self.compile_cpus)
+            if self.compile_cpus else None,
+            'serialized_runs': self.run_lock is not None,
+            'runs': sum(len(run_times) for run_times in
+                        self._measurements.run_times.values()),
+            'run_time_variation': variation}
+        return result
+
+    def _shard_dir(self, llvm_input_file):
+        if not self.shard_llvm_input:
+            return None
+        return llvm_input_shard_dir(llvm_input_file)
+
+    def _build_llvm_input(self, cfg):
+        worker = getattr(self._remote, "worker", None)
+        if worker is None:
+            self.iomanager.build_llvm_input(
+                cfg, self.task_map, self.llvm_input_file,
+                self.fixed_llvm_config_tree,
+                self.config_db, self.use_hash_matching, self.omit_baseline,
+                self._shard_dir(self.llvm_input_file))
+            return
+        # Trials run in parallel: serialize through a private file; workers
+        # only get the whole input.
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_file = os.path.join(
+                temp_dir, "input" + self.iomanager.get_file_extension())
+            self.iomanager.build_llvm_input(
+                cfg, self.task_map, input_file,
+                self.fixed_llvm_config_tree,
+                self.config_db, self.use_hash_matching, self.omit_baseline)
+            with open(input_file) as file:
+                worker.put_input(file.read())
+
     def compile_and_run(self, desired_result, desired_input, limit):
         """
-        Override compile_and_run from MeasurementInterface.
+        Override compile_and_run from MeasurementInterface; a trial is an
+        iteration of --profile-phases.
         """
+        with profiling.iteration(trial=desired_result.id) as record:
+            result = self._compile_and_run(desired_result, desired_input,
+                                           limit)
+            record["state"] = getattr(result, "state", None)
+        self._write_trial(desired_result, result)
+        return result
+
+    def _trial_metadata(self):
+        """
+        Metadata of the trial just run by the current thread, recorded in
+        TRIALS_FILE.
+        """
+        return {}
+
+    def _write_trial(self, desired_result, result):
+        record = {'trial': desired_result.id,
+                  'configuration': desired_result.configuration.hash,
+                  # The default of the column in the results database.
+                  'state': getattr(result, 'state', None) or 'OK'}
+        record.update(self._trial_metadata())
+        if self._measurements.record is not None:
+            record['measurement'] = self._measurements.record
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self._trials_lock:
+            file_fd = os.open(self.trials_file,
+                              os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            with os.fdopen(file_fd, 'a') as file:
+                file.write(line)
+
+    def _compile_and_run(self, desired_result, desired_input, limit):
         cfg = desired_result.configuration.data
+        self._measurements.run_times = {}
+        self._measurements.record = None
 
-        self.iomanager.build_llvm_input(
-            cfg, self.task_map, self.llvm_input_file,
-            self.fixed_llvm_config_tree,
-            self.config_db, self.use_hash_matching)
+        self._build_llvm_input(cfg)
 
         # compiler the program
         compile_result = self.compile()
@@ -103,11 +406,18 @@ class TunerBase(MeasurementInterface):
             print("compiling error, test failed")
             print(compile_result["stderr"])
         else:
-            return self.run(desired_result, desired_input, limit)
+            return self._record_measurement(
+                self.evaluate(desired_result, desired_input, limit))
 
         return Result(state='ERROR', time=float('inf'), cycle=float('inf'),
                       rate=-float('inf'))
 
+    def evaluate(self, desired_result, desired_input, limit):
+        """
+        Measure the compiled configuration.
+        """
+        return self.run(desired_result, desired_input, limit)
+
     def extra_convergence_criteria(self, result_list):
         """
         The extra convergence criteria which returns True if the
@@ -143,7 +453,10 @@ class TunerBase(MeasurementInterface):
                                             self.llvm_input_file,
                                             self.fixed_llvm_config_tree,
                                             self.config_db,
-                                            self.use_hash_matching)
+                                            self.use_hash_matching,
+                                            self.omit_baseline,
+                                            self._shard_dir(
+                                                self.llvm_input_file))
             compile_result = self.compile()
             if compile_result['returncode'] != 0:
                 print("Compiling error")
@@ -164,7 +477,9 @@ class TunerBase(MeasurementInterface):
         self.iomanager.build_llvm_input(
             configuration.data, self.task_map, output_path +
             self.iomanager.get_file_extension(), self.fixed_llvm_config_tree,
-            self.config_db, self.use_hash_matching)
+            self.config_db, self.use_hash_matching, self.omit_baseline,
+            self._shard_dir(output_path +
+                            self.iomanager.get_file_extension()))
         print("Optimal configuration for llvm/clang has been saved to " +
               output_path + self.iomanager.get_file_extension())
         self.manipulator().save_to_file(configuration.data,
@@ -173,6 +488,14 @@ class TunerBase(MeasurementInterface):
               output_path + ".json")
         print("You can use the json file with --seed-configuration "
               "for next tuning run")
+        if self.run_time_variations:
+            print("Run time variation over {} trial(s) with repeated runs: "
+                  "mean {:.2%}, max {:.2%} (run CPUs: {})".format(
+                      len(self.run_time_variations),
+                      statistics.mean(self.run_time_variations),
+                      max(self.run_time_variations),
+                      utils.format_cpu_list(self.run_cpus)
+                      if self.run_cpus else "not pinned"))
 
     def _print_errors(self, cmd, run_result):
         print('running command failed, the error was: ')
@@ -187,35 +510,254 @@ class CustomTunerBase(TunerBase):
     """
 
     def __init__(self, args, compile_dir, llvm_config_file, search_space,
-                 compile_cmd, run_dir, run_cmd, *pargs, **kwargs):
+                 compile_cmd, run_dir, run_cmd, fidelity_run_cmds=None,
+                 metric_setting=None, *pargs, **kwargs):
         super(CustomTunerBase, self).__init__(
             args, compile_dir, llvm_config_file, search_space,
             compile_cmd, *pargs, **kwargs)
         self.run_dir = run_dir
-        self.run_cmd = run_cmd
+        # Options of the [Metric Setting] section of the config file.
+        self.metric_setting = metric_setting
+        # Run commands from the cheapest fidelity to the full one (run_cmd).
+        self.run_cmds = list(fidelity_run_cmds or []) + [run_cmd]
+        # State of the trial run by the current thread (trials run in
+        # parallel with a coordinator).
+        self._trial = _TrialState(run_cmd)
+        self.templates[run_dir] = "RunDir"
+        for index, cmd in enumerate(self.run_cmds[:-1]):
+            self.templates[cmd] = "FidelityRunCommands[{}]".format(index)
+        self.templates[run_cmd] = "RunCommand"
+        self.fidelity_eta = args.fidelity_eta
+        # fidelity -> objective values of all candidates run with it
+        self.rung_values = [[] for _ in self.run_cmds]
+        # configuration hash -> {fidelity: objective value}
+        self.fidelity_values = {}
+        self.best_full_value = float('inf')
+        # For early termination: run command -> fastest successful run time,
+        # and the result of the best run so far.
+        self.early_termination_factor = args.early_termination_factor
+        self.best_run_times = {}
+        self.best_run_result = None
+
+    @property
+    def run_cmd(self):
+        """
+        The run command of the current fidelity, run by plugins.
+        """
+        return self._trial.run_cmd
+
+    @run_cmd.setter
+    def run_cmd(self, run_cmd):
+        self._trial.run_cmd = run_cmd
 
     @abc.abstractmethod
     def run(self, desired_result, desired_input, limit):
         return
 
+    def evaluate(self, desired_result, desired_input, limit):
+        """
+        Run the configuration through the fidelity ladder, using asynchronous
+        successive halving: a candidate is run with the next (more expensive)
+        run command only if it ranks in the best 1/fidelity_eta of the
+        candidates run with the current one. Candidates stopped early are
+        reported with their value extrapolated to full fidelity; the fidelity
+        they were stopped at is recorded in TRIALS_FILE.
+        """
+        self._trial.fidelity = len(self.run_cmds) - 1
+        self._trial.extrapolated = False
+        if len(self.run_cmds) == 1:
+            return self._run_with_cutoff(desired_result, desired_input, limit)
+
+        objective = self.objective()
+        full_fidelity = len(self.run_cmds) - 1
+        values = self.fidelity_values.setdefault(
+            desired_result.configuration.hash, {})
+        try:
+            for fidelity, run_cmd in enumerate(self.run_cmds):
+                # Plugins run self.run_cmd.
+                self.run_cmd = run_cmd
+                self._trial.fidelity = fidelity
+                result = self._run_with_cutoff(desired_result, desired_input,
+                                               limit)
+                value = objective_value(objective, result)
+                if result.state == 'TIMEOUT' and fidelity < full_fidelity:
+                    # Bring the censored result to the full fidelity scale.
+                    ratio = self._fidelity_ratio(fidelity)
+                    return self._extrapolate(
+                        result, ratio if ratio else float('inf'))
+                if result.state in ('TIMEOUT', 'ERROR') or \
+                        not math.isfinite(value):
+                    return result
+                values[fidelity] = value
+                self.rung_values[fidelity].append(value)
+                if fidelity == full_fidelity:
+                    self.best_full_value = min(self.best_full_value, value)
+                    return result
+
+                ratio = self._fidelity_ratio(fidelity)
+                # Candidates that may beat the best full fidelity result are
+                # always promoted, so that the best result is never an
+                # extrapolation.
+                if ratio is None or self._promote(fidelity, value) or \
+                        value * ratio <= self.best_full_value:
+                    continue
+                print("Stopped at fidelity {}/{}".format(fidelity + 1,
+                                                         full_fidelity + 1))
+                return self._extrapolate(result, ratio)
+        finally:
+            self.run_cmd = self.run_cmds[-1]
+
+    def call_program(self, cmd, limit=None, memory_limit=None, **kwargs):
+        """
+        Override call_program from MeasurementInterface to apply the early
+        termination cutoff to the run command, whatever limit the plugin
+        asks for.
+        """
+        limit, capped = self._program_limit(cmd, limit)
+        result = super(CustomTunerBase, self).call_program(
+            cmd, limit=limit, memory_limit=memory_limit, **kwargs)
+        self._after_program(cmd, capped, result)
+        return result
+
+    def stream_program(self, cmd, extractors, cwd=None, limit=None,
+                       stop_when_captured=False,
+                       max_lines=metrics.TAIL_LINES):
+        """
+        Like call_program, but extract metrics from the output line by line
+        instead of buffering it; see autotuner.tuners.metrics.stream_program.
+        """
+        limit, capped = self._program_limit(cmd, limit)
+        result = self._stream_program(cmd, extractors, cwd=cwd, limit=limit,
+                                      stop_when_captured=stop_when_captured,
+                                      max_lines=max_lines)
+        self._after_program(cmd, capped, result)
+        return result
+
+    def _program_limit(self, cmd, limit):
+        cutoff = self._trial.cutoff
+        is_run = cutoff is not None and cmd == self.run_cmd
+        capped = is_run and (limit is None or cutoff < limit)
+        return (cutoff if capped else limit), capped
+
+    def _after_program(self, cmd, capped, result):
+        if capped and result['timeout']:
+            self._trial.cutoff_hit = True
+        elif cmd == self.run_cmd and result['returncode'] == 0 and \
+                not result.get('stopped_early'):
+            self._trial.last_run_time = result['time']
+
+    def _run_with_cutoff(self, desired_result, desired_input, limit):
+        """
+        Run the plugin with the early termination cutoff derived from the
+        fastest run of the current run command so far.
+        """
+        trial = self._trial
+        best_time = self.best_run_times.get(self.run_cmd)
+        if self.early_termination_factor and best_time:
+            trial.cutoff = self.early_termination_factor * best_time
+        trial.cutoff_hit = False
+        trial.last_run_time = None
+        try:
+            result = self.run(desired_result, desired_input, limit)
+        finally:
+            cutoff, trial.cutoff = trial.cutoff, None
+        if trial.cutoff_hit:
+            print("Run terminated early after {:.2f}s".format(cutoff))
+            return self._censor(cutoff)
+
+        value = objective_value(self.objective(), result)
+        if trial.last_run_time is not None and math.isfinite(value) and \
+                result.state not in ('TIMEOUT', 'ERROR'):
+            self.best_run_times[self.run_cmd] = min(
+                self.best_run_times.get(self.run_cmd, float('inf')),
+                trial.last_run_time)
+            if self.run_cmd == self.run_cmds[-1] and \
+                    (self.best_run_result is None or value <
+                     objective_value(self.objective(), self.best_run_result)):
+                self.best_run_result = result
+        return result
+
+    def _trial_metadata(self):
+        """
+        With FidelityRunCommands, the fidelity (1 to the number of run
+        commands) the trial was last run at, and whether its result was
+        extrapolated to full fidelity. Nothing if the trial was not run.
+        """
+        fidelity, self._trial.fidelity = self._trial.fidelity, None
+        if len(self.run_cmds) == 1 or fidelity is None:
+            return {}
+        return {'fidelity': fidelity + 1,
+                'fidelities': len(self.run_cmds),
+                'extrapolated': self._trial.extrapolated}
+
+    def _censor(self, cutoff):
+        """
+        A TIMEOUT result for a run killed at `cutoff` seconds. Its values are
+        lower bounds: the time is the cutoff and the other metrics are those
+        of the best run scaled by the early termination factor.
+        """
+        censored = Result(state='TIMEOUT', time=cutoff)
+        factor = self.early_termination_factor
+        cycle = getattr(self.best_run_result, 'cycle', None)
+        censored.cycle = float(cycle) * factor if cycle is not None \
+            else float('inf')
+        rate = getattr(self.best_run_result, 'rate', None)
+        censored.rate = float(rate) / factor if rate is not None \
+            else -float('inf')
+        return censored
+
+    def _fidelity_ratio(self, fidelity):
+        """
+        Median ratio between the full fidelity value and the value at
+        `fidelity` of the configurations measured at both.
+        """
+        full_fidelity = len(self.run_cmds) - 1
+        ratios = [values[full_fidelity] / values[fidelity]
+                  for values in self.fidelity_values.values()
+                  if full_fidelity in values and values.get(fidelity)]
+        if not ratios:
+            return None
+        return statistics.median(ratios)
+
+    def _promote(self, fidelity, value):
+        rung = self.rung_values[fidelity]
+        better = sum(1 for other in rung if other < value)
+        return better < len(rung) / float(self.fidelity_eta)
+
+    def _extrapolate(self, result, ratio):
+        self._trial.extrapolated = True
+        extrapolated = Result(state=result.state)
+        for attribute in ('time', 'cycle', 'rate'):
+            value = getattr(result, attribute, None)
+            if value is not None:
+                setattr(extrapolated, attribute, float(value) * ratio)
+        return extrapolated
+
+
+class _Measurements(threading.local):
+    """
+    Per-thread run times of the trial being evaluated, by run command, and
+    how it was measured.
+    """
 
-"""
-utils
-"""
-
+    def __init__(self):
+        super(_Measurements, self).__init__()
+        self.run_times = {}
+        self.record = None
 
-def get_available_tuners(tuner_dir):
-    tuners = _look_up_tuners_by_dir(tuner_dir) if tuner_dir else ()
-    default_tuners = _look_up_tuners_by_dir(__file__)
-    return tuners + default_tuners
 
+class _TrialState(threading.local):
+    """
+    Per-thread state of the trial being evaluated.
+    """
 
-def _look_up_tuners_by_dir(tuner_dir):
-    tuners = ()
-    for exist_file in sorted(os.listdir(os.path.dirname(tuner_dir))):
-        match = re.match(r'^(.*)[.]py(c?)$', exist_file)
-        if match:
-            module = match.group(1)
-            if module[-6:].lower() == '_tuner':
-                tuners += (module,)
-    return tuners
+    def __init__(self, run_cmd):
+        super(_TrialState, self).__init__()
+        self.run_cmd = run_cmd
+        self.cutoff = None
+        self.cutoff_hit = False
+        self.last_run_time = None
+        # Index of the run command of the trial and whether its result was
+        # extrapolated from a cheaper one.
+        self.fidelity = None
+        self.extrapolated = False
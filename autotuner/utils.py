@@ -85,3 +85,110 @@ def parse_feedback_file(filename):
         raise IOError("Invalid format in feedback file "
                       ":{}: {}".format(filename, str(error)))
     return feedback_values
+
+
+def parse_group_feedback_file(filename):
+    """
+    Parse a CSV file of per-group performance feedback, one
+    `trial,group,value` row per group measured in a trial (trial being the
+    0-based index of the configuration in the current iteration).
+    Returns a dict of trial -> {group: value}.
+    """
+    if not os.path.isfile(filename):
+        raise IOError("Group feedback file {} not found".format(filename))
+    check_file_permissions(filename)
+    group_feedback = {}
+    try:
+        with open(filename, newline='') as file:
+            for row in csv.reader(file):
+                if not row:
+                    continue
+                trial, group, value = row
+                group_feedback.setdefault(int(trial), {})[group] = \
+                    float(value)
+    except Exception as error:
+        raise IOError("Invalid format in group feedback file "
+                      ":{}: {}".format(filename, str(error)))
+    return group_feedback
+
+
+def parse_cpu_list(cpu_list):
+    """
+    Parse a CPU list such as "0-3,8,10-11" (the format of taskset -c).
+    Returns a sorted list of CPU numbers.
+    """
+    cpus = set()
+    for item in cpu_list.split(","):
+        first, dash, last = item.strip().partition("-")
+        if not first.isdigit() or (dash and not last.isdigit()) or \
+                int(last or first) < int(first):
+            raise ValueError("Invalid CPU list: " + cpu_list)
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """
+    Format CPU numbers as a CPU list, the reverse of parse_cpu_list().
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else
+                    "{}-{}".format(first, last) for first, last in ranges)
+
+
+def isolate_cpus(run_cpus, compile_cpus):
+    """
+    Returns the (run_cpus, compile_cpus) sets to pin measurements and
+    compilations to, keeping them apart: without compile_cpus, compilations
+    use the available CPUs not used by runs; CPUs in both sets are used by
+    runs only. A set is None when it cannot be applied.
+    """
+    if not run_cpus and not compile_cpus:
+        return None, None
+    if not hasattr(os, "sched_getaffinity"):
+        log.warning("CPU pinning is not supported on this platform; "
+                    "ignoring --run-cpus and --compile-cpus")
+        return None, None
+    available = os.sched_getaffinity(0)
+
+    def usable(cpus, option):
+        if not cpus:
+            return None
+        unavailable = set(cpus) - available
+        if unavailable:
+            log.warning("Ignoring unavailable CPUs %s of %s",
+                        format_cpu_list(unavailable), option)
+        return sorted(set(cpus) & available) or None
+
+    run_cpus = usable(run_cpus, "--run-cpus")
+    compile_cpus = usable(compile_cpus, "--compile-cpus")
+    if run_cpus:
+        if compile_cpus is None:
+            compile_cpus = sorted(available - set(run_cpus)) or None
+        elif set(compile_cpus) & set(run_cpus):
+            log.warning("--compile-cpus overlaps with --run-cpus; CPUs %s "
+                        "are used by runs only",
+                        format_cpu_list(set(compile_cpus) & set(run_cpus)))
+            compile_cpus = sorted(set(compile_cpus) - set(run_cpus)) or None
+        if compile_cpus is None:
+            log.warning("No CPU left for compilations apart from "
+                        "--run-cpus; compilations are not pinned")
+    return run_cpus, compile_cpus
+
+
+def requested_command(argv):
+    """
+    Returns the sub-command of the command line arguments argv (without the
+    program name), i.e. the first argument not starting with '-', or None.
+    The command-line interfaces only build the parser of this sub-command,
+    so that only the modules it needs are imported.
+    """
+    for arg in argv:
+        if not arg.startswith('-'):
+            return arg
+    return None
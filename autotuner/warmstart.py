@@ -0,0 +1,164 @@
+# coding=utf-8
+"""
+Similarity based warm start from the configuration database.
+
+Optimal configurations are stored per (hash, type, pass) triple, so a code
+region whose hash changed between two releases of a program cannot reuse the
+configuration found for it before. SimilarConfigIndex finds the stored
+optimal configuration of the most similar code region instead, comparing the
+function and region names, DynamicConfigs and BaselineConfig of code regions
+of the same type and pass.
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import logging
+import re
+
+from autotuner.dbutils import get_optimal_configs_with_features
+
+log = logging.getLogger(__name__)
+
+# Relative weight of each feature in the similarity score. Weights of
+# features missing on either side are redistributed over the others.
+FEATURE_WEIGHTS = {
+    "func_name": 0.5,
+    "name": 0.2,
+    "dynamic_configs": 0.15,
+    "baseline_config": 0.15,
+}
+
+_TOKEN_SPLIT = re.compile(r"[^A-Za-z]+|(?<=[a-z])(?=[A-Z])")
+
+
+def tokenize(name):
+    """
+    Split a (possibly mangled) symbol name into a set of lower case tokens,
+    e.g. "_ZN4llvm10DenseMapIfE4growEj" -> {"zn", "llvm", "dense", "map",
+    "if", "grow", "ej"}.
+    """
+    if not name:
+        return frozenset()
+    return frozenset(token.lower() for token in _TOKEN_SPLIT.split(str(name))
+                     if len(token) >= 2)
+
+
+def _jaccard(first, second):
+    union = first | second
+    if not union:
+        return None
+    return len(first & second) / float(len(union))
+
+
+def _dict_similarity(first, second):
+    """
+    Fraction of the keys of both dicts that are present in both with equal
+    values, or None if both are empty.
+    """
+    first = first or {}
+    second = second or {}
+    keys = set(first) | set(second)
+    if not keys:
+        return None
+    same = sum(1 for key in keys if key in first and key in second
+               and first[key] == second[key])
+    return same / float(len(keys))
+
+
+class CodeRegionFeatures(object):
+    """
+    The features of a code region used to compare it with other code regions.
+    """
+
+    def __init__(self, name="", func_name="", dynamic_configs=None,
+                 baseline_config=None):
+        self.name_tokens = tokenize(name)
+        self.func_tokens = tokenize(func_name)
+        self.dynamic_configs = dynamic_configs or {}
+        self.baseline_config = baseline_config or {}
+
+    def similarity(self, other):
+        """
+        Returns a score in [0, 1]; 1 means all available features match.
+        """
+        scores = {
+            "func_name": _jaccard(self.func_tokens, other.func_tokens),
+            "name": _jaccard(self.name_tokens, other.name_tokens),
+            "dynamic_configs": _dict_similarity(self.dynamic_configs,
+                                                other.dynamic_configs),
+            "baseline_config": _dict_similarity(self.baseline_config,
+                                                other.baseline_config),
+        }
+        total_weight = sum(FEATURE_WEIGHTS[key] for key, score in
+                           scores.items() if score is not None)
+        if not total_weight:
+            return 0.0
+        return sum(FEATURE_WEIGHTS[key] * score for key, score in
+                   scores.items() if score is not None) / total_weight
+
+
+class SimilarConfigIndex(object):
+    """
+    An index over the optimal configurations stored in the configuration
+    database, grouped by (type, pass) and searchable by code region features.
+    """
+
+    def __init__(self, threshold=0.5):
+        self.threshold = threshold
+        # (type, pass) -> list of (CodeRegionFeatures, params)
+        self.entries = dict()
+        # (type, pass) -> token -> indices into entries[(type, pass)]
+        self.token_index = dict()
+
+    @classmethod
+    def from_config_db(cls, config_db, threshold=0.5):
+        index = cls(threshold)
+        for optimal_config, feature in \
+                get_optimal_configs_with_features(config_db):
+            index.add(optimal_config.code_region_type,
+                      optimal_config.pass_name,
+                      CodeRegionFeatures(feature.name, feature.func_name,
+                                         feature.dynamic_configs,
+                                         feature.baseline_config),
+                      optimal_config.params)
+        log.debug("Indexed %d optimal configurations for similarity lookup",
+                  len(index))
+        return index
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    def add(self, code_region_type, pass_name, features, params):
+        key = (code_region_type, pass_name)
+        entries = self.entries.setdefault(key, [])
+        tokens = self.token_index.setdefault(key, dict())
+        for token in features.func_tokens | features.name_tokens:
+            tokens.setdefault(token, []).append(len(entries))
+        entries.append((features, params))
+
+    def lookup(self, code_region_type, pass_name, features):
+        """
+        Returns (params, score) of the most similar code region of the same
+        type and pass whose score reaches the threshold, or (None, 0.0).
+        """
+        key = (code_region_type, pass_name)
+        entries = self.entries.get(key)
+        if not entries:
+            return None, 0.0
+
+        # Only score entries sharing a name token; fall back to all entries
+        # of this type and pass for code regions without usable names.
+        tokens = self.token_index[key]
+        candidates = set()
+        for token in features.func_tokens | features.name_tokens:
+            candidates.update(tokens.get(token, ()))
+        if not candidates:
+            candidates = range(len(entries))
+
+        best_params, best_score = None, 0.0
+        for position in sorted(candidates):
+            candidate, params = entries[position]
+            score = features.similarity(candidate)
+            if score > best_score:
+                best_params, best_score = params, score
+        if best_score < self.threshold:
+            return None, 0.0
+        return best_params, best_score
@@ -3,27 +3,39 @@
 A set of tools to generate/parse the XML files for AutoTuning-enabled LLVM
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
+import copy
 import os
 
 import defusedxml.ElementTree as xml_reader  # for reading xml file
 import xml.etree.ElementTree as xml_writer  # for writing xml file
+from autotuner import profiling
 from autotuner.models import LegacyCodeRegion
+from autotuner.models import ParamEncoder
 from autotuner.models import Task
 from autotuner.utils import create_secure_fd
-from opentuner.search.manipulator import EnumParameter
-from opentuner.search.manipulator import IntegerParameter
-from opentuner.search.manipulator import FloatParameter
-from opentuner.search.manipulator import PermutationParameter
-from opentuner.search.manipulator import SelectionParameter
+from autotuner.iomanager import DEFAULT_MAX_OPEN_FILES
+from autotuner.iomanager import DuplicateResolver
 from autotuner.iomanager import EmptySearchSpaceError
 from autotuner.iomanager import IOManager
+from autotuner.iomanager import InvalidLLVMInputError
+from autotuner.iomanager import LRUWriters
+from autotuner.iomanager import document_digest
+from autotuner.iomanager import open_for_append
+
+
+# Size of the chunks of opportunity files fed to the parser.
+_READ_SIZE = 64 * 1024
 
 
 def _convert_defusedxml_to_etree(ele):
     """
     Convert a Element from defusedxml.ElementTree into etree.ElementTree
-    for compatibility.
+    for compatibility. defusedxml builds etree elements with the parser of
+    the standard library, which are returned as is; others are converted
+    through a string.
     """
+    if isinstance(ele, xml_writer.Element):
+        return ele
     # get a string from xml_reader.Element
     ele_str = xml_reader.tostring(ele)
     # create a xml_writer.Element from the string
@@ -31,58 +43,256 @@ def _convert_defusedxml_to_etree(ele):
     return ele
 
 
+class _OpportunityFile(object):
+    """
+    Reads an opportunity file, a sequence of <code_regions> elements without
+    a root element, as the children of a <root> element.
+    """
+
+    def __init__(self, file_obj):
+        self.chunks = self._chunks(file_obj)
+
+    @staticmethod
+    def _chunks(file_obj):
+        yield b'<root>'
+        for chunk in iter(lambda: file_obj.read(_READ_SIZE), b''):
+            yield chunk
+        yield b'</root>'
+
+    def read(self, size=-1):
+        return next(self.chunks, b'')
+
+
+def _iter_code_regions(file_path):
+    """
+    Yields the <code_region> elements of the <code_regions> of an
+    opportunity file, parsed incrementally: each <code_regions> element is
+    released once its code regions are processed.
+    """
+    with open(file_path, 'rb') as input_file:
+        depth = 0
+        root = None
+        for event, element in xml_reader.iterparse(
+                _OpportunityFile(input_file), events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if root is None:
+                    root = element
+                continue
+            depth -= 1
+            if depth == 1 and element.tag == "code_regions":
+                for code_region in element.findall("code_region"):
+                    yield _convert_defusedxml_to_etree(code_region)
+                root.clear()
+
+
+def _iter_llvm_inputs(file_path):
+    """
+    Yields the <input> elements of a LLVM input file serialized without
+    their tail, parsed incrementally: each element is released once
+    serialized.
+    """
+    depth = 0
+    root = None
+    for event, element in xml_reader.iterparse(file_path,
+                                               events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if root is None:
+                if element.tag != "inputs":
+                    raise InvalidLLVMInputError(
+                        "{}: the root element is <{}>, not <inputs>".format(
+                            file_path, element.tag))
+                root = element
+            continue
+        depth -= 1
+        if depth == 1 and element.tag == "input":
+            element.tail = None
+            yield element, xml_writer.tostring(element)
+            root.clear()
+
+
+def _canonical(element):
+    """
+    Returns `element` serialized without its tail nor the whitespace-only
+    text between elements, so that its digest does not depend on how the
+    file was indented.
+    """
+    element = copy.deepcopy(element)
+    element.tail = None
+    for node in element.iter():
+        if node.text is not None and not node.text.strip():
+            node.text = None
+        if node is not element and node.tail is not None and \
+                not node.tail.strip():
+            node.tail = None
+    return xml_writer.tostring(element)
+
+
+def _iter_merge_documents(input_files, policy):
+    """
+    Yields the <input> elements of input_files as the documents of a
+    DuplicateResolver, identified by their <code_region>.
+    """
+    for input_file in input_files:
+        for element, data in _iter_llvm_inputs(input_file):
+            if policy is None:
+                yield input_file, None, None, (element, data)
+                continue
+            content = _canonical(element)
+            code_region = element.find("code_region")
+            region = content if code_region is None else \
+                _canonical(code_region)
+            yield (input_file, document_digest(region),
+                   document_digest(content), (element, data))
+
+
+class _InputWriter(object):
+    """
+    Writes <input> elements to an output file of a streamed divide. The
+    closing </inputs> tag is appended once all the inputs are written.
+    """
+
+    def __init__(self, file_path, append):
+        if append:
+            self.file = os.fdopen(open_for_append(file_path), 'wb')
+        else:
+            self.file = os.fdopen(create_secure_fd(file_path), 'wb')
+            self.file.write(b'<inputs>')
+
+    def write(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+def _parse_global_params(config_file):
+    """
+    Returns a dict of code region type -> list of its <param> elements in
+    the search space config file.
+    """
+    config_root = xml_reader.parse(config_file).getroot()
+    global_param_config = {}
+    for code_region in config_root.findall("code_region"):
+        global_params = code_region.find("params")
+        if global_params is not None:
+            global_param_config[code_region.attrib["type"]] = list(
+                _convert_defusedxml_to_etree(global_params))
+    return global_param_config
+
+
 def _parse_param(tuning_id, xml_param):
     """
     Help function to return a enumeration list based on param type
     """
+    # Imported here: merge and divide do not need opentuner.
+    from opentuner.search import manipulator
     param_type = xml_param.get("type")
+    name = tuning_id + xml_param.find("name").text
 
     if param_type == "bool":
-        return EnumParameter(tuning_id + xml_param.find("name").text, ["1",
-                                                                       "0"])
+        return manipulator.EnumParameter(name, ["1", "0"])
 
     elif param_type == "enum":
         options = [value.text for value in xml_param.findall("value")]
-        return EnumParameter(tuning_id + xml_param.find("name").text, options)
+        return manipulator.EnumParameter(name, options)
 
     elif param_type == "range":
         # Keep param_type == "range" for backwards compatability
         min_value = int(xml_param.find("min").text)
         max_value = int(xml_param.find("max").text)
-        return IntegerParameter(tuning_id + xml_param.find("name").text,
-                                min_value, max_value)
+        return manipulator.IntegerParameter(name, min_value, max_value)
 
     elif param_type == "int":
         min_value = int(xml_param.find("Min").text)
         max_value = int(xml_param.find("Max").text)
-        return IntegerParameter(tuning_id + xml_param.find("name").text,
-                                min_value, max_value)
+        return manipulator.IntegerParameter(name, min_value, max_value)
 
     elif param_type == "float":
         min_value = float(xml_param.find("Min").text)
         max_value = float(xml_param.find("Max").text)
-        return FloatParameter(tuning_id + xml_param.find("name").text,
-                                min_value, max_value)
+        return manipulator.FloatParameter(name, min_value, max_value)
 
     elif param_type == "permutation":
         options = [value.text for value in xml_param.findall("value")]
-        return PermutationParameter(tuning_id + xml_param.find("name").text,
-                                    options)
+        return manipulator.PermutationParameter(name, options)
 
     elif param_type == "selection":
         options = [value.text for value in xml_param.findall("value")]
-        return SelectionParameter(tuning_id + xml_param.find("name").text,
-                                  options)
+        return manipulator.SelectionParameter(name, options)
 
     else:
         raise Exception("No type specified for params in xml")
 
 
+def _emit_param(params_xml, name, value):
+    param_xml = xml_writer.SubElement(params_xml, 'param')
+    xml_writer.SubElement(param_xml, 'name').text = name
+    xml_writer.SubElement(param_xml, 'value').text = value
+
+
+def _emit_opt_pass(params_xml, raw_name, choice):
+    # A selection parameter takes a dict, a permutation parameter a list.
+    if isinstance(choice, dict):
+        choice = choice["order"][:choice["size"]]
+    if choice:
+        param_xml = xml_writer.SubElement(params_xml, 'param')
+        param_xml.set('type', 'list')
+        xml_writer.SubElement(param_xml, 'name').text = raw_name
+        for ele in choice:
+            xml_writer.SubElement(param_xml, 'value').text = ele
+
+
+# FIXME
+def _emit_machine_scheduling(params_xml, raw_name, direction):
+    if direction == "TopDown":
+        _emit_param(params_xml, "ForceTopDown", "1")
+        _emit_param(params_xml, "ForceBottomUp", "0")
+    elif direction == "BottomUp":
+        _emit_param(params_xml, "ForceBottomUp", "1")
+        _emit_param(params_xml, "ForceTopDown", "0")
+    else:
+        _emit_param(params_xml, "ForceBottomUp", "0")
+        _emit_param(params_xml, "ForceTopDown", "0")
+
+
+def _emit_value(params_xml, raw_name, value):
+    _emit_param(params_xml, raw_name, str(value))
+
+
+# Parameters whose value is not written as is.
+_SPECIAL_PARAMS = {
+    "OptPass": _emit_opt_pass,
+    "MachineScheduling": _emit_machine_scheduling,
+}
+
+
+def _param_encoder(param, raw_name):
+    # Stored configurations are not used with XML; there is no seed.
+    return ParamEncoder(param, raw_name,
+                        _SPECIAL_PARAMS.get(raw_name, _emit_value), None)
+
+
+def _task_encoders(task):
+    """
+    Returns the ParamEncoders of `task`, built on first use for tasks not
+    created by parse_search_space().
+    """
+    if getattr(task, "encoders", None) is None:
+        # Since param.name is in the form of ID+Param
+        # (e.g. 14UnrollCount), only remove the first occurrence.
+        task.encoders = [
+            _param_encoder(param, param.name.replace(str(task.tuning_id), "",
+                                                     1))
+            for param in task.param_list]
+    return task.encoders
+
+
 def _merge_llvm_input_trees(tree_a, tree_b):
     root_a = _convert_defusedxml_to_etree(tree_a.getroot())
-    root_b = _convert_defusedxml_to_etree(tree_b.getroot())
-    for ele in root_b.findall('input'):
-        root_a.append(ele)
+    for ele in tree_b.getroot().findall('input'):
+        root_a.append(_convert_defusedxml_to_etree(ele))
     tree_a._setroot(root_a)
     return tree_a
 
@@ -108,60 +318,39 @@ def _divide_llvm_input_tree(tree):
 
 
 def _generate_search_space(file_path, new_xml_root, start_tuning_id,
-                           config_file, name_filter, func_name_filter,
+                           global_param_config, name_filter, func_name_filter,
                            file_name_filter, type_filter, pass_filter):
     tuning_id = start_tuning_id
 
-    # search space of xml configuration file
-    config_tree = xml_reader.parse(config_file)
-    config_root = config_tree.getroot()
-    global_param_config = {}
-    for code_region in config_root.findall("code_region"):
-        global_params = code_region.find("params")
-        if global_params is not None:
-            global_param_config[code_region.attrib["type"]] = global_params
-
-    with open(file_path, 'r+') as input_file:
-        content = input_file.read()
-        # parse the input xml
-        parser = xml_reader.XMLParser()
-        parser.feed(b'<root>')
-        parser.feed(content)
-        parser.feed(b'</root>')
-        opp_root = parser.close()
-
-    code_regions_list = opp_root.findall("code_regions")
-    for code_regions in code_regions_list:
-        code_region_list = code_regions.findall("code_region")
-        for code_region in code_region_list:
+    for code_region in _iter_code_regions(file_path):
+        code_region_type = code_region.attrib["type"]
+        # check if code_region type exists in global config
+        if code_region_type in global_param_config:
+            # apply filters
+            file_name = code_region.find("file_name").text
+            func_name = code_region.find("func_name").text
+            name = code_region.find("name").text
             code_region_type = code_region.attrib["type"]
-            # check if code_region type exists in global config
-            if code_region_type in global_param_config:
-                # apply filters
-                file_name = code_region.find("file_name").text
-                func_name = code_region.find("func_name").text
-                name = code_region.find("name").text
-                code_region_type = code_region.attrib["type"]
-                filtered = _apply_code_region_filter(file_name,
-                                                     file_name_filter) and \
-                    _apply_code_region_filter(func_name,
-                                              func_name_filter) and \
-                    _apply_code_region_filter(code_region_type,
-                                              type_filter) and \
-                    _apply_code_region_filter(name,
-                                              name_filter)
-
-                if filtered:
-                    tuning_id += 1
-                    task = xml_writer.SubElement(new_xml_root, "task")
-                    task.append(code_region)
-                    xml_writer.SubElement(task, "tuning_id").text = \
-                        str(tuning_id)
-
-                    params = xml_writer.SubElement(task, "params")
-                    # add params from global config file
-                    params.extend(_convert_defusedxml_to_etree(
-                        global_param_config[code_region_type]))
+            filtered = _apply_code_region_filter(file_name,
+                                                 file_name_filter) and \
+                _apply_code_region_filter(func_name,
+                                          func_name_filter) and \
+                _apply_code_region_filter(code_region_type,
+                                          type_filter) and \
+                _apply_code_region_filter(name,
+                                          name_filter)
+
+            if filtered:
+                tuning_id += 1
+                task = xml_writer.SubElement(new_xml_root, "task")
+                task.append(code_region)
+                xml_writer.SubElement(task, "tuning_id").text = \
+                    str(tuning_id)
+
+                params = xml_writer.SubElement(task, "params")
+                # add params from global config file; the elements are
+                # shared by the tasks, which only read them.
+                params.extend(global_param_config[code_region_type])
 
     # return the last tuning id
     return tuning_id
@@ -178,6 +367,7 @@ class XMLManager(IOManager):
     def get_file_extension(self):
         return ".xml"
 
+    @profiling.timed("search_space.parse")
     def parse_search_space(self, search_space, use_dynamic_values=False,
                            use_baseline_config = False, filepath = None):
         """
@@ -206,7 +396,7 @@ class XMLManager(IOManager):
         code_region_set = set()
 
         # if the root does not have any children, empty search space is empty
-        if not root.getchildren():
+        if len(root) == 0:
             raise EmptySearchSpaceError("empty search space")
 
         # loop through the task elements in the xml file
@@ -216,11 +406,14 @@ class XMLManager(IOManager):
             param_list_xml = task_xml.find("params").findall("param")
 
             param_list = []
+            encoders = []
             # loop through the task elements in xml file
             for ele in param_list_xml:
                 param = _parse_param(tuning_id, ele)
                 if param:
                     param_list.append(param)
+                    encoders.append(_param_encoder(param,
+                                                   ele.find("name").text))
 
             if param_list:
                 # retrieve code_region information from xml
@@ -237,12 +430,15 @@ class XMLManager(IOManager):
                 if code_region not in code_region_set:
                     code_region_set.add(code_region)
                     task_map[int(tuning_id)] = Task(int(tuning_id),
-                                                    param_list, code_region)
+                                                    param_list, code_region,
+                                                    encoders)
         return task_map
 
+    @profiling.timed("emit_input")
     def build_llvm_input(self, configuration_data, task_map, output_file,
                          fixed_llvm_input_tree=None, config_db=None,
-                         use_hash_matching=False):
+                         use_hash_matching=False, omit_baseline=False,
+                         shard_dir=None):
         """
         Build input xml file for tuning-enabled LLVM based on task_map and
         configuration_data, and output as output_file
@@ -259,75 +455,24 @@ class XMLManager(IOManager):
 
             fixed_llvm_input_tree (ElementTree): fixed llvm configuration input
             files as constants in addition to the configuration data.
+
+            omit_baseline (bool): ignored, the XML search space has no
+            baseline decisions.
+
+            shard_dir (str): ignored, the XML input is not sharded.
         """
 
         # generating the root
         inputs = xml_writer.Element('inputs')
         # loop through the task map to generate xml input for tuning-enabled
         # LLVM
-        for tuning_id, task in task_map.items():
+        for task in task_map.values():
 
             input_ele = xml_writer.SubElement(inputs, 'input')
             params_xml = xml_writer.SubElement(input_ele, 'params')
 
-            for param in task.param_list:
-                # Since param.name is in the form of ID+Param
-                # (e.g. 14UnrollCount), only remove the first occurrence.
-                raw_param_name = param.name.replace(str(tuning_id), "", 1)
-
-                if raw_param_name == "OptPass":
-                    choice = configuration_data[param.name]
-
-                    # check if the value comes from selection parameter
-                    if isinstance(choice, dict):
-                        pass_order = choice["order"]
-                        size = choice["size"]
-                        pass_list = pass_order[:size]
-
-                    # otherwise the value comes from permutation parameter
-                    else:
-                        pass_list = choice
-
-                    if pass_list:
-                        param_xml = xml_writer.SubElement(params_xml, 'param')
-                        param_xml.set('type', 'list')
-                        name = xml_writer.SubElement(param_xml, 'name')
-                        name.text = raw_param_name
-
-                        for ele in pass_list:
-                            value = xml_writer.SubElement(param_xml, 'value')
-                            value.text = ele
-
-                # FIXME
-                elif raw_param_name == "MachineScheduling":
-                    param_xml = xml_writer.SubElement(params_xml, 'param')
-                    name = xml_writer.SubElement(param_xml, 'name')
-                    value = xml_writer.SubElement(param_xml, 'value')
-                    sed_param_xml = xml_writer.SubElement(params_xml, 'param')
-                    sed_name = xml_writer.SubElement(sed_param_xml, 'name')
-                    sed_value = xml_writer.SubElement(sed_param_xml, 'value')
-                    if configuration_data[param.name] == "TopDown":
-                        name.text = "ForceTopDown"
-                        value.text = "1"
-                        sed_name.text = "ForceBottomUp"
-                        sed_value.text = "0"
-                    elif configuration_data[param.name] == "BottomUp":
-                        name.text = "ForceBottomUp"
-                        value.text = "1"
-                        sed_name.text = "ForceTopDown"
-                        sed_value.text = "0"
-                    else:
-                        name.text = "ForceBottomUp"
-                        value.text = "0"
-                        sed_name.text = "ForceTopDown"
-                        sed_value.text = "0"
-
-                else:
-                    param_xml = xml_writer.SubElement(params_xml, 'param')
-                    name = xml_writer.SubElement(param_xml, 'name')
-                    name.text = raw_param_name
-                    value = xml_writer.SubElement(param_xml, 'value')
-                    value.text = str(configuration_data[param.name])
+            for param, raw_name, emit, _ in _task_encoders(task):
+                emit(params_xml, raw_name, configuration_data[param.name])
 
             # construct the code region in the xml tree
             code_region = xml_writer.SubElement(input_ele, 'code_region')
@@ -362,14 +507,25 @@ class XMLManager(IOManager):
     def generate_baseline_llvm_input(self, output_file, config_db=None):
         self.create_dummy_llvm_input(output_file)
 
-    def parse_llvm_inputs(self, input_files):
+    def parse_llvm_inputs(self, input_files, policy=None, prefer_file=None):
         """
         Parse a list of llvm xml input files
         Args:
             input_files (a list of str): a list of llvm xml input files.
+            policy (str): if set, keep one <input> per code region according
+                to this policy (MERGE_POLICIES).
+            prefer_file (str): the preferred input file of the "prefer"
+                policy.
         Returns:
             result_xml_tree (ElementTree): an ElementTree instance.
         """
+        if policy is not None:
+            inputs = xml_writer.Element('inputs')
+            resolver = DuplicateResolver(policy, prefer_file)
+            for element, _ in resolver.resolve(
+                    _iter_merge_documents(input_files, policy)):
+                inputs.append(element)
+            return xml_writer.ElementTree(inputs)
         result_xml_tree = None
         for input_file in input_files:
             xml_tree = xml_reader.parse(input_file)
@@ -384,12 +540,53 @@ class XMLManager(IOManager):
         xml_tree = xml_reader.parse(input_file)
         return _divide_llvm_input_tree(xml_tree)
 
+    def merge_llvm_input_files(self, input_files, output_file, policy=None,
+                               prefer_file=None):
+        """
+        Merge llvm xml input files into output_file, streaming the <input>
+        elements to it one at a time. With a policy, the <input> elements
+        of the same <code_region> are resolved by a DuplicateResolver.
+        """
+        resolver = DuplicateResolver(policy, prefer_file)
+        fd = create_secure_fd(output_file)
+        try:
+            with os.fdopen(fd, 'wb') as output_file_handler:
+                output_file_handler.write(b'<inputs>')
+                for _, data in resolver.resolve(
+                        _iter_merge_documents(input_files, policy)):
+                    output_file_handler.write(data)
+                output_file_handler.write(b'</inputs>')
+        except Exception:
+            os.remove(output_file)
+            raise
+        return resolver.stats
+
+    def divide_llvm_input_file(self, input_file, output_dir,
+                               max_open_files=DEFAULT_MAX_OPEN_FILES):
+        """
+        Divide a llvm xml input file into output_dir as divide_llvm_input()
+        does, routing each <input> element to the writer of its source file.
+        """
+        extension = self.get_file_extension()
+        with LRUWriters(_InputWriter, max_open_files) as writers:
+            for element, data in _iter_llvm_inputs(input_file):
+                file_name = element.find("code_region/file_name")
+                if file_name is not None:
+                    writers.write(os.path.join(
+                        output_dir,
+                        os.path.basename(file_name.text) + extension), data)
+        for output_file in writers.counts:
+            with open(output_file, 'ab') as output_file_handler:
+                output_file_handler.write(b'</inputs>')
+        return dict(writers.counts)
+
     def generate_search_space_file(self, files, output_file, config_file,
                                    name_filter=None, func_name_filter=None,
                                    file_name_filter=None, type_filter=None,
                                    pass_filter=None, config_db=None,
                                    use_hash_matching=False,
-                                   use_prev_configs=False, inject_seed=False):
+                                   use_prev_configs=False, inject_seed=False,
+                                   pruning_thresholds=None):
         """
         Generate search space file for auto-tuner driver based on opportunities
         files which are generated by llvm, and output as output_file
@@ -410,11 +607,13 @@ class XMLManager(IOManager):
                                                   pass_filter)
         new_xml_tree.write(output_file)
 
+    @profiling.timed("search_space.generate")
     def generate_search_space(self, files, config_file, file_name_filter=None,
                               func_name_filter=None, name_filter=None,
                               type_filter=None, pass_filter=None,
                               config_db=None, use_hash_matching=False,
-                              use_prev_configs=False, inject_seed=False):
+                              use_prev_configs=False, inject_seed=False,
+                              pruning_thresholds=None):
         """
         Parse opportunities files generated by llvm and return a search space
         as ElementTree.
@@ -432,11 +631,14 @@ class XMLManager(IOManager):
 
         # new xml file for output
         new_xml_root = xml_writer.Element('tuning_request')
+        # search space of xml configuration file
+        global_param_config = _parse_global_params(config_file)
         # if the given path is a directory
         tuning_id = 0
         for filename in files:
             end_tuning_id = _generate_search_space(filename, new_xml_root,
-                                                   tuning_id, config_file,
+                                                   tuning_id,
+                                                   global_param_config,
                                                    name_filter,
                                                    func_name_filter,
                                                    file_name_filter,
@@ -457,7 +659,8 @@ class XMLManager(IOManager):
             tree.write(output_file_handler)
 
     @staticmethod
-    def seed_baseline(task_map, config_db, filepath):
+    def seed_baseline(task_map, config_db, filepath,
+                      similar_config_threshold=None):
         return None
 
     def create_dummy_llvm_input(self, output_file):
@@ -4,25 +4,16 @@ A set of tools to generate/parse the YAML files for AutoTuning-enabled LLVM
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
 
-from autotuner.dbutils import add_current_code_region
-from autotuner.dbutils import clear_config_db
-from autotuner.dbutils import get_current_code_regions
-from autotuner.dbutils import is_duplicate_hash
-from autotuner.dbutils import optimal_config_exists
-from autotuner.dbutils import update_optimal_configs
-from autotuner.dbutils import get_optimal_config
+from autotuner.models import ParamEncoder
 from autotuner.models import Task
 from autotuner.models import CodeRegion
+from autotuner import profiling
 from autotuner.utils import create_secure_fd
-from opentuner.search.manipulator import EnumParameter
-from opentuner.search.manipulator import IntegerParameter
-from opentuner.search.manipulator import FloatParameter
-from opentuner.search.manipulator import PermutationParameter
-from opentuner.search.manipulator import SelectionParameter
 
 from copy import deepcopy
 import json
 import logging
+import math
 import os
 import yaml
 
@@ -32,12 +23,32 @@ except ImportError:
     from yaml import Loader
 
 from .remarkparser import get_remarks
+from .remarkparser import iter_remarks
 from .remarkparser import AutoTuning
+from autotuner.iomanager import DEFAULT_MAX_OPEN_FILES
+from autotuner.iomanager import DuplicateResolver
 from autotuner.iomanager import EmptySearchSpaceError
 from autotuner.iomanager import IOManager
+from autotuner.iomanager import InvalidLLVMInputError
+from autotuner.iomanager import LRUWriters
+from autotuner.iomanager import document_digest
+from autotuner.iomanager import open_for_append
 
 log = logging.getLogger(__name__)
 
+# Manifest written with the per-source-file shards of an LLVM input, and
+# name of the shard of the remarks without a source file.
+SHARD_MANIFEST = "manifest.json"
+SHARD_FORMAT = {"format": "autotuner-shards", "version": 1}
+DEFAULT_SHARD = "no_name"
+
+# Maps the name of a static pruning threshold to the opportunity remark field
+# the compiler stores the corresponding metadata in.
+PRUNING_METADATA = {
+    "size": "Size",
+    "depth": "Depth",
+}
+
 
 def _apply_code_region_filter(string, filer_list):
     if filer_list and string != "undefined":
@@ -46,52 +57,201 @@ def _apply_code_region_filter(string, filer_list):
         return True
 
 
+def _prune_code_region(remark, pruning_thresholds):
+    """
+    Determines if a code region should be left out of the search space based
+    on the static metadata emitted by the compiler in the opportunity file.
+
+    Args:
+        remark: the remark (opportunity) under consideration.
+        pruning_thresholds (dict of str: int): minimum values keyed by
+           'size', 'depth' and 'dynamic_values'. A threshold set to None
+           (or missing) is not applied. A code region which does not carry
+           the corresponding metadata is never pruned by it. Invocation is
+           not a threshold: it numbers the invocations of a pass and is part
+           of the identity of a code region, not a measure of its hotness.
+
+    Returns True iff the code region falls below any of the thresholds.
+    Compilation flags (llvm-param and program-param) are never pruned.
+    """
+    if not pruning_thresholds or \
+            remark.CodeRegionType in ("llvm-param", "program-param"):
+        return False
+
+    for threshold_name, field in PRUNING_METADATA.items():
+        threshold = pruning_thresholds.get(threshold_name)
+        if threshold is None or not hasattr(remark, field):
+            continue
+        try:
+            if int(getattr(remark, field)) < threshold:
+                return True
+        except (TypeError, ValueError):
+            log.warning("Ignoring non-integer %s metadata of code region "
+                        "%s", field, getattr(remark, "Name", ""))
+
+    # DynamicConfigs is a dic: str -> list[int]. If the compiler suggests
+    # fewer values than the threshold for every parameter, there is too
+    # little to explore for this code region.
+    threshold = pruning_thresholds.get("dynamic_values")
+    dynamic_configs = getattr(remark, "DynamicConfigs", None)
+    if threshold is not None and dynamic_configs:
+        cardinality = max(len(values) if isinstance(values, list) else 1
+                          for values in dynamic_configs.values())
+        if cardinality < threshold:
+            return True
+    return False
+
+
+def search_space_dimensions(yaml_list):
+    """
+    Measure a search space (as returned by generate_search_space).
+
+    Returns a tuple of the number of tuning parameters (the dimensions of the
+    opentuner manipulator) and the base-10 logarithm of the number of
+    distinct configurations. Float parameters only add a dimension.
+    """
+    dimensions = 0
+    log_size = 0.0
+    for yaml_elem in yaml_list:
+        for options in (yaml_elem['Params'] or {}).values():
+            dimensions += 1
+            param_type = options.get("Type")
+            if param_type == "bool":
+                log_size += math.log10(2)
+            elif param_type == "enum":
+                log_size += math.log10(max(len(options['Value']), 1))
+            elif param_type in ("int", "range"):
+                min_key, max_key = (("Min", "Max") if param_type == "int"
+                                    else ("min", "max"))
+                log_size += math.log10(max(
+                    int(options[max_key]) - int(options[min_key]) + 1, 1))
+            elif param_type in ("permutation", "selection"):
+                # log10(n!)
+                log_size += math.lgamma(len(options['Value']) + 1) / \
+                    math.log(10)
+    return dimensions, log_size
+
+
 def _parse_param(tuning_id, yaml_param, ele):
     """
     Help function to return a enumeration list based on param type
     """
+    # Imported here: merge and divide do not need opentuner.
+    from opentuner.search import manipulator
     param_type = yaml_param["Type"]
 
     if param_type == "bool":
-        return EnumParameter(str(tuning_id) + ele, ["1", "0"])
+        return manipulator.EnumParameter(str(tuning_id) + ele, ["1", "0"])
 
     elif param_type == "enum":
         options = yaml_param['Value']
-        return EnumParameter(str(tuning_id) + ele, options)
+        return manipulator.EnumParameter(str(tuning_id) + ele, options)
 
     elif param_type == "range":
         # Keep param_type == "range" for backwards compatability
         min_value = int(yaml_param["min"])
         max_value = int(yaml_param["max"])
-        return IntegerParameter(str(tuning_id) + ele, min_value, max_value)
+        return manipulator.IntegerParameter(str(tuning_id) + ele, min_value,
+                                            max_value)
 
     elif param_type == "int":
         min_value = int(yaml_param["Min"])
         max_value = int(yaml_param["Max"])
-        return IntegerParameter(str(tuning_id) + ele, min_value, max_value)
+        return manipulator.IntegerParameter(str(tuning_id) + ele, min_value,
+                                            max_value)
 
     elif param_type == "float":
         min_value = float(yaml_param["Min"])
         max_value = float(yaml_param["Max"])
-        return FloatParameter(str(tuning_id) + ele, min_value, max_value)
+        return manipulator.FloatParameter(str(tuning_id) + ele, min_value,
+                                          max_value)
 
     elif param_type == "permutation":
         options = yaml_param['Value']
-        return PermutationParameter(str(tuning_id) + ele, options)
+        return manipulator.PermutationParameter(str(tuning_id) + ele,
+                                                options)
 
     elif param_type == "selection":
         options = yaml_param['Value']
-        return SelectionParameter(str(tuning_id) + ele, options)
+        return manipulator.SelectionParameter(str(tuning_id) + ele,
+                                              options)
 
     else:
         raise Exception("No type specified for params in file")
 
 
+def _emit_opt_pass(args, raw_name, choice):
+    # A selection parameter takes a dict, a permutation parameter a list.
+    if isinstance(choice, dict):
+        choice = choice["order"][:choice["size"]]
+    args.append({raw_name: choice or []})
+
+
+def _emit_machine_scheduling(args, raw_name, direction):
+    # Bidirectional unless TopDown or BottomUp.
+    args.append({"ForceBottomUp": int(direction == "BottomUp")})
+    args.append({"ForceTopDown": int(direction == "TopDown")})
+
+
+def _emit_value(args, raw_name, value):
+    args.append({raw_name: value})
+
+
+def _seed_opt_pass(param, raw_name, param_map):
+    # Creating parameter according to SelectionParameter.
+    parameter = deepcopy(param_map)
+    parameter['order'] = parameter.pop(raw_name)
+    parameter['size'] = len(parameter['order'])
+    return parameter
+
+
+def _seed_machine_scheduling(param, raw_name, param_map):
+    return param_map
+
+
+def _seed_value(param, raw_name, param_map):
+    if raw_name in param_map:
+        return param_map[raw_name]
+    # In case the user changes the search space,
+    # there may be unseen paramters that are not stored.
+    return param.seed_value()
+
+
+# Parameters whose value is not written as is: raw name -> (emit, seed).
+_SPECIAL_PARAMS = {
+    "OptPass": (_emit_opt_pass, _seed_opt_pass),
+    "MachineScheduling": (_emit_machine_scheduling,
+                          _seed_machine_scheduling),
+}
+
+
+def _param_encoder(param, raw_name):
+    emit, seed = _SPECIAL_PARAMS.get(raw_name, (_emit_value, _seed_value))
+    return ParamEncoder(param, raw_name, emit, seed)
+
+
+def _task_encoders(task):
+    """
+    Returns the ParamEncoders of `task`, built on first use for tasks not
+    created by parse_search_space() (e.g. in states of older versions).
+    """
+    if getattr(task, "encoders", None) is None:
+        # Since param.name is in the form of ID+Param
+        # (e.g. 14UnrollCount), only remove the first occurrence.
+        task.encoders = [
+            _param_encoder(param, param.name.replace(str(task.tuning_id), "",
+                                                     1))
+            for param in task.param_list]
+    return task.encoders
+
+
 def _update_program_param_code_regions(config_db, code_region):
     """
     This function does similar thing as _update_current_code_regions().
     This function is added to handle program-param explicitly.
     """
+    from autotuner.dbutils import add_current_code_region
+    from autotuner.dbutils import is_duplicate_hash
     add_current_code_region(config_db, code_region, seen=False)
     if (is_duplicate_hash(config_db,
         code_region['Hashcode'], code_region["CodeRegionType"],
@@ -123,6 +283,13 @@ def _update_current_code_regions(config_db, code_region, use_hash_matching,
 
     Returns True iff the given code_region should be added to the search space.
     """
+    from autotuner.dbutils import add_code_region_features
+    from autotuner.dbutils import add_current_code_region
+    from autotuner.dbutils import is_duplicate_hash
+    from autotuner.dbutils import optimal_config_exists
+    # Keep the features of every code region so that later tuning runs can
+    # find its optimal configuration by similarity.
+    add_code_region_features(config_db, code_region)
     if (use_prev_configs and optimal_config_exists(config_db,
             code_region['Hashcode'], code_region["CodeRegionType"],
             code_region["Pass"])):
@@ -146,7 +313,7 @@ def _generate_search_space(file_path, yaml_list, start_tuning_id,
                       config_file, name_filter, func_name_filter,
                       file_name_filter, type_filter, pass_filter,
                       config_db, use_hash_matching, use_prev_configs,
-                      inject_seed):
+                      inject_seed, pruning_thresholds=None, pruned_list=None):
     tuning_id = start_tuning_id
     coderegion_found = 0
 
@@ -165,7 +332,9 @@ def _generate_search_space(file_path, yaml_list, start_tuning_id,
                     code_region['CodeRegion']['Pass'])
                 global_param_config[type_pass_tuple] = global_params
     # A list of all opportunites found by the compiler
-    remarks_list = get_remarks(file_path)
+    with profiling.phase("opp_parsing"):
+        remarks_list = get_remarks(file_path)
+    profiling.count("opp_regions", len(remarks_list))
     for remark in remarks_list:
         code_region = {}
         type_pass_tuple = (remark.CodeRegionType, remark.Pass)
@@ -206,6 +375,15 @@ def _generate_search_space(file_path, yaml_list, start_tuning_id,
                     remark.File, file_name_filter)
 
             should_add = True
+            if filtered and _prune_code_region(remark, pruning_thresholds):
+                # Pruned code regions are never stored in the database nor
+                # emitted into the LLVM input, so the compiler keeps its
+                # baseline decision for them.
+                if pruned_list is not None:
+                    pruned_list.append({'CodeRegion': code_region,
+                                        'Params': global_param_config[
+                                            type_pass_tuple]})
+                continue
             if filtered:
                 if code_region.get('CodeRegionType') == "program-param":
                     should_add = \
@@ -228,61 +406,49 @@ def _generate_search_space(file_path, yaml_list, start_tuning_id,
     return tuning_id, coderegion_found
 
 
-def _prepare_remarks(configuration_data, task_map, use_hash_matching):
+def _at_baseline(task, configuration_data):
+    """
+    Whether every parameter of `task` takes the baseline decision of the
+    compiler in `configuration_data`.
+    """
+    baseline = getattr(task, "baseline", None)
+    if not baseline or len(baseline) < len(task.param_list):
+        return False
+    # Values of the search space and of BaselineConfig may differ in type.
+    return all(str(configuration_data[name]) == str(value)
+               for name, value in baseline.items())
+
+
+def _prepare_remarks(configuration_data, task_map, use_hash_matching,
+                     omit_baseline=False):
     """
     Returns a collections of remarks for a given configuration and task_map.
     If hash_matching is not on: Returns a dict of (hash, type) -> Remark.
                                 Represents configurations for all
                                 equivalence classes in the search space.
     Otherwise: Returns a list of all remarks in the search space.
+    If omit_baseline, code regions at their baseline decision are left out
+    (None in the dict).
     """
     remark_lookup = dict()
     remark_list = []
 
     # loop through the task map to generate llvm input file for
     # tuning-enabled LLVM
-    for tuning_id, task in task_map.items():
+    for task in task_map.values():
+        if omit_baseline and _at_baseline(task, configuration_data):
+            if use_hash_matching:
+                code_region = task.code_region
+                remark_lookup[(int(code_region.hashcode),
+                               code_region.code_region_type,
+                               code_region.pass_name)] = None
+            continue
         remark = code_region_to_remark(task.code_region)
         remark.Args = []
 
         # construct the param
-        for param in task.param_list:
-            # Since param.name is in the form of ID+Param
-            # (e.g. 14UnrollCount), only remove the first occurrence.
-            raw_param_name = param.name.replace(str(tuning_id), "", 1)
-
-            if raw_param_name == "OptPass":
-                remark.Args.append({"OptPass": []})
-                choice = configuration_data[param.name]
-
-                # check if the value comes from selection parameter
-                if isinstance(choice, dict):
-                    pass_order = choice["order"]
-                    size = choice["size"]
-                    pass_list = pass_order[:size]
-
-                # otherwise the value comes from permutation parameter
-                else:
-                    pass_list = choice
-
-                if pass_list:
-                    remark.Args[0]["OptPass"] = pass_list
-
-            elif raw_param_name == "MachineScheduling":
-                if configuration_data[param.name] == "TopDown":
-                    remark.Args.append({"ForceBottomUp": 0})
-                    remark.Args.append({"ForceTopDown": 1})
-                elif configuration_data[param.name] == "BottomUp":
-                    remark.Args.append({"ForceBottomUp": 1})
-                    remark.Args.append({"ForceTopDown": 0})
-                else:
-                    # Bidirectional
-                    remark.Args.append({"ForceBottomUp": 0})
-                    remark.Args.append({"ForceTopDown": 0})
-            else:
-                data = {}
-                data[str(raw_param_name)] = configuration_data[param.name]
-                remark.Args.append(data)
+        for param, raw_name, emit, _ in _task_encoders(task):
+            emit(remark.Args, raw_name, configuration_data[param.name])
 
         # add this new created remark into the remark list
         if use_hash_matching:
@@ -299,7 +465,8 @@ def _prepare_remarks(configuration_data, task_map, use_hash_matching):
 
 
 def _construct_remarks(configuration_data, task_map, config_db,
-                          use_hash_matching, fixed_llvm_input=None):
+                          use_hash_matching, fixed_llvm_input=None,
+                          omit_baseline=False):
     """
     Build a list of remarks ready to be serialized for tuning-enabled LLVM
     based on the task_map and configuration_data.
@@ -321,7 +488,11 @@ def _construct_remarks(configuration_data, task_map, config_db,
 
         use_hash_matching (Bool): Flag determining if identical hashes have
         been filered out of the search space.
+
+        omit_baseline (Bool): Leave out the code regions of the search space
+        whose parameters all take the baseline decision of the compiler.
     """
+    from autotuner.dbutils import get_current_code_regions
 
     # a list of Autotuning remarks that will be dumped into a file
     remark_list = []
@@ -332,7 +503,7 @@ def _construct_remarks(configuration_data, task_map, config_db,
     #   a dictionary of equivalance classes (hash, type, pass).
     # Otherwise, will be a list of remarks.
     remark_lookup = _prepare_remarks(
-        configuration_data, task_map, use_hash_matching
+        configuration_data, task_map, use_hash_matching, omit_baseline
     )
     # There is at most one program-param within the remark_lookup and we want to
     # filter out the arguments that the only program-param code region has
@@ -383,6 +554,9 @@ def _construct_remarks(configuration_data, task_map, config_db,
                 key = (int(code_region.hashcode),
                 code_region.code_region_type,
                 code_region.pass_name)
+                if remark_lookup[key] is None:
+                    # The compiler keeps its baseline decision.
+                    continue
                 remark.Args = remark_lookup[key].Args
             remark_list.append(remark)
 
@@ -420,11 +594,66 @@ def code_region_to_remark(code_region):
     return remark
 
 
+def _check_remark(input_file, index, remark):
+    if not isinstance(remark, AutoTuning):
+        raise InvalidLLVMInputError(
+            "{}: document {} is not an !AutoTuning remark ({})".format(
+                input_file, index, type(remark).__name__))
+
+
+def _iter_merge_documents(input_files, policy):
+    """
+    Yields the remarks of input_files as the documents of a
+    DuplicateResolver, identified by AutoTuning.region_key.
+    """
+    for input_file in input_files:
+        for index, remark in enumerate(iter_remarks(input_file)):
+            _check_remark(input_file, index, remark)
+            if policy is None:
+                yield input_file, None, None, remark
+            else:
+                yield (input_file,
+                       document_digest(repr(remark.region_key).encode()),
+                       document_digest(repr(
+                           getattr(remark, "Args", None)).encode()),
+                       remark)
+
+
+class _RemarkWriter(object):
+    """
+    Writes remarks to an output file of a streamed divide. Every document
+    starts with '---', so that the streams of the writers successively
+    opened on a file concatenate.
+    """
+
+    def __init__(self, file_path, append):
+        if append:
+            fd = open_for_append(file_path)
+        else:
+            fd = create_secure_fd(file_path)
+        self.file = os.fdopen(fd, 'w')
+        self.dumper = yaml.Dumper(self.file, width=1200,
+                                  default_flow_style=True,
+                                  explicit_start=True)
+        self.dumper.open()
+
+    def write(self, remark):
+        self.dumper.represent(remark)
+
+    def close(self):
+        try:
+            self.dumper.close()
+            self.dumper.dispose()
+        finally:
+            self.file.close()
+
+
 class YAMLManager(IOManager):
     def get_file_extension(self):
         return ".yaml"
 
 
+    @profiling.timed("search_space.parse")
     def parse_search_space(self, search_space, use_dynamic_values = False,
                            use_baseline_config = False, filepath = None):
         """
@@ -485,6 +714,8 @@ class YAMLManager(IOManager):
                 tune_compilation_flags = True
 
             param_list = []
+            encoders = []
+            baseline = {}
             # loop through the task elements in yaml file
             for ele in param_list_yaml.keys():
                 options = {}
@@ -501,6 +732,7 @@ class YAMLManager(IOManager):
                 # code region recorded dynamically durning baseline compilation.
                 if ele in baseline_dic:
                     baseline_config = baseline_dic[ele]
+                    baseline[param_name] = baseline_config
                 # Fetch baseline/default values for compiler flags statically
                 # stored in 'extended_search_space.yaml' file for LLVMParam and
                 # ProgramParam code regions.
@@ -513,6 +745,7 @@ class YAMLManager(IOManager):
                                                   else baseline_config)
                 if param:
                     param_list.append(param)
+                    encoders.append(_param_encoder(param, str(ele)))
 
             if param_list:
                 # retrieve code_region information from yaml
@@ -529,7 +762,8 @@ class YAMLManager(IOManager):
                 if code_region not in code_region_set:
                     code_region_set.add(code_region)
                     task_map[int(tuning_id)] = Task(int(tuning_id),
-                                                    param_list, code_region)
+                                                    param_list, code_region,
+                                                    encoders, baseline)
         if use_baseline_config:
             with open(filepath, 'w') as file:
                 json.dump(seed_configuration, file)
@@ -542,7 +776,8 @@ class YAMLManager(IOManager):
                                    file_name_filter=None, type_filter=None,
                                    pass_filter=None, config_db=None,
                                    use_hash_matching=False,
-                                   use_prev_configs=False, inject_seed=False):
+                                   use_prev_configs=False, inject_seed=False,
+                                   pruning_thresholds=None):
         """
         Generate search space file for auto-tuner driver based on opportunities
         files which are generated by llvm, and output as output_file
@@ -560,15 +795,18 @@ class YAMLManager(IOManager):
                                                func_name_filter, name_filter,
                                                type_filter, pass_filter,
                                                config_db, use_hash_matching,
-                                               use_prev_configs, inject_seed)
+                                               use_prev_configs, inject_seed,
+                                               pruning_thresholds)
         self.output_to_file(output_file, yaml_list)
 
 
+    @profiling.timed("search_space.generate")
     def generate_search_space(self, files, config_file, file_name_filter=None,
                               func_name_filter=None, name_filter=None,
                               type_filter=None, pass_filter=None,
                               config_db=None, use_hash_matching=False,
-                              use_prev_configs=False, inject_seed=False):
+                              use_prev_configs=False, inject_seed=False,
+                              pruning_thresholds=None):
         """
         Parse opportunities files generated by llvm and return a search space
         as list.
@@ -579,6 +817,9 @@ class YAMLManager(IOManager):
             or a directory contains all the files of code regions.
             config_file (str): A path to the config file
             where the global search space settings are defined.
+            pruning_thresholds (dict of str: int): static thresholds used to
+            leave small or cold code regions at their baseline decision
+            (see _prune_code_region).
         Returns:
             a new list type object represents the search space file
         """
@@ -589,6 +830,7 @@ class YAMLManager(IOManager):
 
         # Clear the currentCodeRegion table from the database
         if config_db:
+            from autotuner.dbutils import clear_config_db
             clear_config_db(config_db)
 
         # new yaml file for output
@@ -598,6 +840,8 @@ class YAMLManager(IOManager):
         total_coderegion_found = 0
         # ID to keep track of code regions added to create search space.
         tuning_id = 0
+        # Code regions left at their baseline decision by static pruning.
+        pruned_list = []
         for filename in files:
             end_tuning_id, coderegion_found = _generate_search_space(filename,
                                                    yaml_list, tuning_id,
@@ -607,7 +851,9 @@ class YAMLManager(IOManager):
                                                    type_filter, pass_filter,
                                                    config_db, use_hash_matching,
                                                    use_prev_configs,
-                                                   inject_seed)
+                                                   inject_seed,
+                                                   pruning_thresholds,
+                                                   pruned_list)
             tuning_id = end_tuning_id
             total_coderegion_found += coderegion_found
 
@@ -616,6 +862,16 @@ class YAMLManager(IOManager):
         else:
             log.debug("Total code regions found: %d", total_coderegion_found)
             log.debug("Code regions added: %d", tuning_id)
+        profiling.count("search_space_regions", tuning_id)
+
+        if pruned_list:
+            kept_dims, kept_size = search_space_dimensions(yaml_list)
+            pruned_dims, pruned_size = search_space_dimensions(pruned_list)
+            log.info("Static pruning kept %d code regions at their baseline "
+                     "decision; search space reduced from %d to %d "
+                     "dimensions (~10^%.1f to ~10^%.1f configurations)",
+                     len(pruned_list), kept_dims + pruned_dims, kept_dims,
+                     kept_size + pruned_size, kept_size)
 
         return yaml_list
 
@@ -623,25 +879,101 @@ class YAMLManager(IOManager):
     @staticmethod
     def update_config_db(configuration_data, task_map,
                          fixed_llvm_input=None, config_db=None,
-                         use_hash_matching=True):
+                         use_hash_matching=True, objective=None,
+                         objective_value=None, policy="better"):
+        from autotuner.dbutils import update_optimal_configs
         remark_list = _construct_remarks(configuration_data, task_map,
                                 config_db, use_hash_matching, fixed_llvm_input)
-        update_optimal_configs(config_db, remark_list)
+        update_optimal_configs(config_db, remark_list, objective,
+                               objective_value, policy)
 
 
+    @profiling.timed("emit_input")
     def build_llvm_input(self, configuration_data, task_map, output_file,
                          fixed_llvm_input=None, config_db=None,
-                         use_hash_matching=False):
+                         use_hash_matching=False, omit_baseline=False,
+                         shard_dir=None):
         """
         Build an input yaml file for tuning-enabled LLVM based on task_map and
-        configuration_data, and output as output_file
+        configuration_data, and output as output_file. If omit_baseline,
+        code regions at the baseline decision of the compiler are not
+        written. If shard_dir is set, the input is also written there as one
+        file per source file, see output_shards().
         """
         remark_list = _construct_remarks(
             configuration_data, task_map,
-            config_db, use_hash_matching, fixed_llvm_input)
+            config_db, use_hash_matching, fixed_llvm_input, omit_baseline)
+        profiling.count("input_regions", len(remark_list))
+        if shard_dir:
+            self.output_shards(shard_dir, remark_list)
+        if omit_baseline and not remark_list:
+            self.create_dummy_llvm_input(output_file)
+            return
         self.output_to_file(output_file, remark_list)
 
+    def output_shards(self, shard_dir, remark_list):
+        """
+        Write remark_list into shard_dir as one input per source file
+        (DebugLoc.File), grouped as by divide_llvm_input(), so that each
+        compilation reads only the remarks of its file. Remarks without a
+        source file (e.g. llvm-param) apply to every compilation: they are
+        written to every shard and to the default shard, for the other
+        source files. SHARD_MANIFEST maps each source file to its shard.
+
+        Returns:
+            The manifest (dict).
+        """
+        extension = self.get_file_extension()
+        shards = {}
+        common_remarks = []
+        for remark in remark_list:
+            if hasattr(remark, "DebugLoc"):
+                shards.setdefault(remark.DebugLoc["File"], []).append(remark)
+            else:
+                common_remarks.append(remark)
+
+        manifest_path = os.path.join(shard_dir, SHARD_MANIFEST)
+        if os.path.isdir(shard_dir):
+            # Remove the shards of the previous input.
+            try:
+                with open(manifest_path) as file:
+                    previous = json.load(file)
+                for name in [previous["default"]] + \
+                        list(previous["shards"].values()):
+                    os.remove(os.path.join(shard_dir,
+                                           os.path.basename(name)))
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        else:
+            os.makedirs(shard_dir)
+
+        manifest = dict(SHARD_FORMAT, default=DEFAULT_SHARD + extension,
+                        shards={})
+        names = {manifest["default"]}
+        for source_file, remarks in shards.items():
+            # Source files of different directories may have the same name.
+            base_name = os.path.basename(source_file)
+            name = base_name + extension
+            index = 1
+            while name in names:
+                name = "{}.{}{}".format(base_name, index, extension)
+                index += 1
+            names.add(name)
+            manifest["shards"][source_file] = name
+            self.output_to_file(os.path.join(shard_dir, name),
+                                common_remarks + remarks)
+        default_path = os.path.join(shard_dir, manifest["default"])
+        if common_remarks:
+            self.output_to_file(default_path, common_remarks)
+        else:
+            self.create_dummy_llvm_input(default_path)
+        fd = create_secure_fd(manifest_path)
+        with os.fdopen(fd, 'w') as file:
+            json.dump(manifest, file, indent=2)
+        return manifest
+
     def generate_baseline_llvm_input(self, output_file, config_db=None):
+        from autotuner.dbutils import get_current_code_regions
         remark_list = []
         for code_region_config in get_current_code_regions(config_db,
                                                            ignore_seen=True):
@@ -660,66 +992,133 @@ class YAMLManager(IOManager):
 
 
     @staticmethod
-    def seed_baseline(task_map, config_db, filepath):
+    def seed_baseline(task_map, config_db, filepath,
+                      similar_config_threshold=None):
         """
         Generate a configuration consisting of past opportunities stored in
         config_db (if it exists). For each opportunity in the task_map,
         initialize the configuration with the parameters found in config_db,
         or randomly otherwise.
+        If similar_config_threshold is set, opportunities without a stored
+        configuration are initialized with the configuration of the most
+        similar stored code region scoring at least this threshold.
         """
+        from autotuner.dbutils import get_code_region_features
+        from autotuner.dbutils import get_optimal_config
+        from autotuner.warmstart import CodeRegionFeatures
+        from autotuner.warmstart import SimilarConfigIndex
+        similar_index = None
+        region_features = {}
+        if similar_config_threshold is not None:
+            similar_index = SimilarConfigIndex.from_config_db(
+                config_db, similar_config_threshold)
+            region_features = get_code_region_features(config_db)
+        similar_seeded = 0
+
         seed_configuration = dict()
-        for task_id, tuning_task in task_map.items():
+        for tuning_task in task_map.values():
             # task_map: int --> (ID, param_list, Coderegion)
             task_hash = tuning_task.code_region.hashcode
             task_pass = tuning_task.code_region.pass_name
             task_type = tuning_task.code_region.code_region_type
             stored_params = get_optimal_config(config_db, task_hash,
                                                task_type, task_pass)
+            if not stored_params and similar_index:
+                feature = region_features.get((task_hash, task_type,
+                                               task_pass))
+                if feature is not None:
+                    features = CodeRegionFeatures(
+                        feature.name, feature.func_name,
+                        feature.dynamic_configs, feature.baseline_config)
+                else:
+                    features = CodeRegionFeatures(
+                        tuning_task.code_region.name,
+                        tuning_task.code_region.func_name)
+                stored_params, _ = similar_index.lookup(task_type, task_pass,
+                                                        features)
+                if stored_params:
+                    similar_seeded += 1
             if stored_params:
                 param_map = {k: v for x in stored_params for k, v in x.items()}
             else:
                 param_map = None
 
-            for param in tuning_task.param_list:
+            for param, raw_name, _, seed in _task_encoders(tuning_task):
                 if param_map is None:
                     # If there is no associated configuration, initialize
                     # it to some random value (Opentuner implementation).
                     seed_configuration[param.name] = param.seed_value()
                 else:
-                    raw_name = param.name.replace(str(task_id), "", 1)
-                    if raw_name == "MachineScheduling":
-                        seed_configuration[param.name] = param_map
-                    elif raw_name == "OptPass":
-                        # Creating parameter according to SelectionParameter.
-                        parameter = deepcopy(param_map)
-                        parameter['order'] = parameter.pop(raw_name)
-                        parameter['size'] = len(parameter['order'])
-                        seed_configuration[param.name] = parameter
-                    elif raw_name in param_map:
-                        seed_configuration[param.name] = param_map[raw_name]
-                    else:
-                        # In case the user changes the search space,
-                        # there may be unseen paramters that are not stored.
-                        seed_configuration[param.name] = param.seed_value()
+                    seed_configuration[param.name] = seed(param, raw_name,
+                                                          param_map)
 
+        if similar_index is not None:
+            log.info("%d code region(s) seeded with the optimal "
+                     "configuration of a similar code region.",
+                     similar_seeded)
         with open(filepath, 'w') as file:
             json.dump(seed_configuration, file)
         return filepath
 
 
-    def parse_llvm_inputs(self, input_files):
+    def parse_llvm_inputs(self, input_files, policy=None, prefer_file=None):
         """
         Parse a list of llvm yaml input files
         Args:
             input_files (a list of str): a list of llvm yaml input files.
+            policy (str): if set, keep one remark per code region according
+                to this policy (MERGE_POLICIES).
+            prefer_file (str): the preferred input file of the "prefer"
+                policy.
         Returns:
             result list: a list that represent the merged yaml input file
         """
-        result_list = []
-        for input_file in input_files:
-            remarks = get_remarks(input_file)
-            result_list += remarks
-        return result_list
+        if policy is None:
+            result_list = []
+            for input_file in input_files:
+                remarks = get_remarks(input_file)
+                result_list += remarks
+            return result_list
+        resolver = DuplicateResolver(policy, prefer_file)
+        return list(resolver.resolve(_iter_merge_documents(input_files,
+                                                           policy)))
+
+    def merge_llvm_input_files(self, input_files, output_file, policy=None,
+                               prefer_file=None):
+        """
+        Merge llvm yaml input files into output_file, streaming the remarks
+        to it one document at a time. Every document must be an
+        !AutoTuning remark. With a policy, the remarks configuring the same
+        code region (AutoTuning.region_key) are resolved by a
+        DuplicateResolver.
+        """
+        resolver = DuplicateResolver(policy, prefer_file)
+        try:
+            self.output_to_file(output_file, resolver.resolve(
+                _iter_merge_documents(input_files, policy)))
+        except Exception:
+            os.remove(output_file)
+            raise
+        return resolver.stats
+
+    def divide_llvm_input_file(self, input_file, output_dir,
+                               max_open_files=DEFAULT_MAX_OPEN_FILES):
+        """
+        Divide a llvm yaml input file into output_dir as divide_llvm_input()
+        does, routing each remark to the writer of its source file.
+        """
+        extension = self.get_file_extension()
+        with LRUWriters(_RemarkWriter, max_open_files) as writers:
+            for index, remark in enumerate(iter_remarks(input_file)):
+                _check_remark(input_file, index, remark)
+                if hasattr(remark, "DebugLoc"):
+                    file_name = remark.DebugLoc["File"]
+                else:
+                    file_name = DEFAULT_SHARD
+                writers.write(os.path.join(
+                    output_dir, os.path.basename(file_name) + extension),
+                    remark)
+        return dict(writers.counts)
 
     def output_to_file(self, output_file, remark_list):
         fd = create_secure_fd(output_file)
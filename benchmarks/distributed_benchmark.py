@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the throughput of distributed trial evaluation.
+
+Runs trials with a fake compile and run (commands sleeping for a given time)
+on local worker processes connected over TCP, the way the measurement driver
+does with --workers: one thread per pending trial calls TunerBase.compile().
+Reports the number of trials per second for each number of workers.
+Example:
+
+    python3 benchmarks/distributed_benchmark.py --workers 1 2 4 \
+        --compile-time 0.2 --run-time 0.1 --trials 16
+
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import unittest.mock as mock
+from multiprocessing.pool import ThreadPool
+
+from autotuner.distributed import Coordinator
+from autotuner.tuners.simple_tuner import SimpleTuner
+
+SEARCH_SPACE = os.path.join(os.path.dirname(__file__), "..", "autotuner",
+                            "test", "Inputs", "run",
+                            "search_space_loop_only.yaml")
+
+CONFIG = """
+[Compiling Setting]
+CompileDir = {compile_dir}
+LLVMInputFile = %(CompileDir)s/input.yaml
+CompileCommand = sleep {compile_time}
+RunDir = %(CompileDir)s
+RunCommand = sleep {run_time}
+"""
+
+
+def trials_per_second(num_workers, num_trials, compile_time, run_time):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        compile_dir = os.path.join(temp_dir, "build")
+        os.mkdir(compile_dir)
+        config_file = os.path.join(temp_dir, "benchmark.ini")
+        with open(config_file, "w") as file:
+            file.write(CONFIG.format(compile_dir=compile_dir,
+                                     compile_time=compile_time,
+                                     run_time=run_time))
+        coordinator = Coordinator()
+        try:
+            coordinator.spawn_local_workers(
+                config_file, num_workers, os.path.join(temp_dir, "workers"))
+            coordinator.wait_for_workers(num_workers)
+            args = mock.MagicMock()
+            args.output = None
+            args.early_termination_factor = None
+            args.run_cpus = None
+            args.compile_cpus = None
+            args.serialize_runs = False
+            tuner = SimpleTuner(args, compile_dir,
+                                os.path.join(compile_dir, "input.yaml"),
+                                SEARCH_SPACE, "compile", compile_dir, "run",
+                                coordinator=coordinator)
+            configs = [tuner.manipulator().random()
+                       for _ in range(num_trials)]
+            pool = ThreadPool(num_workers)
+            start = time.time()
+            results = pool.starmap(tuner.compile,
+                                   [(config, index) for index, config
+                                    in enumerate(configs)])
+            elapsed = time.time() - start
+            pool.close()
+        finally:
+            coordinator.close()
+    failed = sum(1 for result in results if result.time == float('inf'))
+    return num_trials / elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--trials", type=int, default=16)
+    parser.add_argument("--compile-time", type=float, default=0.2)
+    parser.add_argument("--run-time", type=float, default=0.1)
+    args = parser.parse_args()
+
+    print("{:>8} {:>12} {:>8} {:>8}".format("workers", "trials/s",
+                                            "speedup", "failed"))
+    baseline = None
+    for num_workers in args.workers:
+        throughput, failed = trials_per_second(
+            num_workers, args.trials, args.compile_time, args.run_time)
+        baseline = baseline or throughput
+        print("{:>8} {:>12.2f} {:>8.2f} {:>8}".format(
+            num_workers, throughput, throughput / baseline, failed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the import time of the command-line interfaces.
+
+Imports each CLI module in a new interpreter with python -X importtime and
+reports the best cumulative import time of several runs. With --budget,
+exits with status 1 if a module takes longer. Example:
+
+    python3 benchmarks/import_time_benchmark.py --runs 5 --budget 250
+
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules imported by llvm-autotune, auto-tuner, and merge and divide.
+MODULES = ["autotuner.resumable.main", "autotuner.main",
+           "autotuner.yamlmanager"]
+
+
+def import_time(module):
+    """
+    Returns the cumulative import time of `module` in microseconds.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    for line in result.stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if line.startswith("import time:") and len(fields) == 3 and \
+                fields[2].strip() == module:
+            return int(fields[1])
+    raise ValueError("no import time for " + module)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=3,
+                        help="imports per module; the best one is reported")
+    parser.add_argument("--budget", type=float, metavar="MS",
+                        help="fail if a module takes longer to import")
+    args = parser.parse_args()
+
+    status = 0
+    print("{:<28} {:>10}".format("module", "best (ms)"))
+    for module in MODULES:
+        best = min(import_time(module) for _ in range(args.runs)) / 1000
+        print("{:<28} {:>10.1f}".format(module, best))
+        if args.budget is not None and best > args.budget:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
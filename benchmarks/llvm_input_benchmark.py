@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the size and emit time of LLVM inputs omitting baseline decisions.
+
+Parses a synthetic search space of loop code regions with a BaselineConfig,
+then writes the LLVM input of configurations in which a given fraction of
+the code regions keep their baseline decision, with and without
+omit_baseline (--omit-baseline-regions). Reports the mean time to write an
+input and its size. Example:
+
+    python3 benchmarks/llvm_input_benchmark.py --regions 5000 \
+        --baseline-fraction 0.5 0.9
+
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from autotuner.yamlmanager import YAMLManager
+
+UNROLL_COUNTS = [0, 1, 2, 4, 8]
+
+
+def _search_space(num_regions):
+    search_space = []
+    for index in range(num_regions):
+        search_space.append({
+            'TuningId': index + 1,
+            'CodeRegion': {
+                'Pass': 'loop-unroll', 'Name': 'for.body{}'.format(index),
+                'Function': 'function{}'.format(index // 10),
+                'CodeRegionType': 'loop', 'Hashcode': str(1000000 + index),
+                'Invocation': '0',
+                'DebugLoc': {'File': 'benchmark.c', 'Line': index,
+                             'Column': 3},
+                'BaselineConfig': {'UnrollCount': UNROLL_COUNTS[index % 5]}},
+            'Params': {'UnrollCount': {'Type': 'enum',
+                                       'Value': UNROLL_COUNTS}}})
+    return search_space
+
+
+def _configuration(task_map, baseline_fraction):
+    configuration = {}
+    for task in task_map.values():
+        for param in task.param_list:
+            if random.random() < baseline_fraction:
+                configuration[param.name] = task.baseline[param.name]
+            else:
+                configuration[param.name] = random.choice(
+                    [value for value in UNROLL_COUNTS
+                     if value != task.baseline[param.name]])
+    return configuration
+
+
+def emit(task_map, configurations, output_file, omit_baseline):
+    """
+    Returns the mean time to write the input of each configuration and the
+    mean size of the inputs in bytes.
+    """
+    yaml_manager = YAMLManager()
+    elapsed = size = 0
+    for configuration in configurations:
+        start = time.time()
+        yaml_manager.build_llvm_input(configuration, task_map, output_file,
+                                      omit_baseline=omit_baseline)
+        elapsed += time.time() - start
+        size += os.path.getsize(output_file)
+        os.unlink(output_file)
+    return elapsed / len(configurations), size / len(configurations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--regions", type=int, default=2000)
+    parser.add_argument("--baseline-fraction", type=float, nargs="+",
+                        default=[0.5, 0.9],
+                        help="fractions of the code regions at their "
+                             "baseline decision")
+    parser.add_argument("--configurations", type=int, default=5,
+                        help="configurations written per measurement")
+    args = parser.parse_args()
+    random.seed(0)
+
+    task_map = YAMLManager().parse_search_space(_search_space(args.regions))
+    print("{:>9} {:>9} {:>12} {:>12} {:>9}".format(
+        "baseline", "omit", "emit (ms)", "size (KiB)", "size (%)"))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "config.yaml")
+        for fraction in args.baseline_fraction:
+            configurations = [_configuration(task_map, fraction)
+                              for _ in range(args.configurations)]
+            full_size = None
+            for omit_baseline in (False, True):
+                elapsed, size = emit(task_map, configurations, output_file,
+                                     omit_baseline)
+                full_size = full_size or size
+                print("{:>9.2f} {:>9} {:>12.1f} {:>12.1f} {:>9.1f}".format(
+                    fraction, str(omit_baseline), 1000 * elapsed,
+                    size / 1024, 100 * size / full_size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
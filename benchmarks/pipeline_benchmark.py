@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the time and peak memory of the tuning stages against code regions.
+
+Writes synthetic tuning opportunities shaped like those of
+autotuner/test/Inputs/opp: the given number of code regions spread over
+--files source files, with one parameter type of --param-types per code
+region in turn. Then measures each stage of a tuning run on them:
+generate_search_space (with hash matching, so that the config database is
+filled), get_current_code_regions, parse_search_space, build_llvm_input,
+and the initialization, serialization and loading of the state of a
+resumable tuning run (AutoTunerInterface.initialize and StateSerializer).
+
+The time of a stage is the best of --repeat runs; its peak memory is the
+peak of the memory allocated during the stage, traced by tracemalloc in a
+separate run. --save-baseline writes the results to a JSON file and
+--baseline compares them with such a file: the stages slower or larger than
+the tolerances are reported as regressions and the exit status is 1.
+Example:
+
+    python3 benchmarks/pipeline_benchmark.py --regions 1000 10000 \
+        --save-baseline baseline.json
+    python3 benchmarks/pipeline_benchmark.py --regions 1000 10000 \
+        --baseline baseline.json --stages generate_search_space \
+        parse_search_space build_llvm_input
+
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+import autotuner.dbutils as dbutils
+from autotuner.resumable.interface import AutoTunerInterface
+from autotuner.resumable.interface import StateSerializer
+from autotuner.resumable.main import create_parser
+from autotuner.yamlmanager import YAMLManager
+
+# Param type -> (code region type, pass, parameter, search space of the
+# parameter), following autotuner/search_space_config.
+PARAM_TYPES = {
+    "enum": ("loop", "loop-unroll", "UnrollCount",
+             {"Type": "enum", "Value": [0, 1, 2, 4, 8]}),
+    "bool": ("callsite", "inline", "ForceInline", {"Type": "bool"}),
+    "int": ("instruction", "switch-lowering", "MinJumpTableEntries",
+            {"Type": "int", "Min": 0, "Max": 32}),
+    "float": ("loop", "float-pass", "DummyFloatParam",
+              {"Type": "float", "Min": 0.1, "Max": 10.0}),
+}
+
+STAGES = ["generate_search_space", "get_current_code_regions",
+          "parse_search_space", "build_llvm_input", "state.initialize",
+          "state.serialize", "state.deserialize"]
+
+FILE_HEADER = """--- !AutoTuning
+Pass:            all
+Name:            {file}
+Function:        none
+CodeRegionType:  other
+CodeRegionHash:  {hashcode}
+DynamicConfigs:  {{ }}
+...
+"""
+
+OPPORTUNITY = """--- !AutoTuning
+Pass:            {pass_name}
+Name:            for.body{index}
+DebugLoc:        {{ File: {file}, Line: {line}, Column: 3 }}
+Function:        function{function}
+CodeRegionType:  {code_region_type}
+CodeRegionHash:  {hashcode}
+DynamicConfigs:  {{ }}
+...
+"""
+
+# Time differences below this are noise on any machine, in seconds.
+MIN_TIME_DIFFERENCE = 0.01
+# The same for peak memory, in bytes.
+MIN_MEMORY_DIFFERENCE = 64 * 1024
+
+
+def write_opportunities(opp_dir, num_regions, num_files, param_types):
+    """
+    Writes num_regions code regions of the given param types in num_files
+    opportunity files under opp_dir, with 10 code regions per function.
+    """
+    os.makedirs(opp_dir, exist_ok=True)
+    for file_index in range(num_files):
+        source = "benchmark{}.c".format(file_index)
+        with open(os.path.join(opp_dir, source + ".yaml"), "w") as file:
+            file.write(FILE_HEADER.format(file=source, hashcode=file_index))
+            # Code regions are assigned to the files in turn.
+            for index in range(file_index, num_regions, num_files):
+                code_region_type, pass_name, _, _ = PARAM_TYPES[
+                    param_types[index % len(param_types)]]
+                file.write(OPPORTUNITY.format(
+                    pass_name=pass_name, index=index, file=source,
+                    line=index // num_files + 1, function=index // 10,
+                    code_region_type=code_region_type,
+                    hashcode=1000000 + index))
+
+
+def write_search_space(search_space_file, param_types):
+    """
+    Writes the search space configuration of the given param types.
+    """
+    documents = []
+    for param_type in param_types:
+        code_region_type, pass_name, parameter, values = \
+            PARAM_TYPES[param_type]
+        documents.append({"CodeRegion": {"CodeRegionType": code_region_type,
+                                         "Pass": pass_name,
+                                         "Args": {parameter: values}}})
+    with open(search_space_file, "w") as file:
+        yaml.dump_all(documents, file)
+
+
+def _measure(results, stage, trace_memory, function, *args, **kwargs):
+    """
+    Runs function and records the elapsed seconds, or the peak bytes
+    allocated during the call if trace_memory, in results[stage].
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        value = function(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        if trace_memory:
+            results[stage] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    if not trace_memory:
+        results[stage] = elapsed
+    return value
+
+
+def run_stages(work_dir, num_regions, args, trace_memory):
+    """
+    Runs the selected stages on num_regions synthetic code regions in
+    work_dir. Returns a dict of the elapsed seconds of each stage, or of its
+    peak memory in bytes if trace_memory.
+    """
+    results = {}
+    stages = set(args.stages)
+    search_space_file = os.path.join(work_dir, "search_space.yaml")
+    write_search_space(search_space_file, args.param_types)
+    yaml_manager = YAMLManager()
+
+    if stages & set(STAGES[:4]):
+        opp_dir = os.path.join(work_dir, "opp")
+        write_opportunities(opp_dir, num_regions, args.files,
+                            args.param_types)
+        opp_files = [os.path.join(opp_dir, name)
+                     for name in sorted(os.listdir(opp_dir))]
+        config_db = dbutils.create_config_db_session(work_dir, "benchmark")
+        search_space = _measure(
+            results, "generate_search_space", trace_memory,
+            yaml_manager.generate_search_space, opp_files, search_space_file,
+            config_db=config_db, use_hash_matching=True)
+        _measure(results, "get_current_code_regions", trace_memory,
+                 dbutils.get_current_code_regions, config_db)
+        config_db.close()
+        task_map = _measure(results, "parse_search_space", trace_memory,
+                            yaml_manager.parse_search_space, search_space)
+        configuration = {param.name: param.seed_value()
+                         for task in task_map.values()
+                         for param in task.param_list}
+        _measure(results, "build_llvm_input", trace_memory,
+                 yaml_manager.build_llvm_input, configuration, task_map,
+                 os.path.join(work_dir, "config.yaml"))
+
+    if stages & set(STAGES[4:]):
+        # As 'llvm-autotune minimize', which also runs the stages above.
+        data_dir = os.path.join(work_dir, "data")
+        write_opportunities(os.path.join(data_dir, "opp"), num_regions,
+                            args.files, args.param_types)
+        os.environ["CONFIG_DB_DIR"] = data_dir
+        parser_args = create_parser().parse_args(
+            ["minimize", "--search-space", search_space_file,
+             "--use-hash-matching", "--deterministic", "True"])
+        auto_tuner = AutoTunerInterface()
+        _measure(results, "state.initialize", trace_memory,
+                 auto_tuner.initialize, parser_args, data_dir, "minimize")
+        auto_tuner.next_config()
+        if stages & set(STAGES[5:]):
+            state_serializer = StateSerializer(data_dir)
+            _measure(results, "state.serialize", trace_memory,
+                     state_serializer.serialize, auto_tuner)
+        auto_tuner.api.session.close()
+        if "state.deserialize" in stages:
+            auto_tuner.auto_tuner_state = _measure(
+                results, "state.deserialize", trace_memory,
+                state_serializer.deserialize)
+        auto_tuner.auto_tuner_state.config_db.close()
+
+    return {stage: results[stage] for stage in STAGES
+            if stage in stages and stage in results}
+
+
+def benchmark(num_regions, args):
+    """
+    Returns {stage: {"seconds": ..., "peak_bytes": ...}} for num_regions.
+    """
+    times = {}
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as work_dir:
+            for stage, elapsed in run_stages(work_dir, num_regions, args,
+                                             False).items():
+                times[stage] = min(times.get(stage, elapsed), elapsed)
+    peaks = {}
+    if not args.no_memory:
+        with tempfile.TemporaryDirectory() as work_dir:
+            peaks = run_stages(work_dir, num_regions, args, True)
+    return {stage: {"seconds": times[stage], "peak_bytes": peaks.get(stage)}
+            for stage in times}
+
+
+def regressions(results, baseline, tolerance, memory_tolerance):
+    """
+    Returns a message for each measurement of results worse than the same
+    measurement of baseline by more than the tolerance (a fraction).
+    """
+    messages = []
+    for regions, stages in sorted(results.items(), key=lambda x: int(x[0])):
+        for stage, measures in stages.items():
+            base = baseline.get(regions, {}).get(stage)
+            if base is None:
+                continue
+            for key, allowed, minimum in [
+                    ("seconds", tolerance, MIN_TIME_DIFFERENCE),
+                    ("peak_bytes", memory_tolerance, MIN_MEMORY_DIFFERENCE)]:
+                new, old = measures.get(key), base.get(key)
+                if new is None or old is None:
+                    continue
+                if new > old * (1 + allowed) and new - old > minimum:
+                    messages.append(
+                        "{} at {} regions: {} {:.4g} -> {:.4g} "
+                        "(+{:.0f}%)".format(stage, regions, key, old, new,
+                                            100 * (new - old) / old))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--regions", type=int, nargs="+",
+                        default=[1000, 10000],
+                        help="numbers of code regions, up to 10^6")
+    parser.add_argument("--files", type=int, default=10,
+                        help="opportunity files the code regions are spread "
+                             "over")
+    parser.add_argument("--param-types", nargs="+", choices=PARAM_TYPES,
+                        default=["enum"],
+                        help="param types of the code regions, in turn")
+    parser.add_argument("--stages", nargs="+", choices=STAGES,
+                        default=STAGES)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of which the best time is kept")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not measure the peak memory")
+    parser.add_argument("--save-baseline", metavar="FILE",
+                        help="write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare the results with those of FILE")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="time increase reported as a regression")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1,
+                        help="peak memory increase reported as a regression")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    # OpenTuner configures the root logger at INFO on initialization.
+    logging.getLogger("autotuner").setLevel(logging.ERROR)
+
+    results = {}
+    print("{:>9} {:<26} {:>12} {:>12}".format(
+        "regions", "stage", "time (ms)", "peak (MiB)"))
+    for num_regions in args.regions:
+        results[str(num_regions)] = benchmark(num_regions, args)
+        for stage, measures in results[str(num_regions)].items():
+            peak = measures["peak_bytes"]
+            print("{:>9} {:<26} {:>12.1f} {:>12}".format(
+                num_regions, stage, 1000 * measures["seconds"],
+                "-" if peak is None else "{:.1f}".format(peak / 2 ** 20)))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump({"python": platform.python_version(),
+                       "files": args.files,
+                       "param_types": args.param_types,
+                       "results": results}, file, indent=2, sort_keys=True)
+        print("Baseline written to {}".format(args.save_baseline))
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if (baseline["files"], baseline["param_types"]) != \
+                (args.files, args.param_types):
+            print("Warning: the baseline was measured with --files {} "
+                  "--param-types {}".format(baseline["files"],
+                                           " ".join(baseline["param_types"])))
+        messages = regressions(results, baseline["results"], args.tolerance,
+                               args.memory_tolerance)
+        for message in messages:
+            print("Regression: " + message)
+        if messages:
+            return 1
+        print("No regression against {}".format(args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the latency of resumable tuning iterations against history size.
+
+Starts a resumable tuning run on synthetic tuning opportunities, then runs
+iterations of feedback and next configurations in process, as
+'llvm-autotune feedback' does (without saving and loading the tuning
+state). Reports the mean latency of an iteration as the number of results
+in autotuner.db grows. The SQLite settings can be changed to compare with
+the defaults of SQLite. Example:
+
+    python3 benchmarks/resultsdb_benchmark.py --iterations 500 --trials 8
+    python3 benchmarks/resultsdb_benchmark.py --iterations 500 --trials 8 \
+        --journal-mode DELETE --synchronous FULL
+
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import autotuner.dbutils as dbutils
+from autotuner.resumable.interface import AutoTunerInterface
+from autotuner.resumable.main import create_parser
+
+SEARCH_SPACE = """
+CodeRegion:
+  CodeRegionType: loop
+  Pass: loop-unroll
+  Args:
+    UnrollCount:
+      Value: [0, 1, 2, 4, 8]
+      Type: enum
+"""
+
+OPPORTUNITY = """--- !AutoTuning
+Pass:            loop-unroll
+Name:            for.body{index}
+DebugLoc:        {{ File: benchmark.c, Line: {index}, Column: 3 }}
+Function:        main
+CodeRegionType:  loop
+CodeRegionHash:  {hashcode}
+DynamicConfigs:  {{ }}
+...
+"""
+
+
+def _write_inputs(data_dir, search_space, num_regions):
+    opp_dir = os.path.join(data_dir, "opp")
+    os.mkdir(opp_dir)
+    with open(os.path.join(opp_dir, "benchmark.c.yaml"), "w") as file:
+        for index in range(num_regions):
+            file.write(OPPORTUNITY.format(index=index,
+                                          hashcode=1000000 + index))
+    with open(search_space, "w") as file:
+        file.write(SEARCH_SPACE)
+
+
+def iteration_latencies(iterations, trials, num_regions):
+    """
+    Returns the latency of each iteration in seconds.
+    """
+    latencies = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = os.path.join(temp_dir, "data")
+        os.mkdir(data_dir)
+        search_space = os.path.join(temp_dir, "search_space.yaml")
+        _write_inputs(data_dir, search_space, num_regions)
+        os.environ["CONFIG_DB_DIR"] = data_dir
+        args = create_parser().parse_args(
+            ["minimize", "--search-space", search_space,
+             "--trials", str(trials), "--deterministic", "True"])
+        auto_tuner = AutoTunerInterface()
+        start = time.time()
+        auto_tuner.initialize(args, data_dir, "minimize")
+        auto_tuner.next_config(trials)
+        latencies.append(time.time() - start)
+        for _ in range(iterations):
+            values = [random.uniform(1, 2) for _ in range(trials)]
+            start = time.time()
+            auto_tuner.feedback(values, commit=False)
+            auto_tuner.next_config(trials)
+            latencies.append(time.time() - start)
+        auto_tuner.api.session.close()
+        auto_tuner.auto_tuner_state.config_db.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--trials", type=int, default=8,
+                        help="configurations per iteration")
+    parser.add_argument("--regions", type=int, default=20,
+                        help="number of code regions to tune")
+    parser.add_argument("--window", type=int, default=50,
+                        help="iterations per reported mean")
+    parser.add_argument("--journal-mode",
+                        default=dbutils.SQLITE_PRAGMAS["journal_mode"])
+    parser.add_argument("--synchronous",
+                        default=dbutils.SQLITE_PRAGMAS["synchronous"])
+    args = parser.parse_args()
+    dbutils.SQLITE_PRAGMAS["journal_mode"] = args.journal_mode
+    dbutils.SQLITE_PRAGMAS["synchronous"] = args.synchronous
+    logging.basicConfig(level=logging.ERROR)
+    random.seed(0)
+
+    latencies = iteration_latencies(args.iterations, args.trials,
+                                    args.regions)
+    print("journal_mode={} synchronous={}".format(args.journal_mode,
+                                                  args.synchronous))
+    print("{:>10} {:>12} {:>12}".format("results", "mean (ms)", "max (ms)"))
+    for begin in range(1, len(latencies), args.window):
+        window = latencies[begin:begin + args.window]
+        print("{:>10} {:>12.1f} {:>12.1f}".format(
+            (begin - 1 + len(window)) * args.trials,
+            1000 * sum(window) / len(window), 1000 * max(window)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
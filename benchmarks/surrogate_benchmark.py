@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark search techniques on synthetic objective functions.
+
+Reports the number of evaluations each technique needs to reach a target
+value, using the same parameter types _parse_param builds from a search
+space (Enum, Integer and Permutation). Example:
+
+    python3 benchmarks/surrogate_benchmark.py --repeats 5 \
+        --technique SurrogateRandomForest AUCBanditMetaTechniqueA
+
+Copyright (C) 2017-2023, Huawei Technologies Co., Ltd. All rights reserved.
+"""
+import argparse
+import logging
+import random
+import statistics
+import sys
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import Result
+from opentuner.api import TuningRunManager
+from opentuner.measurement.inputmanager import FixedInputManager
+from opentuner.measurement.interface import DefaultMeasurementInterface
+from opentuner.search.manipulator import EnumParameter
+from opentuner.search.manipulator import IntegerParameter
+from opentuner.search.manipulator import PermutationParameter
+from opentuner.search.objective import MinimizeTime
+
+import autotuner.search.surrogate  # Registers autotuner search techniques.
+
+
+def _unroll_like(num_regions):
+    """
+    Loop regions with an UnrollCount/VectorizationInterleave pair each; only
+    a few regions are hot and the best factors differ per region.
+    """
+    manipulator = ConfigurationManipulator()
+    unroll = [0, 1, 2, 4, 8]
+    interleave = [1, 2, 4]
+    rng = random.Random(num_regions)
+    weights = [rng.choice([10.0, 1.0, 0.1, 0.1]) for _ in range(num_regions)]
+    best = [(rng.choice(unroll), rng.choice(interleave))
+            for _ in range(num_regions)]
+    for region in range(num_regions):
+        manipulator.add_parameter(
+            EnumParameter("{}UnrollCount".format(region), unroll))
+        manipulator.add_parameter(
+            EnumParameter("{}VectorizationInterleave".format(region),
+                          interleave))
+
+    def evaluate(cfg):
+        time = 1.0
+        for region in range(num_regions):
+            best_unroll, best_interleave = best[region]
+            time += weights[region] * (
+                abs(unroll.index(cfg["{}UnrollCount".format(region)]) -
+                    unroll.index(best_unroll)) +
+                abs(interleave.index(
+                    cfg["{}VectorizationInterleave".format(region)]) -
+                    interleave.index(best_interleave)))
+        return time
+
+    return manipulator, evaluate, 1.0 + sum(weights) * 0.5
+
+
+def _integer_quadratic(num_params):
+    manipulator = ConfigurationManipulator()
+    rng = random.Random(num_params)
+    optimum = [rng.randint(-20, 20) for _ in range(num_params)]
+    for index in range(num_params):
+        manipulator.add_parameter(
+            IntegerParameter("{}Threshold".format(index), -50, 50))
+
+    def evaluate(cfg):
+        return 1.0 + sum((cfg["{}Threshold".format(index)] - optimum[index])
+                         ** 2 for index in range(num_params)) / 100.0
+
+    return manipulator, evaluate, 1.0 + num_params * 0.5
+
+
+def _pass_order(num_passes):
+    manipulator = ConfigurationManipulator()
+    passes = ["pass{}".format(index) for index in range(num_passes)]
+    manipulator.add_parameter(PermutationParameter("1OptPass", passes))
+
+    def evaluate(cfg):
+        order = cfg["1OptPass"]
+        # Number of inversions against the reference pass order.
+        inversions = sum(1 for i in range(num_passes)
+                         for j in range(i + 1, num_passes)
+                         if passes.index(order[i]) > passes.index(order[j]))
+        return 1.0 + inversions
+
+    return manipulator, evaluate, 1.0 + num_passes // 2
+
+
+FUNCTIONS = {
+    "unroll": lambda: _unroll_like(12),
+    "quadratic": lambda: _integer_quadratic(6),
+    "pass-order": lambda: _pass_order(8),
+}
+
+
+def evaluations_to_target(function, technique, budget, seed):
+    """
+    Run a tuning session with `technique` and return the number of
+    evaluations needed to reach the target (or None within `budget`).
+    """
+    random.seed(seed)
+    manipulator, evaluate, target = FUNCTIONS[function]()
+    parser = argparse.ArgumentParser(parents=opentuner.argparsers())
+    args = parser.parse_args(["--technique", technique,
+                              "--database", "sqlite://", "--no-dups"])
+    interface = DefaultMeasurementInterface(
+        args=args, manipulator=manipulator, objective=MinimizeTime(),
+        input_manager=FixedInputManager(), project_name="benchmark",
+        program_name=function, program_version="0.1")
+    api = TuningRunManager(interface, args)
+    try:
+        for evaluation in range(1, budget + 1):
+            desired_result = api.get_next_desired_result()
+            while desired_result is None:
+                desired_result = api.get_next_desired_result()
+            value = evaluate(desired_result.configuration.data)
+            api.report_result(desired_result, Result(time=value))
+            if value <= target:
+                return evaluation
+        return None
+    finally:
+        api.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--function", nargs="+", choices=sorted(FUNCTIONS),
+                        default=sorted(FUNCTIONS))
+    parser.add_argument("--technique", nargs="+",
+                        default=["SurrogateRandomForest",
+                                 "AUCBanditMetaTechniqueA", "PureRandom"])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger("opentuner").setLevel(logging.CRITICAL)
+
+    print("{:<12} {:<26} {:>8} {:>8} {:>8}".format(
+        "function", "technique", "median", "mean", "reached"))
+    for function in args.function:
+        for technique in args.technique:
+            counts = [evaluations_to_target(function, technique, args.budget,
+                                            seed)
+                      for seed in range(args.repeats)]
+            reached = [count for count in counts if count is not None]
+            # Runs that never reach the target are counted as the budget.
+            padded = [count if count is not None else args.budget
+                      for count in counts]
+            print("{:<12} {:<26} {:>8.1f} {:>8.1f} {:>5}/{:<2}".format(
+                function, technique, statistics.median(padded),
+                statistics.mean(padded), len(reached), len(counts)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,15 @@
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
 import os
-import re
 
 from opentuner import Result
 from opentuner.search.objective import MinimizeCycle
+from autotuner.tuners.metrics import MetricExtractor
+from autotuner.tuners.metrics import tail_lines
 from autotuner.tuners.tunerbase import CustomTunerBase
 
+CYCLES = MetricExtractor("cycles", r"\[([0-9_]+)\]", int)
+
 
 class Tuner(CustomTunerBase):
 
@@ -39,10 +42,14 @@ class Tuner(CustomTunerBase):
         if run_result['returncode'] == 0:
             result_file_path = os.path.join(self.run_dir,
                                 "llt/model/st/data/AICore_Conv3_x/instr.dump")
-            with open(result_file_path) as result_file:
-                last_line = result_file.readlines()[-2].strip()
-                match = re.search(r"\[([0-9_]+)\]", last_line)
-                cycles = int(match.groups()[0])
+            # The cycles are on the second-to-last line of the dump.
+            lines = tail_lines(result_file_path, 2)
+            found = CYCLES.search(lines[0].strip()) \
+                if len(lines) == 2 else None
+            if found is None:
+                print("Error: no cycle count in " + result_file_path)
+            else:
+                cycles = found
         else:
             print('errors detected')
             self._print_errors(self.run_cmd, run_result)
@@ -7,9 +7,15 @@ import os
 
 from opentuner import Result
 from opentuner.search.objective import MinimizeCycle
+from autotuner.tuners.metrics import MetricExtractor
 from autotuner.tuners.tunerbase import CustomTunerBase
 from autotuner.utils import create_secure_fd
 
+EXTRACTORS = [
+    MetricExtractor("cycles", r"Total ticks\s*:\s*(\d+)", int),
+    MetricExtractor("validated", r"Correct operation validated\.", str),
+]
+
 
 class Tuner(CustomTunerBase):
 
@@ -23,16 +29,14 @@ class Tuner(CustomTunerBase):
         cycles = float('inf')
 
         # create a command for running a executable
-        run_result = self.call_program(self.run_cmd,
-                                       cwd=self.run_dir, limit=120)
+        run_result = self.stream_program(self.run_cmd, EXTRACTORS,
+                                         cwd=self.run_dir, limit=120)
 
         # check if the source program is compiled and run successful
         if run_result['returncode'] == 0:
-            std = run_result['stdout']
-            if "Correct operation validated." in std:
-                cycles_line = std.strip().splitlines()[2]
-
-                cycles = int(cycles_line.replace('Total ticks      :', ''))
+            metrics = run_result['metrics']
+            if "validated" in metrics and "cycles" in metrics:
+                cycles = metrics["cycles"]
             else:
                 if not os.path.isdir('errors_log'):
                     os.mkdir('errors_log')
@@ -40,7 +44,7 @@ class Tuner(CustomTunerBase):
                 fd = create_secure_fd("errors_log/errors_" +
                           str(desired_result.configuration.id) + ".log")
                 with os.fdopen(fd, 'w') as error_log_file:
-                    error_log_file.write(std)
+                    error_log_file.write(run_result['stdout'])
                 print('coremark errors detected')
         else:
             self._print_errors(self.run_cmd, run_result)
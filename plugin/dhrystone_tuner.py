@@ -3,12 +3,16 @@
 Dhrystone tuner instance
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
-import re
-
 from opentuner import Result
 from opentuner.search.objective import MaximizeRate
+from autotuner.tuners.metrics import MetricExtractor
 from autotuner.tuners.tunerbase import CustomTunerBase
 
+EXTRACTORS = [
+    MetricExtractor("rate", r"Dhrystones per Second:\s*(\d+)", int,
+                    last=True),
+]
+
 
 class Tuner(CustomTunerBase):
 
@@ -22,16 +26,12 @@ class Tuner(CustomTunerBase):
         rate = -1
 
         # create a command for running a executable
-        run_result = self.call_program(self.run_cmd,
-                                       cwd=self.run_dir, limit=120)
+        run_result = self.stream_program(self.run_cmd, EXTRACTORS,
+                                         cwd=self.run_dir, limit=120)
 
         # check if the source program is compiled and run successful
         if run_result['returncode'] == 0:
-            std = run_result['stdout']
-            rate_line = std.strip().splitlines()[-1]
-            match = re.search(r"Dhrystones per Second:\s*(\d+)", rate_line)
-            rate = int(match.groups()[0])
-
+            rate = run_result['metrics'].get("rate", rate)
         else:
             self._print_errors(self.run_cmd, run_result)
 
@@ -2,13 +2,34 @@
 """
 Copyright (C) 2017-2020, Huawei Technologies Co., Ltd. All rights reserved.
 """
+import math
 import os
 import re
 from opentuner import Result
 from opentuner.search.objective import MinimizeCycle
+from autotuner.tuners.metrics import MetricExtractor
 from autotuner.tuners.tunerbase import CustomTunerBase
 from autotuner.utils import create_secure_fd
 
+# runcpu reports the path of the text report and the benchmark run; the last
+# occurrence wins.
+EXTRACTORS = [
+    MetricExtractor("path", r"format: Text.*?(\S+)\s*$", str, last=True),
+    MetricExtractor("benchmark_name", r"Success:.*?(\S+)\s*$", str,
+                    last=True),
+]
+
+
+def _cycles(text):
+    """
+    The cycles of a SPEC report field; fields without a result (such as
+    "NR") are a failed measurement.
+    """
+    try:
+        return float(text)
+    except ValueError:
+        return float('inf')
+
 
 class Tuner(CustomTunerBase):
 
@@ -21,43 +42,42 @@ class Tuner(CustomTunerBase):
          """
         cycles = float('inf')
 
-        # create a command for running a executable
-        run_result = self.call_program(
-            self.run_cmd, cwd=self.run_dir, limit=10000)
+        # create a command for running a executable; the whole output is
+        # kept for the error log
+        run_result = self.stream_program(self.run_cmd, EXTRACTORS,
+                                         cwd=self.run_dir, limit=10000,
+                                         max_lines=None)
         # check if the source program is compiled and run successful
         if run_result['returncode'] == 0:
-            std = run_result['stdout']
-            if "Success:" in std:
-                find_path = "format: Text"
-                find_name = "Success:"
-                all_line = std.strip().splitlines()
-                path = None
-                benchmark_name = None
-                for line in all_line:
-                    if re.search(find_path, line):
-                        words = line.split()
-                        path = words[-1]
-                    if re.search(find_name, line):
-                        words = line.split()
-                        benchmark_name = words[-1]
-                        benchmark_name = benchmark_name[2:]
+            metrics = run_result['metrics']
+            if "benchmark_name" in metrics:
+                path = metrics.get("path")
+                benchmark_name = metrics["benchmark_name"][2:]
 
-                if(not path.endswith('.txt')):
+                if path is None or not path.endswith('.txt'):
                     print("Error: Extract path fails")
                     return Result(cycle=cycles, time=run_result['time'])
-                if(benchmark_name is None):
+                if not benchmark_name:
                     print("Error: Extract benchmark name fails")
                     return Result(cycle=cycles, time=run_result['time'])
 
-                with open(path, "r") as result_file:
-                    result = result_file.readlines()
-                    for txt_line in result:
-                        if re.search(benchmark_name, txt_line):
-                            cycles = txt_line.split()[2]
-                            if (cycles != '(base)'):
-                                return Result(cycle=cycles, time=cycles)
-
-                print("Error: finding benchmark name in the txt file fails")
+                # The first line of the benchmark whose third column is not
+                # "(base)" holds the result.
+                score = MetricExtractor(
+                    "cycles", r"^(?=.*{})\s*\S+\s+\S+\s+(?!\(base\))(\S+)"
+                    .format(re.escape(benchmark_name)), _cycles)
+                found = self.scan_file(path, [score])
+                if found is None:
+                    print("Error: result file {} not found".format(path))
+                elif "cycles" not in found:
+                    print("Error: finding benchmark name in the txt file "
+                          "fails")
+                elif not math.isfinite(found["cycles"]):
+                    print("Error: no result for the benchmark in the txt "
+                          "file")
+                else:
+                    cycles = found["cycles"]
+                    return Result(cycle=cycles, time=cycles)
                 return Result(cycle=cycles, time=run_result['time'])
             else:
                 print("Not success")
@@ -67,7 +87,7 @@ class Tuner(CustomTunerBase):
                 fd = create_secure_fd("errors_log/errors_" +
                           str(desired_result.configuration.id) + ".log")
                 with os.fdopen(fd, 'w') as error_log_file:
-                    error_log_file.write(std)
+                    error_log_file.write(run_result['stdout'])
                 print('custom errors detected')
         else:
             print("Returncode non-zero")
@@ -69,6 +69,7 @@ setup(
         'configparser>=3.5.0',
         'defusedxml',
         'dill',
+        'numpy',
         'pyyaml>=5.4.1',
         'requests>=2.18.4',
         'importlib-metadata; python_version < "3.8.0"',